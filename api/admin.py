@@ -1,6 +1,6 @@
 from django.contrib import admin
 from django.contrib.auth.admin import UserAdmin
-from .models import CustomUser, Category, Products, Order, OrderItem, Payment, Review, ChefsData, Ads, UserFavorites, Cart, CartItem
+from .models import CustomUser, Category, Products, Order, OrderItem, Payment, Review, ChefsData, Ads, UserFavorites, Cart, CartItem, SalesRollup, StockReservation
 
 class CustomUserAdmin(UserAdmin):
     list_display = ('username', 'email', 'phone_number', 'is_staff')
@@ -11,12 +11,51 @@ class CustomUserAdmin(UserAdmin):
 admin.site.register(CustomUser, CustomUserAdmin)
 admin.site.register(Category)
 admin.site.register(Products)
-admin.site.register(Order)
-admin.site.register(OrderItem)
-admin.site.register(Payment)
+class OrderItemInline(admin.TabularInline):
+    model = OrderItem
+    raw_id_fields = ('product',)
+    extra = 0
+
+    def get_queryset(self, request):
+        return super().get_queryset(request).select_related('product')
+
+class OrderAdmin(admin.ModelAdmin):
+    list_display = ('id', 'user', 'status', 'total', 'order_date')
+    list_filter = ('status',)
+    # __str__ and the user column read order.user: join it, not one query per row.
+    list_select_related = ('user',)
+    raw_id_fields = ('user',)
+    inlines = [OrderItemInline]
+
+class OrderItemAdmin(admin.ModelAdmin):
+    list_display = ('id', 'order_id', 'product', 'quantity', 'price')
+    list_select_related = ('product',)
+    raw_id_fields = ('order', 'product')
+
+class PaymentAdmin(admin.ModelAdmin):
+    list_display = ('id', 'order_id', 'payment_method', 'payment_status', 'amount', 'payment_date')
+    list_filter = ('payment_status',)
+    raw_id_fields = ('order',)
+
+admin.site.register(Order, OrderAdmin)
+admin.site.register(OrderItem, OrderItemAdmin)
+admin.site.register(Payment, PaymentAdmin)
 admin.site.register(Review)
 admin.site.register(ChefsData)
 admin.site.register(Ads)
 admin.site.register(UserFavorites)
 admin.site.register(Cart)
 admin.site.register(CartItem)
+
+class SalesRollupAdmin(admin.ModelAdmin):
+    list_display = ('period', 'dimension', 'key', 'bucket', 'orders', 'units', 'revenue')
+    list_filter = ('period', 'dimension')
+
+admin.site.register(SalesRollup, SalesRollupAdmin)
+
+class StockReservationAdmin(admin.ModelAdmin):
+    list_display = ('product', 'cart', 'quantity', 'expires_at')
+    list_select_related = ('product',)
+    raw_id_fields = ('cart', 'product')
+
+admin.site.register(StockReservation, StockReservationAdmin)
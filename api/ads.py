@@ -0,0 +1,16 @@
+from django.db.models import Min, Q
+
+from .models import Ads
+
+
+def next_ads_schedule_change(now):
+    """
+    The earliest moment after ``now`` at which the set of running ads changes
+    on its own: the next start or end date of an active ad, or None.
+    """
+    boundaries = Ads.objects.filter(is_active=True).aggregate(
+        next_start=Min('start_date', filter=Q(start_date__gt=now)),
+        next_end=Min('end_date', filter=Q(end_date__gt=now)),
+    )
+    upcoming = [moment for moment in boundaries.values() if moment is not None]
+    return min(upcoming, default=None)
@@ -0,0 +1,146 @@
+"""
+Async versions of the hottest read endpoints, mounted under ``/api/async/``.
+
+Served by an ASGI server (e.g. ``uvicorn backend.asgi:application``) they
+await the database through the async ORM instead of holding a worker thread
+for the length of every query. Output matches the DRF views, with two
+differences: lists page with ``limit``/``offset`` and return only
+``next``/``previous`` links (no ``count`` query), and responses are built
+fresh rather than read from the catalog cache.
+"""
+from functools import wraps
+
+from asgiref.sync import sync_to_async
+from django.contrib.auth.models import AnonymousUser
+from django.http import JsonResponse
+from rest_framework import serializers
+from rest_framework.exceptions import AuthenticationFailed
+from rest_framework.request import Request
+from rest_framework.settings import api_settings
+from rest_framework.utils.encoders import JSONEncoder
+from rest_framework.utils.urls import remove_query_param, replace_query_param
+
+from .authentication import StatelessJWTAuthentication, get_full_user
+from .favorites import aget_favorite_product_ids
+from .models import Category, Products, UserFavorites
+from .serializers import (
+    CategorySerializer, ProductsSerializer, UserFavoritesSerializer, UserSerializer, requested_expansions,
+)
+from .views import expand_queryset, filter_products, product_ordering
+
+MAX_PAGE_SIZE = 100
+
+jwt_authentication = StatelessJWTAuthentication()
+
+
+def json_response(data, status=200):
+    return JsonResponse(data, status=status, encoder=JSONEncoder, safe=False)
+
+
+def authenticate(request):
+    """The ``TokenUser`` for the bearer token; needs no user query."""
+    authenticated = jwt_authentication.authenticate(request)
+    return authenticated[0] if authenticated else AnonymousUser()
+
+
+def async_api_view(login_required=False):
+    """
+    Wrap an async GET view: authenticate, hand it a DRF ``Request`` (so
+    serializers see ``query_params``) and map API errors to JSON responses.
+    """
+    def decorator(view):
+        @wraps(view)
+        async def wrapper(request, *args, **kwargs):
+            if request.method not in ('GET', 'HEAD'):
+                return json_response({'detail': f'Method "{request.method}" not allowed.'}, status=405)
+            try:
+                # The denylist may live in the database cache.
+                user = await sync_to_async(authenticate)(request)
+            except AuthenticationFailed as exc:
+                detail = exc.detail if isinstance(exc.detail, dict) else {'detail': exc.detail}
+                return json_response(detail, status=401)
+            if login_required and not user.is_authenticated:
+                return json_response({'detail': 'Authentication credentials were not provided.'}, status=401)
+            drf_request = Request(request)
+            drf_request.user = user
+            try:
+                return await view(drf_request, *args, **kwargs)
+            except serializers.ValidationError as exc:
+                return json_response(exc.detail, status=400)
+            except (Products.DoesNotExist, Category.DoesNotExist):
+                return json_response({'detail': 'No such object.'}, status=404)
+        return wrapper
+    return decorator
+
+
+def page_bounds(request):
+    try:
+        limit = min(max(int(request.query_params.get('limit', api_settings.PAGE_SIZE)), 1), MAX_PAGE_SIZE)
+    except ValueError:
+        limit = api_settings.PAGE_SIZE
+    try:
+        offset = max(int(request.query_params.get('offset', 0)), 0)
+    except ValueError:
+        offset = 0
+    return limit, offset
+
+
+async def paginate(request, queryset):
+    """Fetch one page (plus one row to detect a next page) with a single query."""
+    limit, offset = page_bounds(request)
+    rows = [row async for row in queryset[offset:offset + limit + 1]]
+    url = request.build_absolute_uri()
+    next_url = replace_query_param(url, 'offset', offset + limit) if len(rows) > limit else None
+    previous_url = None
+    if offset > limit:
+        previous_url = replace_query_param(url, 'offset', offset - limit)
+    elif offset > 0:
+        previous_url = remove_query_param(url, 'offset')
+    return rows[:limit], {'next': next_url, 'previous': previous_url}
+
+
+async def product_context(request, product_ids):
+    favorite_ids = frozenset()
+    if request.user.is_authenticated and product_ids:
+        favorite_ids = await aget_favorite_product_ids(request.user.id, product_ids)
+    return {'request': request, 'favorite_ids': favorite_ids}
+
+
+@async_api_view()
+async def product_list(request):
+    queryset = filter_products(Products.objects.select_related('category', 'chefs'), request.query_params)
+    products, links = await paginate(request, queryset.order_by(*product_ordering(request.query_params)))
+    context = await product_context(request, [product.id for product in products])
+    serializer = ProductsSerializer(products, many=True, context=context)
+    return json_response({**links, 'results': serializer.data})
+
+
+@async_api_view()
+async def product_detail(request, pk):
+    product = await Products.objects.select_related('category', 'chefs').aget(pk=pk)
+    return json_response(ProductsSerializer(product, context=await product_context(request, [product.id])).data)
+
+
+@async_api_view()
+async def category_list(request):
+    categories, links = await paginate(request, Category.objects.order_by('id'))
+    serializer = CategorySerializer(categories, many=True, context={'request': request})
+    return json_response({**links, 'results': serializer.data})
+
+
+@async_api_view(login_required=True)
+async def current_user(request):
+    user = await sync_to_async(get_full_user)(request.user)
+    return json_response(UserSerializer(user).data)
+
+
+@async_api_view(login_required=True)
+async def my_favorites(request):
+    queryset = expand_queryset(UserFavorites.objects.filter(user_id=request.user.id), request)
+    favorites, links = await paginate(request, queryset.order_by('-added_at', '-id'))
+    context = {'request': request}
+    if 'product' in requested_expansions(request):
+        # Expanded products flag favorites; load them here, not synchronously.
+        context = await product_context(request, [favorite.product_id for favorite in favorites])
+    serializer = UserFavoritesSerializer(favorites, many=True, context=context)
+    return json_response({**links, 'results': serializer.data})
@@ -0,0 +1,115 @@
+"""
+Stateless JWT authentication.
+
+``request.user`` is a ``TokenUser`` built from the token's claims (id,
+username, is_staff), so authenticating costs no database query. Tokens can
+still be revoked: a denylist in the Django cache holds single token ids
+until they would have expired anyway, plus a per-user token version:
+tokens carry the version current when they were issued, and revoking all of
+a user's tokens moves it on. ``CACHES['default']`` must be shared by every
+worker (see settings) for revocation to reach all of them.
+
+Views that need the real ``CustomUser`` call ``get_full_user``, a short-TTL
+in-process cache that is dropped when the user is saved.
+"""
+import copy
+import threading
+import time
+
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from rest_framework_simplejwt.authentication import JWTStatelessUserAuthentication
+from rest_framework_simplejwt.exceptions import InvalidToken
+from rest_framework_simplejwt.settings import api_settings as jwt_settings
+
+DENYLIST_PREFIX = 'jwt:denylist'
+TOKEN_VERSION_CLAIM = 'token_version'
+FULL_USER_CACHE_TIMEOUT = 30
+
+
+def token_denylist_key(jti):
+    return f'{DENYLIST_PREFIX}:jti:{jti}'
+
+
+def user_denylist_key(user_id):
+    return f'{DENYLIST_PREFIX}:user:{user_id}'
+
+
+def revoke_token(token):
+    """Deny one access or refresh token for the rest of its lifetime."""
+    remaining = token['exp'] - int(time.time())
+    if remaining > 0:
+        cache.set(token_denylist_key(token[jwt_settings.JTI_CLAIM]), True, remaining)
+
+
+def user_token_version(user_id):
+    """The version new tokens of the user carry, or None if none was ever revoked."""
+    return cache.get(user_denylist_key(user_id))
+
+
+def revoke_user_tokens(user_id):
+    """
+    Deny every token issued to the user up to now, including access tokens
+    later minted from an older refresh token (they copy its claims). Tokens
+    issued afterwards, even within the same second, carry the new version.
+    """
+    lifetime = max(jwt_settings.ACCESS_TOKEN_LIFETIME, jwt_settings.REFRESH_TOKEN_LIFETIME)
+    # Never reused, so a version that expired from the cache cannot return.
+    cache.set(user_denylist_key(user_id), time.time_ns(), int(lifetime.total_seconds()))
+
+
+def is_revoked(token):
+    token_key = token_denylist_key(token.get(jwt_settings.JTI_CLAIM))
+    user_key = user_denylist_key(token.get(jwt_settings.USER_ID_CLAIM))
+    denied = cache.get_many([token_key, user_key])
+    if token_key in denied:
+        return True
+    version = denied.get(user_key)
+    return version is not None and token.get(TOKEN_VERSION_CLAIM) != version
+
+
+class StatelessJWTAuthentication(JWTStatelessUserAuthentication):
+    def get_validated_token(self, raw_token):
+        token = super().get_validated_token(raw_token)
+        if is_revoked(token):
+            raise InvalidToken({'detail': 'Token has been revoked.', 'code': 'token_revoked'})
+        return token
+
+
+class FullUserCache:
+    """Per-process ``{user_id: CustomUser}`` with a short TTL."""
+
+    def __init__(self, timeout=FULL_USER_CACHE_TIMEOUT):
+        self.timeout = timeout
+        self._entries = {}
+        self._lock = threading.Lock()
+
+    def get(self, user_id):
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(user_id)
+        if entry is None or entry[0] <= now:
+            user = get_user_model().objects.get(pk=user_id)
+            entry = (now + self.timeout, user)
+            with self._lock:
+                self._entries[user_id] = entry
+        # Callers may modify and save their copy without affecting others.
+        return copy.copy(entry[1])
+
+    def invalidate(self, user_id):
+        with self._lock:
+            self._entries.pop(user_id, None)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+
+full_user_cache = FullUserCache()
+
+
+def get_full_user(user):
+    """The ``CustomUser`` behind ``request.user`` (a model instance is returned as is)."""
+    if isinstance(user, get_user_model()):
+        return user
+    return full_user_cache.get(user.id)
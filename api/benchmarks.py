@@ -0,0 +1,257 @@
+"""
+API benchmark scenarios run through the Django test client.
+
+Each scenario drives real endpoints over data from ``api.seed``. Its
+function sets up one iteration (untimed) and returns the request to time,
+exactly one HTTP call whose latency and query count are recorded. Runs with
+the same scale and seed issue the same requests, so reports can be compared.
+"""
+import random
+import statistics
+import threading
+import time
+
+from django.contrib.auth import get_user_model
+from django.db import OperationalError, close_old_connections, connection
+from django.test import Client
+from django.test.utils import CaptureQueriesContext
+
+from .cache import get_catalog_cache
+from .models import Cart, CartItem, Category, Products
+from .seed import SEED_PASSWORD, WORDS
+from .serializers import ClaimsTokenObtainPairSerializer
+
+User = get_user_model()
+
+
+def percentile(sorted_values, fraction):
+    if not sorted_values:
+        return None
+    index = min(int(round(fraction * (len(sorted_values) - 1))), len(sorted_values) - 1)
+    return sorted_values[index]
+
+
+class Context:
+    """Ids and authenticated clients shared by the scenarios of one run."""
+
+    def __init__(self, rng, users=20, offset=0):
+        self.rng = rng
+        self.category_ids = list(Category.objects.values_list('id', flat=True))
+        self.product_ids = list(Products.objects.values_list('id', flat=True))
+        # Plenty of stock, so repeated checkouts do not run out.
+        self.stocked_ids = list(
+            Products.objects.filter(is_available=True, quantity__gte=100).values_list('id', flat=True)
+        ) or self.product_ids
+        carts = dict(Cart.objects.values_list('user_id', 'id'))
+        self.shoppers = []
+        for user in User.objects.filter(username__startswith='seed-user-').order_by('id')[offset:offset + users]:
+            if user.id not in carts:
+                carts[user.id] = Cart.objects.create(user=user).id
+            refresh = ClaimsTokenObtainPairSerializer.get_token(user)
+            client = Client(HTTP_AUTHORIZATION=f'Bearer {refresh.access_token}')
+            self.shoppers.append({'user': user, 'client': client, 'cart': carts[user.id], 'refresh': str(refresh)})
+        self.anonymous = Client()
+
+    def shopper(self):
+        return self.rng.choice(self.shoppers)
+
+
+def browse(ctx):
+    params = {'ordering': ctx.rng.choice(('price', '-price', '-rating'))}
+    if ctx.category_ids and ctx.rng.random() < 0.7:
+        params['category'] = ctx.rng.choice(ctx.category_ids)
+    return lambda: ctx.anonymous.get('/api/products/', params)
+
+
+def product_detail(ctx):
+    product_id = ctx.rng.choice(ctx.product_ids)
+    return lambda: ctx.shopper()['client'].get(f'/api/products/{product_id}/')
+
+
+def search(ctx):
+    term = ' '.join(ctx.rng.sample(WORDS, 2))
+    return lambda: ctx.anonymous.get('/api/products/', {'search': term})
+
+
+def favorite_toggle(ctx):
+    client, product_id = ctx.shopper()['client'], ctx.rng.choice(ctx.product_ids)
+    return lambda: client.post(f'/api/favorites/toggle/{product_id}/')
+
+
+def add_to_cart(ctx):
+    shopper, product_id = ctx.shopper(), ctx.rng.choice(ctx.stocked_ids)
+    return lambda: shopper['client'].post(
+        f"/api/carts/{shopper['cart']}/add_item/", {'product': product_id, 'quantity': 1},
+        content_type='application/json',
+    )
+
+
+def checkout(ctx):
+    shopper = ctx.shopper()
+    # Seeded carts may hold unavailable products; start from known lines.
+    CartItem.objects.filter(cart_id=shopper['cart']).delete()
+    CartItem.objects.bulk_create(
+        CartItem(cart_id=shopper['cart'], product_id=product_id, quantity=1)
+        for product_id in ctx.rng.sample(ctx.stocked_ids, 3)
+    )
+    return lambda: shopper['client'].post(
+        f"/api/carts/{shopper['cart']}/checkout/", {'payment_method': 'card'}, content_type='application/json',
+    )
+
+
+def token_obtain(ctx):
+    username = ctx.shopper()['user'].username
+    return lambda: ctx.anonymous.post('/api/token/', {'username': username, 'password': SEED_PASSWORD})
+
+
+def token_refresh(ctx):
+    refresh = ctx.shopper()['refresh']
+    return lambda: ctx.anonymous.post('/api/token/refresh/', {'refresh': refresh})
+
+
+# Name -> (prepare, expected status). ``prepare`` returns the timed request.
+SCENARIOS = {
+    'browse': (browse, 200),
+    'product_detail': (product_detail, 200),
+    'search': (search, 200),
+    'favorite_toggle': (favorite_toggle, (200, 201)),
+    'add_to_cart': (add_to_cart, 200),
+    'checkout': (checkout, 201),
+    'token_obtain': (token_obtain, 200),
+    'token_refresh': (token_refresh, 200),
+}
+
+
+def summarize(latencies, query_counts, errors, elapsed=None):
+    """Latency and query statistics; throughput is over ``elapsed`` seconds if given."""
+    latencies = sorted(latencies)
+    total = elapsed or sum(latencies)
+
+    def ms(value):
+        return round(value * 1000, 3) if value is not None else None
+
+    return {
+        'requests': len(latencies),
+        'errors': errors,
+        'throughput_rps': round(len(latencies) / total, 1) if total else None,
+        'mean_ms': ms(statistics.fmean(latencies)) if latencies else None,
+        'p50_ms': ms(percentile(latencies, 0.50)),
+        'p90_ms': ms(percentile(latencies, 0.90)),
+        'p99_ms': ms(percentile(latencies, 0.99)),
+        'max_ms': ms(latencies[-1] if latencies else None),
+        'mean_queries': round(statistics.fmean(query_counts), 2) if query_counts else None,
+        'max_queries': max(query_counts, default=None),
+    }
+
+
+def run_scenario(ctx, name, iterations, cold_cache=False):
+    prepare, expected = SCENARIOS[name]
+    expected = expected if isinstance(expected, tuple) else (expected,)
+    latencies, query_counts, errors = [], [], 0
+    for _ in range(iterations):
+        request = prepare(ctx)
+        if cold_cache:
+            get_catalog_cache().clear()
+        with CaptureQueriesContext(connection) as queries:
+            started = time.perf_counter()
+            response = request()
+            latencies.append(time.perf_counter() - started)
+        query_counts.append(len(queries))
+        errors += response.status_code not in expected
+    return summarize(latencies, query_counts, errors)
+
+
+def run_benchmarks(names=None, iterations=200, random_seed=0, cold_cache=False):
+    """Run the named scenarios (all by default) against the current database."""
+    ctx = Context(random.Random(random_seed))
+    return {
+        name: run_scenario(ctx, name, iterations, cold_cache=cold_cache)
+        for name in (names or SCENARIOS)
+    }
+
+
+# Read-heavy storefront traffic with a steady share of cart and order writes.
+DEFAULT_MIX = {
+    'browse': 40,
+    'product_detail': 20,
+    'search': 10,
+    'favorite_toggle': 10,
+    'add_to_cart': 15,
+    'checkout': 5,
+}
+
+
+def run_mixed(mix=None, threads=8, duration=10.0, users_per_thread=5, random_seed=0):
+    """
+    Run scenarios picked at random by weight from ``threads`` threads at
+    once for ``duration`` seconds. Threads use disjoint users, so failures
+    come from contention, not from two threads emptying the same cart.
+
+    The test client keeps connections open across requests; here they are
+    closed or kept after every request as ``CONN_MAX_AGE`` says, as a real
+    server would. Lock errors that escape the retries are counted apart.
+    """
+    mix = mix or DEFAULT_MIX
+    names, weights = list(mix), list(mix.values())
+    contexts = [
+        Context(random.Random(random_seed + i), users=users_per_thread, offset=i * users_per_thread)
+        for i in range(threads)
+    ]
+    samples = {name: {'latencies': [], 'queries': [], 'errors': 0} for name in names}
+    lock_errors = [0]
+    lock = threading.Lock()
+    barrier = threading.Barrier(threads)
+
+    def worker(ctx):
+        local = {name: {'latencies': [], 'queries': [], 'errors': 0} for name in names}
+        local_lock_errors = 0
+        barrier.wait()
+        stop_at = time.perf_counter() + duration
+        try:
+            while time.perf_counter() < stop_at:
+                name = ctx.rng.choices(names, weights)[0]
+                prepare, expected = SCENARIOS[name]
+                expected = expected if isinstance(expected, tuple) else (expected,)
+                sample = local[name]
+                try:
+                    request = prepare(ctx)
+                    with CaptureQueriesContext(connection) as queries:
+                        started = time.perf_counter()
+                        response = request()
+                        sample['latencies'].append(time.perf_counter() - started)
+                    sample['queries'].append(len(queries))
+                    sample['errors'] += response.status_code not in expected
+                except OperationalError:
+                    local_lock_errors += 1
+                    sample['errors'] += 1
+                finally:
+                    close_old_connections()
+        finally:
+            connection.close()
+            with lock:
+                lock_errors[0] += local_lock_errors
+                for name, sample in local.items():
+                    samples[name]['latencies'] += sample['latencies']
+                    samples[name]['queries'] += sample['queries']
+                    samples[name]['errors'] += sample['errors']
+
+    workers = [threading.Thread(target=worker, args=(ctx,)) for ctx in contexts]
+    for thread in workers:
+        thread.start()
+    for thread in workers:
+        thread.join()
+
+    scenarios = {
+        name: summarize(sample['latencies'], sample['queries'], sample['errors'], elapsed=duration)
+        for name, sample in samples.items()
+    }
+    requests = sum(result['requests'] for result in scenarios.values())
+    return {
+        'threads': threads,
+        'seconds': duration,
+        'requests': requests,
+        'throughput_rps': round(requests / duration, 1),
+        'errors': sum(result['errors'] for result in scenarios.values()),
+        'lock_errors': lock_errors[0],
+        'scenarios': scenarios,
+    }
@@ -0,0 +1,305 @@
+import hashlib
+import json
+import threading
+import time
+from collections import OrderedDict
+
+from django.conf import settings
+from django.core.cache import caches
+from django.core.signals import setting_changed
+from django.dispatch import receiver
+from django.utils.cache import get_conditional_response, patch_cache_control, patch_vary_headers
+from django.utils.http import http_date
+from django.utils.module_loading import import_string
+from rest_framework.response import Response
+from rest_framework.utils.encoders import JSONEncoder
+
+DEFAULT_CATALOG_CACHE = {
+    'BACKEND': 'api.cache.LRUBackend',
+    'OPTIONS': {'max_entries': 1024},
+}
+
+# Catalog model label -> cache namespace bumped when one of its rows changes.
+CATALOG_NAMESPACES = {
+    'api.Products': 'products',
+    'api.Category': 'categories',
+    'api.ChefsData': 'chefs',
+    'api.Ads': 'ads',
+}
+
+
+class LRUBackend:
+    """
+    In-process, size-bounded store that evicts the least recently used entry.
+    Entries expire after ``timeout`` seconds by default, so one that missed a
+    version bump (e.g. the shared cache was flushed) is not served for long.
+    """
+
+    def __init__(self, max_entries=1024, timeout=60):
+        self.max_entries = max_entries
+        self.timeout = timeout
+        self.evictions = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            item = self._entries.get(key)
+            if item is None:
+                return None
+            expires_at, value = item
+            if expires_at is not None and expires_at <= time.monotonic():
+                del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+            return value
+
+    def set(self, key, value, timeout=None):
+        timeout = timeout if timeout is not None else self.timeout
+        expires_at = time.monotonic() + timeout if timeout is not None else None
+        with self._lock:
+            self._entries[key] = (expires_at, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def __len__(self):
+        return len(self._entries)
+
+
+class DjangoCacheBackend:
+    """Store entries in one of the ``CACHES`` aliases (e.g. a local-memory cache)."""
+
+    evictions = None
+
+    def __init__(self, alias='default', timeout=300, key_prefix='catalog'):
+        self.cache = caches[alias]
+        self.timeout = timeout
+        self.key_prefix = key_prefix
+
+    def get(self, key):
+        return self.cache.get(f'{self.key_prefix}:{key}')
+
+    def set(self, key, value, timeout=None):
+        self.cache.set(f'{self.key_prefix}:{key}', value, timeout if timeout is not None else self.timeout)
+
+    def clear(self):
+        # The alias is shared with other data, so entries are not deleted
+        # here; CatalogCache.clear bumps every namespace instead.
+        pass
+
+    def __len__(self):
+        return 0
+
+
+class CatalogCache:
+    """
+    Read-through cache for serialized catalog responses.
+
+    Every entry key embeds the current version of the namespaces it was built
+    from. Saving or deleting a catalog model bumps its namespace version (see
+    ``api.signals``), which makes the old entries unreachable; they age out
+    of the backend on their own. Versions live in ``CACHES['default']``,
+    shared by every worker, so a bump reaches all of them. A bump stores a
+    fresh value from the clock instead of incrementing the old one, so two
+    concurrent bumps cannot settle on the same version on any backend.
+
+    Each worker keeps the versions it read for ``versions_timeout`` seconds,
+    so warm reads make no round trip to the shared cache (a query with the
+    database cache); another worker's bump reaches it within that time.
+    """
+
+    def __init__(self, backend, versions_alias='default', versions_timeout=1):
+        self.backend = backend
+        self.versions_alias = versions_alias
+        self.versions_timeout = versions_timeout
+        self._local_versions = {}
+        self.hits = 0
+        self.misses = 0
+        self.not_modified = 0
+        self._lock = threading.Lock()
+
+    @property
+    def versions(self):
+        return caches[self.versions_alias]
+
+    @staticmethod
+    def version_key(namespace):
+        return f'catalog:version:{namespace}'
+
+    def get_versions(self, namespaces):
+        """
+        ``[(version, modified timestamp)]`` of ``namespaces``: the local copies
+        that are still fresh, the rest with one round trip to the shared cache.
+        """
+        now = time.monotonic()
+        versions = {}
+        for namespace in namespaces:
+            local = self._local_versions.get(namespace)
+            if local is not None and local[0] > now:
+                versions[namespace] = local[1]
+        missing = [namespace for namespace in namespaces if namespace not in versions]
+        if missing:
+            stored = self.versions.get_many([self.version_key(namespace) for namespace in missing])
+            for namespace in missing:
+                version = stored.get(self.version_key(namespace))
+                if version is None:
+                    version = self.bump(namespace)
+                else:
+                    self._local_versions[namespace] = (now + self.versions_timeout, version)
+                versions[namespace] = version
+        return [versions[namespace] for namespace in namespaces]
+
+    def bump(self, namespace):
+        # Stored as one value, so the version and its timestamp never disagree.
+        versions = (time.time_ns(), int(time.time()))
+        self.versions.set(self.version_key(namespace), versions, None)
+        self._local_versions[namespace] = (time.monotonic() + self.versions_timeout, versions)
+        return versions
+
+    def make_key(self, namespaces, identifier):
+        """Return the entry key for ``identifier`` and its Last-Modified timestamp."""
+        versions = self.get_versions(namespaces)
+        tokens = '.'.join(str(version) for version, _ in versions)
+        last_modified = max((modified for _, modified in versions), default=None)
+        return f'{tokens}:{identifier}', last_modified
+
+    def get(self, key):
+        value = self.backend.get(key)
+        with self._lock:
+            if value is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+        return value
+
+    def set(self, key, value, timeout=None):
+        self.backend.set(key, value, timeout)
+
+    def clear(self):
+        """Drop every entry: the local ones directly, shared ones by a version bump."""
+        self.backend.clear()
+        for namespace in CATALOG_NAMESPACES.values():
+            self.bump(namespace)
+
+    def record_not_modified(self):
+        with self._lock:
+            self.not_modified += 1
+
+    def stats(self):
+        lookups = self.hits + self.misses
+        return {
+            'backend': type(self.backend).__name__,
+            'entries': len(self.backend),
+            'hits': self.hits,
+            'misses': self.misses,
+            'hit_rate': self.hits / lookups if lookups else 0.0,
+            'evictions': self.backend.evictions,
+            'not_modified': self.not_modified,
+        }
+
+
+_catalog_cache = None
+
+
+def get_catalog_cache():
+    global _catalog_cache
+    if _catalog_cache is None:
+        config = getattr(settings, 'CATALOG_CACHE', DEFAULT_CATALOG_CACHE)
+        backend_class = import_string(config['BACKEND'])
+        _catalog_cache = CatalogCache(
+            backend_class(**config.get('OPTIONS', {})), versions_timeout=config.get('VERSIONS_TIMEOUT', 1),
+        )
+    return _catalog_cache
+
+
+@receiver(setting_changed)
+def reset_catalog_cache(setting, **kwargs):
+    global _catalog_cache
+    if setting in ('CATALOG_CACHE', 'CACHES'):
+        _catalog_cache = None
+
+
+def bump_catalog_version(*namespaces):
+    cache = get_catalog_cache()
+    for namespace in namespaces:
+        cache.bump(namespace)
+
+
+class CacheEntry:
+    __slots__ = ('data', 'etag')
+
+    def __init__(self, data):
+        # Plain JSON types only: the entry is shared between requests and must
+        # not keep the serializer that produced it alive.
+        payload = json.dumps(data, cls=JSONEncoder, sort_keys=True)
+        self.data = json.loads(payload)
+        self.etag = hashlib.md5(payload.encode()).hexdigest()
+
+
+class CachedCatalogMixin:
+    """
+    Serve ``list``/``retrieve`` from the catalog cache with ETag and
+    Last-Modified validators, answering matching conditional GETs with 304.
+
+    ``cache_namespaces`` lists the catalog namespaces the serialized output
+    depends on. Views whose output varies per user build the shared entry
+    anonymously and override ``personalize_cached_data``. Output that goes
+    stale with time sets ``self.cache_timeout`` (seconds) while building and
+    passes ``time_dependent=True``: it changes without a version bump, so it
+    is served without Last-Modified.
+    """
+    cache_namespaces = ()
+
+    def list(self, request, *args, **kwargs):
+        return self.cached_response(request, super().list, *args, **kwargs)
+
+    def retrieve(self, request, *args, **kwargs):
+        return self.cached_response(request, super().retrieve, *args, **kwargs)
+
+    def cached_response(self, request, build_response, *args, time_dependent=False, **kwargs):
+        catalog_cache = get_catalog_cache()
+        key, last_modified = catalog_cache.make_key(
+            self.cache_namespaces, request.build_absolute_uri()
+        )
+        entry = catalog_cache.get(key)
+        if entry is None:
+            self.building_shared_cache_entry = True
+            try:
+                response = build_response(request, *args, **kwargs)
+            finally:
+                self.building_shared_cache_entry = False
+            if response.status_code != 200:
+                return response
+            entry = CacheEntry(response.data)
+            catalog_cache.set(key, entry, getattr(self, 'cache_timeout', None))
+
+        data, etag_suffix = self.personalize_cached_data(request, entry.data)
+        etag = f'"{entry.etag}{etag_suffix}"'
+        response = Response(data, headers={'ETag': etag})
+        if etag_suffix or time_dependent:
+            # Per-user and time-dependent data can change without a catalog
+            # write, so only the ETag is a safe validator for them.
+            last_modified = None
+        else:
+            response.headers['Last-Modified'] = http_date(last_modified)
+        patch_cache_control(response, no_cache=True)
+        patch_vary_headers(response, ['Authorization'])
+        conditional = get_conditional_response(
+            request, etag=etag, last_modified=last_modified, response=response
+        )
+        if conditional is not response:
+            catalog_cache.record_not_modified()
+        return conditional
+
+    def personalize_cached_data(self, request, data):
+        """
+        Return ``(data, etag_suffix)`` for this request from the shared entry.
+        A non-empty suffix marks the response as personalized.
+        """
+        return data, ''
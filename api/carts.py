@@ -0,0 +1,74 @@
+from django.db import transaction
+from django.db.models import F, Min, Prefetch, Q
+from django.db.models.functions import Now
+from django.utils import timezone
+from rest_framework import serializers
+
+from .db import retry_on_lock
+from .models import Cart, CartItem, Products
+from .orders import merge_lines, quantity_case
+from .reservations import reserve_for_cart
+
+
+def check_products_exist(product_ids):
+    found = set(Products.objects.filter(pk__in=product_ids).values_list('id', flat=True))
+    missing = [product_id for product_id in product_ids if product_id not in found]
+    if missing:
+        raise serializers.ValidationError(
+            {'items': {str(product_id): 'Product not found.' for product_id in missing}}
+        )
+
+
+@retry_on_lock
+def update_cart_lines(cart, lines, mode='merge'):
+    """
+    Apply ``(product_id, quantity)`` pairs to ``cart`` with a fixed number of
+    queries.
+
+    ``merge`` adds each quantity to the line (creating it if needed); ``set``
+    overwrites the line's quantity, and a quantity of 0 removes the line.
+    Increments are ``F()`` expressions evaluated by the database, so
+    concurrent requests cannot lose each other's updates. The new quantities
+    are reserved for the cart (see api.reservations); if any cannot be, the
+    ValidationError rolls the whole change back.
+    """
+    quantities = merge_lines(lines) if mode == 'merge' else dict(lines)
+    with transaction.atomic():
+        Cart.objects.filter(pk=cart.pk).update(updated_at=timezone.now())
+        check_products_exist(list(quantities))
+
+        if mode == 'merge':
+            quantities = {pk: qty for pk, qty in quantities.items() if qty > 0}
+            if quantities:
+                CartItem.objects.bulk_create(
+                    [CartItem(cart=cart, product_id=pk, quantity=0) for pk in quantities],
+                    ignore_conflicts=True,
+                )
+                CartItem.objects.filter(cart=cart, product_id__in=quantities).update(
+                    quantity=F('quantity') + quantity_case(quantities, field='product_id')
+                )
+                reserve_for_cart(cart.pk, dict(
+                    CartItem.objects.filter(cart=cart, product_id__in=quantities).values_list('product_id', 'quantity')
+                ))
+            return
+
+        removed = [pk for pk, qty in quantities.items() if qty == 0]
+        if removed:
+            CartItem.objects.filter(cart=cart, product_id__in=removed).delete()
+        kept = [CartItem(cart=cart, product_id=pk, quantity=qty) for pk, qty in quantities.items() if qty > 0]
+        if kept:
+            CartItem.objects.bulk_create(
+                kept,
+                update_conflicts=True,
+                unique_fields=['cart', 'product'],
+                update_fields=['quantity'],
+            )
+        reserve_for_cart(cart.pk, quantities)
+
+
+def carts_with_items():
+    # Lapsed reservations linger until the sweep deletes them; skip them.
+    reserved_until = Min('reservations__expires_at', filter=Q(reservations__expires_at__gt=Now()))
+    return Cart.objects.annotate(reserved_until=reserved_until).prefetch_related(
+        Prefetch('items', queryset=CartItem.objects.select_related('product').order_by('added_at', 'id'))
+    )
@@ -0,0 +1,172 @@
+"""
+Bulk import and export of categories, chefs and products.
+
+Records are keyed on ``name``: a record whose name matches an existing row
+updates the fields it carries, any other record creates a row. Products
+name their ``category`` and ``chef``. Input is read as a stream and handled
+``BATCH_SIZE`` records at a time: each chunk is validated row by row, then
+written in its own short transaction with one ``bulk_create`` and one
+``bulk_update``, so bad rows are reported by line number without stopping
+the import and checkouts are never locked out for long.
+"""
+from collections import defaultdict
+
+from django.db import transaction
+from rest_framework import serializers
+
+from .cache import bump_catalog_version
+from .db import retry_on_lock
+from .models import Category, ChefsData, Products
+from .serializers import CategoryImportSerializer, ChefImportSerializer, ProductImportSerializer
+from .streaming import chunked
+
+BATCH_SIZE = 500
+EXPORT_CHUNK_SIZE = 2000
+MAX_REPORTED_ERRORS = 100
+
+KINDS = {
+    'categories': {
+        'model': Category,
+        'serializer': CategoryImportSerializer,
+        'namespace': 'categories',
+        'required': ('name',),
+        'columns': ('name', 'description'),
+        'references': {},
+    },
+    'chefs': {
+        'model': ChefsData,
+        'serializer': ChefImportSerializer,
+        'namespace': 'chefs',
+        'required': ('name',),
+        'columns': ('name', 'description', 'text'),
+        'references': {},
+    },
+    'products': {
+        'model': Products,
+        'serializer': ProductImportSerializer,
+        'namespace': 'products',
+        'required': ('name', 'price'),
+        'columns': (
+            'name', 'price', 'old_price', 'discount', 'text', 'ingredients', 'allergens', 'description',
+            'quantity', 'is_available', 'category', 'chef',
+        ),
+        # Record field -> (model field, referenced model).
+        'references': {'category': ('category', Category), 'chef': ('chefs', ChefsData)},
+    },
+}
+
+
+def export_rows(kind):
+    """``(columns, rows)`` of every ``kind`` record, read in chunks as they are consumed."""
+    spec = KINDS[kind]
+    lookups = [
+        f'{spec["references"][column][0]}__name' if column in spec['references'] else column
+        for column in spec['columns']
+    ]
+    rows = spec['model'].objects.order_by('id').values_list(*lookups).iterator(chunk_size=EXPORT_CHUNK_SIZE)
+    return spec['columns'], rows
+
+
+def ids_by_name(model, names):
+    found = defaultdict(list)
+    for name, pk in model.objects.filter(name__in=names).values_list('name', 'id'):
+        found[name].append(pk)
+    return found
+
+
+@retry_on_lock
+def write_chunk(spec, records):
+    """
+    Upsert ``{name: (line, data)}`` and return ``(created, updated, errors)``.
+    Names matching several existing rows are reported, not guessed.
+    """
+    model, errors = spec['model'], []
+    with transaction.atomic():
+        existing = defaultdict(list)
+        for instance in model.objects.filter(name__in=records):
+            existing[instance.name].append(instance)
+        references = {
+            field: ids_by_name(related, {data[field] for _, data in records.values() if data.get(field)})
+            for field, (_, related) in spec['references'].items()
+        }
+
+        to_create, to_update, update_fields = [], [], set()
+        for name, (line, data) in records.items():
+            values, row_errors = {}, {}
+            for field, value in data.items():
+                if field not in spec['references']:
+                    values[field] = value
+                    continue
+                model_field = spec['references'][field][0]
+                matches = references[field].get(value, []) if value else [None]
+                if len(matches) == 1:
+                    values[f'{model_field}_id'] = matches[0]
+                else:
+                    row_errors[field] = [f'No {field} named "{value}".' if not matches else
+                                         f'Several {field} rows are named "{value}".']
+            if len(existing[name]) > 1:
+                row_errors['name'] = [f'Several rows are named "{name}".']
+            if not existing[name]:
+                for field in spec['required']:
+                    if data.get(field) is None:
+                        row_errors.setdefault(field, []).append('This field is required.')
+            if row_errors:
+                errors.append({'line': line, 'name': name, 'errors': row_errors})
+            elif existing[name]:
+                instance = existing[name][0]
+                for field, value in values.items():
+                    setattr(instance, field, value)
+                update_fields.update(values)
+                to_update.append(instance)
+            else:
+                to_create.append(model(**values))
+
+        model.objects.bulk_create(to_create, batch_size=BATCH_SIZE)
+        if to_update and update_fields - {'name'}:
+            model.objects.bulk_update(to_update, sorted(update_fields), batch_size=BATCH_SIZE)
+        if to_create or to_update:
+            transaction.on_commit(lambda: bump_catalog_version(spec['namespace']))
+    return len(to_create), len(to_update), errors
+
+
+def import_records(kind, records, batch_size=BATCH_SIZE):
+    """
+    Upsert ``(line_number, record)`` pairs (see ``api.streaming.read_records``)
+    and report the counts plus the first ``MAX_REPORTED_ERRORS`` row errors.
+    """
+    spec = KINDS[kind]
+    serializer = spec['serializer'](partial=True)
+    nullable = {name for name, field in serializer.fields.items() if field.allow_null}
+    report = {'created': 0, 'updated': 0, 'failed': 0, 'errors': []}
+
+    def fail(line, name, detail):
+        report['failed'] += 1
+        if len(report['errors']) < MAX_REPORTED_ERRORS:
+            report['errors'].append({'line': line, 'name': name, 'errors': detail})
+
+    for chunk in chunked(records, batch_size):
+        valid = {}
+        for line, record in chunk:
+            if not isinstance(record, dict):
+                fail(line, None, {'non_field_errors': [record]})
+                continue
+            # Blank CSV cells leave non-nullable fields as they are.
+            record = {key: value for key, value in record.items() if value is not None or key in nullable}
+            try:
+                data = serializer.run_validation(record)
+            except serializers.ValidationError as exc:
+                fail(line, record.get('name'), exc.detail)
+                continue
+            if not data.get('name'):
+                fail(line, None, {'name': ['This field is required.']})
+                continue
+            # A name repeated within a chunk: the last record wins.
+            valid[data['name']] = (line, data)
+        if not valid:
+            continue
+        created, updated, errors = write_chunk(spec, valid)
+        report['created'] += created
+        report['updated'] += updated
+        for error in errors:
+            fail(error['line'], error['name'], error['errors'])
+    return report
@@ -0,0 +1,26 @@
+from channels.generic.websocket import AsyncJsonWebsocketConsumer
+
+from .realtime import user_group
+
+# Close code for a handshake without a valid access token.
+UNAUTHORIZED = 4401
+
+
+class OrderStatusConsumer(AsyncJsonWebsocketConsumer):
+    """Stream the connected user's order and payment status changes as JSON."""
+
+    async def connect(self):
+        user = self.scope['user']
+        if not user.is_authenticated:
+            await self.close(code=UNAUTHORIZED)
+            return
+        self.group_name = user_group(user.id)
+        await self.channel_layer.group_add(self.group_name, self.channel_name)
+        await self.accept()
+
+    async def disconnect(self, code):
+        if hasattr(self, 'group_name'):
+            await self.channel_layer.group_discard(self.group_name, self.channel_name)
+
+    async def status_changed(self, event):
+        await self.send_json(event['payload'])
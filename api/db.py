@@ -0,0 +1,55 @@
+"""
+Retrying writes that lose a lock race.
+
+SQLite waits up to ``OPTIONS['timeout']`` for the write lock and then fails
+with "database is locked"; PostgreSQL aborts one side of a deadlock or
+serialization conflict. Either way the transaction was rolled back, so the
+whole unit of work can simply run again. Only the outermost transaction can
+be retried: inside an enclosing ``atomic`` block the error is re-raised for
+that block's owner to handle.
+"""
+import random
+import time
+from functools import wraps
+
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS, OperationalError, connections
+
+DEFAULT_WRITE_RETRY = {
+    'ATTEMPTS': 3,
+    'BACKOFF': 0.05,
+}
+# Deadlock detected, serialization failure.
+RETRYABLE_SQLSTATES = {'40P01', '40001'}
+
+
+def is_lock_error(exc):
+    if 'database is locked' in str(exc) or 'database table is locked' in str(exc):
+        return True
+    # psycopg 3 names the code ``sqlstate``, psycopg2 ``pgcode``.
+    cause = exc.__cause__
+    sqlstate = getattr(cause, 'sqlstate', None) or getattr(cause, 'pgcode', None)
+    return sqlstate in RETRYABLE_SQLSTATES
+
+
+def retry_on_lock(func=None, using=DEFAULT_DB_ALIAS):
+    """
+    Run ``func`` again, with jittered exponential backoff, when it fails on
+    a lock (see ``DATABASE_WRITE_RETRY``). Use it around functions that own
+    their transaction.
+    """
+    def decorator(func):
+        @wraps(func)
+        def wrapper(*args, **kwargs):
+            config = {**DEFAULT_WRITE_RETRY, **getattr(settings, 'DATABASE_WRITE_RETRY', {})}
+            for attempt in range(config['ATTEMPTS']):
+                try:
+                    return func(*args, **kwargs)
+                except OperationalError as exc:
+                    last_attempt = attempt == config['ATTEMPTS'] - 1
+                    if last_attempt or connections[using].in_atomic_block or not is_lock_error(exc):
+                        raise
+                time.sleep(config['BACKOFF'] * 2 ** attempt * random.uniform(0.5, 1.5))
+        return wrapper
+
+    return decorator(func) if func is not None else decorator
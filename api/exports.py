@@ -0,0 +1,93 @@
+"""
+Staff exports of orders and reviews over a date range.
+
+Rows are read with ``iterator(chunk_size=...)`` (a server-side cursor on
+PostgreSQL); order items are prefetched one chunk at a time, so memory
+depends on the chunk size, not on the range. As NDJSON each order is one
+line with its items and payment nested; as CSV each order item is a row
+carrying its order's columns.
+"""
+from django.db.models import F
+
+from .models import Order, Review
+from .orders import order_items_prefetch
+
+CHUNK_SIZE = 1000
+
+ORDER_COLUMNS = ('id', 'user', 'username', 'order_date', 'status', 'total', 'payment', 'items')
+ORDER_CSV_COLUMNS = (
+    'order', 'user', 'username', 'order_date', 'status', 'total',
+    'payment_method', 'payment_status', 'payment_amount', 'payment_date',
+    'product', 'product_name', 'quantity', 'price',
+)
+REVIEW_COLUMNS = ('id', 'user', 'username', 'product', 'product_name', 'rating', 'comment', 'review_date')
+
+
+def date_range(queryset, field, start=None, end=None):
+    if start is not None:
+        queryset = queryset.filter(**{f'{field}__gte': start})
+    if end is not None:
+        queryset = queryset.filter(**{f'{field}__lt': end})
+    return queryset.order_by(field, 'id')
+
+
+def orders_in_range(start=None, end=None):
+    queryset = (
+        Order.objects.select_related('payment').annotate(username=F('user__username'))
+        .prefetch_related(order_items_prefetch())
+    )
+    return date_range(queryset, 'order_date', start, end).iterator(chunk_size=CHUNK_SIZE)
+
+
+def payment_fields(order):
+    try:
+        payment = order.payment
+    except Order.payment.RelatedObjectDoesNotExist:
+        return None
+    return {
+        'method': payment.payment_method, 'status': payment.payment_status,
+        'amount': payment.amount, 'date': payment.payment_date,
+    }
+
+
+def order_rows(fmt, start=None, end=None):
+    """``(columns, rows)`` of the orders placed in ``[start, end)``."""
+    if fmt == 'csv':
+        return ORDER_CSV_COLUMNS, order_item_rows(start, end)
+    return ORDER_COLUMNS, (
+        (
+            order.id, order.user_id, order.username, order.order_date, order.status, order.total,
+            payment_fields(order),
+            [
+                {'product': item.product_id, 'product_name': item.product.name,
+                 'quantity': item.quantity, 'price': item.price}
+                for item in order.items.all()
+            ],
+        )
+        for order in orders_in_range(start, end)
+    )
+
+
+def order_item_rows(start, end):
+    for order in orders_in_range(start, end):
+        payment = payment_fields(order) or {}
+        head = (
+            order.id, order.user_id, order.username, order.order_date, order.status, order.total,
+            payment.get('method'), payment.get('status'), payment.get('amount'), payment.get('date'),
+        )
+        items = order.items.all()
+        if not items:
+            yield (*head, None, None, None, None)
+        for item in items:
+            yield (*head, item.product_id, item.product.name, item.quantity, item.price)
+
+
+def review_rows(fmt, start=None, end=None):
+    """``(columns, rows)`` of the reviews written in ``[start, end)``."""
+    queryset = date_range(Review.objects.all(), 'review_date', start, end).values_list(
+        'id', 'user_id', 'user__username', 'product_id', 'product__name', 'rating', 'comment', 'review_date',
+    )
+    return REVIEW_COLUMNS, queryset.iterator(chunk_size=CHUNK_SIZE)
+
+
+EXPORTS = {'orders': order_rows, 'reviews': review_rows}
@@ -0,0 +1,22 @@
+from .models import UserFavorites
+
+
+def get_favorite_product_ids(user_id, product_ids):
+    """
+    Return the frozenset of ``product_ids`` the user has favorited.
+
+    Only the products being rendered are looked up, with one indexed query,
+    so a listing costs the same however many favorites the user has and
+    every worker sees a toggle straight away.
+    """
+    return frozenset(
+        UserFavorites.objects.filter(user_id=user_id, product_id__in=product_ids).values_list('product_id', flat=True)
+    )
+
+
+async def aget_favorite_product_ids(user_id, product_ids):
+    """Async variant of ``get_favorite_product_ids``."""
+    return frozenset([
+        product_id async for product_id in
+        UserFavorites.objects.filter(user_id=user_id, product_id__in=product_ids).values_list('product_id', flat=True)
+    ])
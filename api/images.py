@@ -0,0 +1,196 @@
+"""
+Resized JPEG/PNG and WebP derivatives of uploaded images.
+
+Saving a model with a new image schedules a job, after the transaction
+commits, on a small thread pool; Pillow releases the GIL while decoding,
+resizing and encoding, so the pool keeps several uploads moving without
+holding up the request that stored the original. The result is written to
+the model's ``<field>_variants`` JSON column::
+
+    {'source': 'products/pho.jpg', 'width': 1600, 'height': 1200,
+     'jpeg': {'160': 'derivatives/products/pho-160w.jpg', ...},
+     'webp': {'160': 'derivatives/products/pho-160w.webp', ...}}
+
+Widths larger than the original are skipped, so small uploads are never
+upscaled. Variants are stored with ``default_storage`` (which may rename
+them, e.g. by content hash) and turned into URLs by
+``serializers.ImageSrcsetField``.
+"""
+import io
+import logging
+import posixpath
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from django.apps import apps
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.core.signals import setting_changed
+from django.db import connections, transaction
+from django.db.models import Q, TextField
+from django.db.models.functions import Cast
+from django.dispatch import receiver
+from PIL import Image, ImageOps
+
+from .cache import CATALOG_NAMESPACES, bump_catalog_version
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_IMAGE_DERIVATIVES = {
+    'WIDTHS': (160, 480, 960),
+    'QUALITY': 80,
+    'WORKERS': 2,
+    # False runs jobs inline in ``on_commit`` (tests, management commands).
+    'ASYNC': True,
+}
+
+# Model label -> image field name. The variants live in ``<field>_variants``.
+IMAGE_FIELDS = {
+    'api.CustomUser': 'image',
+    'api.Category': 'image',
+    'api.Products': 'image',
+    'api.ChefsData': 'profile_picture',
+    'api.Ads': 'image',
+}
+
+_executor = None
+_executor_lock = threading.Lock()
+
+
+def derivative_settings():
+    return {**DEFAULT_IMAGE_DERIVATIVES, **getattr(settings, 'IMAGE_DERIVATIVES', {})}
+
+
+def get_executor():
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(
+                max_workers=derivative_settings()['WORKERS'], thread_name_prefix='image-derivatives'
+            )
+        return _executor
+
+
+@receiver(setting_changed)
+def reset_executor(setting, **kwargs):
+    global _executor
+    if setting == 'IMAGE_DERIVATIVES' and _executor is not None:
+        _executor.shutdown(wait=True)
+        _executor = None
+
+
+def variants_field(field_name):
+    return f'{field_name}_variants'
+
+
+def needs_derivatives(instance, field_name):
+    """True when the stored variants were not built from the current image."""
+    name = getattr(instance, field_name).name or ''
+    return name != getattr(instance, variants_field(field_name)).get('source', '')
+
+
+def render(image, width, fmt, quality):
+    resized = image.resize((width, round(image.height * width / image.width)), Image.Resampling.LANCZOS)
+    buffer = io.BytesIO()
+    if fmt == 'jpeg':
+        resized.convert('RGB').save(buffer, 'JPEG', quality=quality, optimize=True, progressive=True)
+    elif fmt == 'png':
+        resized.save(buffer, 'PNG', optimize=True)
+    else:
+        resized.save(buffer, 'WEBP', quality=quality, method=4)
+    return buffer.getvalue()
+
+
+def build_variants(name, storage=None):
+    """Write the derivatives of the stored image ``name`` and describe them."""
+    storage = storage or default_storage
+    config = derivative_settings()
+    with storage.open(name) as source:
+        image = ImageOps.exif_transpose(Image.open(source))
+        image.load()
+    has_alpha = image.mode in ('RGBA', 'LA') or (image.mode == 'P' and 'transparency' in image.info)
+    image = image.convert('RGBA' if has_alpha else 'RGB')
+    # Transparent images keep a lossless fallback; JPEG would flatten them.
+    fallback = 'png' if has_alpha else 'jpeg'
+    stem = posixpath.join('derivatives', posixpath.splitext(name)[0])
+    variants = {'source': name, 'width': image.width, 'height': image.height, fallback: {}, 'webp': {}}
+    for width in sorted(config['WIDTHS']):
+        if width > image.width:
+            break
+        for fmt in (fallback, 'webp'):
+            extension = 'jpg' if fmt == 'jpeg' else fmt
+            data = render(image, width, fmt, config['QUALITY'])
+            variants[fmt][str(width)] = storage.save(f'{stem}-{width}w.{extension}', ContentFile(data))
+    return variants
+
+
+def generate_derivatives(model_label, pk, field_name):
+    """
+    Build the variants for one row and record them, unless the image changed
+    again while this job ran (a newer job is then already queued).
+    """
+    model = apps.get_model(model_label)
+    rows = list(model.objects.filter(pk=pk).values_list(field_name, variants_field(field_name)))
+    if not rows:
+        return None
+    name, previous = rows[0][0] or '', rows[0][1] or {}
+    try:
+        variants = build_variants(name) if name else {}
+    except (OSError, Image.DecompressionBombError):
+        logger.exception('Could not build derivatives for %s %s', model_label, pk)
+        variants = {'source': name, 'error': 'unreadable image'}
+    unchanged = Q(**{field_name: name}) if name else Q(**{field_name: ''}) | Q(**{f'{field_name}__isnull': True})
+    updated = model.objects.filter(unchanged, pk=pk).update(**{variants_field(field_name): variants})
+    if updated:
+        superseded = variant_names(previous) - variant_names(variants)
+        if superseded:
+            transaction.on_commit(lambda: delete_unreferenced(superseded))
+        if model_label in CATALOG_NAMESPACES:
+            bump_catalog_version(CATALOG_NAMESPACES[model_label])
+    return variants
+
+
+def variant_names(variants):
+    return {name for fmt in ('jpeg', 'png', 'webp') for name in variants.get(fmt, {}).values()}
+
+
+def delete_unreferenced(names, storage=None):
+    """
+    Delete the derivative files ``names`` that no row's variants list any
+    more. Content-addressed storage shares identical files between rows, so
+    each name is looked for in every variants column first.
+    """
+    storage = storage or default_storage
+    for name in names:
+        referenced = any(
+            apps.get_model(label).objects.annotate(
+                listed=Cast(variants_field(field_name), TextField())
+            ).filter(listed__contains=name).exists()
+            for label, field_name in IMAGE_FIELDS.items()
+        )
+        if not referenced:
+            storage.delete(name)
+
+
+def run_in_worker(*job):
+    try:
+        generate_derivatives(*job)
+    except Exception:
+        logger.exception('Derivative job %s failed', job)
+    finally:
+        # Worker threads get their own connections; don't leave them open.
+        connections.close_all()
+
+
+def schedule_derivatives(instance, field_name):
+    """Queue a derivative job for ``instance`` once the current transaction commits."""
+    job = (instance._meta.label, instance.pk, field_name)
+
+    def submit():
+        if derivative_settings()['ASYNC']:
+            get_executor().submit(run_in_worker, *job)
+        else:
+            generate_derivatives(*job)
+
+    transaction.on_commit(submit)
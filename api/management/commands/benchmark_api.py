@@ -0,0 +1,86 @@
+import json
+import platform
+
+import django
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.test.utils import setup_test_environment, teardown_test_environment
+
+from api.benchmarks import SCENARIOS, run_benchmarks
+from api.seed import DEFAULT_SCALE, seed_database
+
+COLUMNS = ('throughput_rps', 'p50_ms', 'p90_ms', 'p99_ms', 'max_ms', 'mean_queries', 'errors')
+
+
+class Command(BaseCommand):
+    help = (
+        'Seed a throwaway test database and drive the API endpoints (browse, search, '
+        'favorite toggle, add to cart, checkout, token obtain/refresh) through the test '
+        'client, one request at a time. Reports throughput, latency percentiles and '
+        'query counts per scenario; save a run with --json and pass it to --compare later.'
+    )
+
+    def add_arguments(self, parser):
+        for name, default in DEFAULT_SCALE.items():
+            parser.add_argument(f'--{name.replace("_", "-")}', dest=name, type=int, default=default)
+        parser.add_argument('--scenario', action='append', choices=list(SCENARIOS),
+                            help='Run only this scenario; repeat for several. Default: all.')
+        parser.add_argument('--iterations', type=int, default=200, help='Requests per scenario.')
+        parser.add_argument('--seed', type=int, default=0, help='Random seed for the data and the requests.')
+        parser.add_argument('--cold-cache', action='store_true', help='Clear the catalog cache before each request.')
+        parser.add_argument('--compare', help='A previous --json report to show changes against.')
+        parser.add_argument('--json', action='store_true', help='Print the report as JSON.')
+
+    def handle(self, *args, **options):
+        scale = {name: options[name] for name in DEFAULT_SCALE}
+        baseline = None
+        if options['compare']:
+            try:
+                with open(options['compare']) as report_file:
+                    baseline = json.load(report_file)['scenarios']
+            except (OSError, ValueError, KeyError) as exc:
+                raise CommandError(f'Cannot read {options["compare"]}: {exc}')
+
+        old_name = connection.creation.create_test_db(verbosity=0, autoclobber=True, serialize=False)
+        setup_test_environment()
+        try:
+            self.stderr.write(f'Seeding {scale} ...')
+            seed_database(scale, random_seed=options['seed'])
+            scenarios = run_benchmarks(
+                options['scenario'], options['iterations'], random_seed=options['seed'],
+                cold_cache=options['cold_cache'],
+            )
+        finally:
+            teardown_test_environment()
+            connection.creation.destroy_test_db(old_name, verbosity=0)
+
+        report = {
+            'scale': scale,
+            'iterations': options['iterations'],
+            'seed': options['seed'],
+            'cold_cache': options['cold_cache'],
+            'environment': {
+                'python': platform.python_version(),
+                'django': django.get_version(),
+                'database': connection.vendor,
+            },
+            'scenarios': scenarios,
+        }
+        if options['json']:
+            self.stdout.write(json.dumps(report, indent=2))
+            return
+
+        self.stdout.write(f'{"scenario":<16}' + ''.join(f'{column:>16}' for column in COLUMNS))
+        for name, result in scenarios.items():
+            self.stdout.write(f'{name:<16}' + ''.join(f'{result[column]:>16}' for column in COLUMNS))
+            previous = (baseline or {}).get(name)
+            if previous:
+                self.stdout.write(f'{"  vs baseline":<16}' + ''.join(
+                    f'{change(previous.get(column), result[column]):>16}' for column in COLUMNS
+                ))
+
+
+def change(before, after):
+    if not before or after is None:
+        return '-'
+    return f'{(after - before) / before * 100:+.1f}%'
@@ -0,0 +1,81 @@
+import json
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.test.utils import setup_test_environment, teardown_test_environment
+
+from api.benchmarks import DEFAULT_MIX, SCENARIOS, run_mixed
+from api.seed import seed_database
+
+
+def parse_mix(values):
+    mix = {}
+    for value in values:
+        name, sep, weight = value.partition('=')
+        if not sep or name not in SCENARIOS or not weight.isdigit():
+            raise CommandError(f'--mix takes scenario=weight with a scenario from {", ".join(SCENARIOS)}; got {value!r}.')
+        mix[name] = int(weight)
+    return mix
+
+
+class Command(BaseCommand):
+    help = (
+        'Seed a throwaway test database and run a mixed read/write load against the API '
+        'from several threads, reporting throughput, latency percentiles and lock errors. '
+        'The database is configured by DB_PROFILE, so compare profiles with e.g. '
+        '`DB_PROFILE=sqlite python manage.py benchmark_db` and '
+        '`DB_PROFILE=sqlite-wal python manage.py benchmark_db`.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--threads', type=int, default=8)
+        parser.add_argument('--duration', type=float, default=10.0, help='Seconds to run the load for.')
+        parser.add_argument('--mix', action='append', default=[],
+                            help='Scenario weight, "checkout=5"; repeat for several. Default: a storefront mix.')
+        parser.add_argument('--users', type=int, default=200)
+        parser.add_argument('--products', type=int, default=2000)
+        parser.add_argument('--seed', type=int, default=0)
+        parser.add_argument('--json', action='store_true', help='Print the report as JSON.')
+
+    def handle(self, *args, **options):
+        mix = parse_mix(options['mix']) or DEFAULT_MIX
+        users_per_thread = 5
+        if options['users'] < options['threads'] * users_per_thread:
+            raise CommandError(f'--users must be at least {users_per_thread} per thread.')
+        scale = {'users': options['users'], 'products': options['products'], 'carts': options['users']}
+
+        old_name = connection.creation.create_test_db(verbosity=0, autoclobber=True, serialize=False)
+        setup_test_environment()
+        try:
+            self.stderr.write(f'Seeding {scale} ...')
+            seed_database(scale, random_seed=options['seed'])
+            report = run_mixed(
+                mix, threads=options['threads'], duration=options['duration'],
+                users_per_thread=users_per_thread, random_seed=options['seed'],
+            )
+            report['database'] = {
+                'profile': settings.DB_PROFILE,
+                'vendor': connection.vendor,
+                'conn_max_age': connection.settings_dict['CONN_MAX_AGE'],
+                'options': {key: value for key, value in connection.settings_dict['OPTIONS'].items()
+                            if key != 'password'},
+            }
+        finally:
+            teardown_test_environment()
+            connection.creation.destroy_test_db(old_name, verbosity=0)
+
+        report['mix'] = mix
+        if options['json']:
+            self.stdout.write(json.dumps(report, indent=2, default=str))
+            return
+        self.stdout.write(
+            f"{report['database']['profile']}: {report['requests']} requests from {report['threads']} threads "
+            f"in {report['seconds']:.0f}s ({report['throughput_rps']} req/s), "
+            f"{report['errors']} errors, {report['lock_errors']} lock errors"
+        )
+        for name, result in report['scenarios'].items():
+            self.stdout.write(
+                f"  {name:<16} {result['requests']:>6} req  p50 {result['p50_ms']} ms  "
+                f"p90 {result['p90_ms']} ms  p99 {result['p99_ms']} ms  errors {result['errors']}"
+            )
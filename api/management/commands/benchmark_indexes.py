@@ -0,0 +1,101 @@
+import json
+import statistics
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import connection
+from django.utils import timezone
+
+from api.models import Ads, Order, Products, Review, UserFavorites
+from api.search import search_products
+from api.seed import DEFAULT_SCALE, seed_database
+
+INDEXED_MODELS = (Order, Review, Products, Ads, UserFavorites)
+
+
+def hot_queries():
+    """The filter/sort patterns the composite indexes are meant to serve."""
+    now = timezone.now()
+    user_id = Order.objects.values_list('user_id', flat=True).first()
+    product_id = Review.objects.values_list('product_id', flat=True).first()
+    category_id = Products.objects.values_list('category_id', flat=True).first()
+    return {
+        'orders_of_user': Order.objects.filter(user_id=user_id).order_by('-order_date')[:20],
+        'orders_by_status': Order.objects.filter(status='Pending').order_by('-order_date')[:20],
+        'reviews_of_product': Review.objects.filter(product_id=product_id).order_by('-review_date')[:20],
+        'category_menu_by_price': Products.objects.filter(
+            category_id=category_id, is_available=True, price__range=(5, 25)
+        ).order_by('price')[:20],
+        'active_ads': Ads.objects.filter(is_active=True, start_date__lte=now, end_date__gt=now),
+        'favorites_of_user': UserFavorites.objects.filter(user_id=user_id).order_by('-added_at')[:20],
+        'product_search': search_products(Products.objects.all(), 'spicy chicken').order_by('id')[:20],
+    }
+
+
+def set_indexes(add):
+    with connection.schema_editor() as editor:
+        for model in INDEXED_MODELS:
+            for index in model._meta.indexes:
+                if add:
+                    editor.add_index(model, index)
+                else:
+                    editor.remove_index(model, index)
+    # Refresh planner statistics so both runs are planned from the same data.
+    with connection.cursor() as cursor:
+        cursor.execute('ANALYZE')
+
+
+def measure(queries, repeat):
+    results = {}
+    for name, queryset in queries.items():
+        timings = []
+        for _ in range(repeat):
+            start = time.perf_counter()
+            list(queryset.all())
+            timings.append((time.perf_counter() - start) * 1000)
+        results[name] = {
+            'plan': queryset.explain(),
+            'median_ms': round(statistics.median(timings), 3),
+            'max_ms': round(max(timings), 3),
+        }
+    return results
+
+
+class Command(BaseCommand):
+    help = (
+        'Seed a throwaway test database with synthetic data and report EXPLAIN '
+        'plans and timings of the hot queries with and without the composite '
+        'indexes from Meta.indexes.'
+    )
+
+    def add_arguments(self, parser):
+        for name in ('users', 'products', 'reviews', 'orders'):
+            parser.add_argument(f'--{name}', type=int, default=DEFAULT_SCALE[name] * 10)
+        parser.add_argument('--repeat', type=int, default=50)
+        parser.add_argument('--json', action='store_true', help='Print the report as JSON.')
+
+    def handle(self, *args, **options):
+        scale = {name: options[name] for name in ('users', 'products', 'reviews', 'orders')}
+        old_name = connection.creation.create_test_db(verbosity=0, autoclobber=True, serialize=False)
+        try:
+            self.stderr.write(f'Seeding {scale} ...')
+            seed_database(scale)
+            queries = hot_queries()
+            report = {'scale': scale}
+            set_indexes(add=False)
+            report['without_indexes'] = measure(queries, options['repeat'])
+            set_indexes(add=True)
+            report['with_indexes'] = measure(queries, options['repeat'])
+        finally:
+            connection.creation.destroy_test_db(old_name, verbosity=0)
+
+        if options['json']:
+            self.stdout.write(json.dumps(report, indent=2))
+            return
+        for name in report['with_indexes']:
+            indexed, bare = report['with_indexes'][name], report['without_indexes'][name]
+            self.stdout.write(self.style.MIGRATE_HEADING(name))
+            for label, result in (('without indexes', bare), ('with indexes', indexed)):
+                self.stdout.write(f'  {label}: median {result["median_ms"]} ms, max {result["max_ms"]} ms')
+                for line in result['plan'].splitlines():
+                    self.stdout.write(f'    {line}')
@@ -0,0 +1,25 @@
+from django.core.management.base import BaseCommand
+
+from api.catalog_io import KINDS, export_rows
+from api.streaming import CONTENT_TYPES, encode_rows
+
+
+class Command(BaseCommand):
+    help = 'Write every category, chef or product as CSV or JSON Lines, in the format catalog_import reads.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('kind', choices=list(KINDS))
+        parser.add_argument('--format', choices=list(CONTENT_TYPES), default='csv')
+        parser.add_argument('--output', help='File to write; standard output by default.')
+
+    def handle(self, *args, kind, output, **options):
+        columns, rows = export_rows(kind)
+        blocks = encode_rows(options['format'], columns, rows)
+        if output is None:
+            for block in blocks:
+                # Blocks end on line boundaries, so each decodes on its own.
+                self.stdout.write(block.decode(), ending='')
+            return
+        with open(output, 'wb') as export_file:
+            for block in blocks:
+                export_file.write(block)
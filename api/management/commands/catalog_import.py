@@ -0,0 +1,40 @@
+import json
+import os
+
+from django.core.management.base import BaseCommand, CommandError
+
+from api.catalog_io import BATCH_SIZE, KINDS, import_records
+from api.streaming import CONTENT_TYPES, read_records
+
+
+class Command(BaseCommand):
+    help = (
+        'Upsert categories, chefs or products from a CSV or JSON Lines file, keyed on '
+        'name. Import categories and chefs before the products that name them.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('kind', choices=list(KINDS))
+        parser.add_argument('path')
+        parser.add_argument('--format', choices=list(CONTENT_TYPES),
+                            help='File format; by default taken from the extension.')
+        parser.add_argument('--batch-size', type=int, default=BATCH_SIZE, help='Records per transaction.')
+
+    def handle(self, *args, kind, path, batch_size, **options):
+        fmt = options['format'] or os.path.splitext(path)[1].lstrip('.').lower()
+        if fmt not in CONTENT_TYPES:
+            raise CommandError('Cannot tell the format from the file name; pass --format.')
+        try:
+            with open(path, 'rb') as records_file:
+                report = import_records(kind, read_records(records_file, fmt), batch_size=batch_size)
+        except OSError as exc:
+            raise CommandError(exc)
+
+        for error in report['errors']:
+            self.stderr.write(f"line {error['line']} ({error['name']}): {json.dumps(error['errors'])}")
+        if report['failed'] > len(report['errors']):
+            self.stderr.write(f"... and {report['failed'] - len(report['errors'])} more rows failed.")
+        style = self.style.SUCCESS if not report['failed'] else self.style.WARNING
+        self.stdout.write(style(
+            f"{kind}: {report['created']} created, {report['updated']} updated, {report['failed']} failed."
+        ))
@@ -0,0 +1,36 @@
+from concurrent.futures import ThreadPoolExecutor
+
+from django.apps import apps
+from django.core.management.base import BaseCommand
+
+from api.images import IMAGE_FIELDS, derivative_settings, generate_derivatives, needs_derivatives, run_in_worker
+
+
+class Command(BaseCommand):
+    help = (
+        'Build missing or stale image derivatives for every model with an image, '
+        'e.g. for uploads made before the pipeline existed or after changing '
+        'IMAGE_DERIVATIVES widths (with --force).'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--force', action='store_true', help='Rebuild variants that look up to date.')
+        parser.add_argument('--workers', type=int, default=derivative_settings()['WORKERS'])
+
+    def handle(self, *args, force=False, workers=1, **options):
+        jobs = []
+        for label, field_name in IMAGE_FIELDS.items():
+            model = apps.get_model(label)
+            rows = model.objects.exclude(**{field_name: ''}).exclude(**{f'{field_name}__isnull': True})
+            for instance in rows.only('pk', field_name, f'{field_name}_variants').iterator():
+                if force or needs_derivatives(instance, field_name):
+                    jobs.append((label, instance.pk, field_name))
+
+        if workers <= 1:
+            for job in jobs:
+                generate_derivatives(*job)
+        else:
+            with ThreadPoolExecutor(max_workers=workers) as executor:
+                for job in jobs:
+                    executor.submit(run_in_worker, *job)
+        self.stdout.write(self.style.SUCCESS(f'Built derivatives for {len(jobs)} images.'))
@@ -0,0 +1,194 @@
+import json
+import shlex
+import socket
+import statistics
+import subprocess
+import tempfile
+import threading
+import time
+from contextlib import contextmanager
+from http.client import HTTPConnection, HTTPSConnection
+from urllib.parse import urlsplit
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from api.benchmarks import percentile
+
+# Neither server is in requirements.txt; install the ones you compare.
+STACK_COMMANDS = {
+    'wsgi': 'gunicorn backend.wsgi:application --workers 4 --threads 8 --bind 127.0.0.1:{port}',
+    'asgi': 'uvicorn backend.asgi:application --workers 4 --host 127.0.0.1 --port {port}',
+}
+STARTUP_TIMEOUT = 30
+
+
+class Command(BaseCommand):
+    help = (
+        'Drive concurrent keep-alive GET requests at one or more URLs and report requests '
+        'per second and latency percentiles for each. With --compare the arguments are '
+        'paths: the project is started under WSGI (gunicorn) and then under ASGI (uvicorn), '
+        'every path is run against each, and the two are reported side by side, e.g. '
+        '`loadtest --compare /api/products/ /api/async/products/`.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('urls', nargs='+', help='URLs, or with --compare, paths.')
+        parser.add_argument('--concurrency', type=int, default=32, help='Simultaneous clients per URL.')
+        parser.add_argument('--duration', type=float, default=10.0, help='Seconds to run each URL for.')
+        parser.add_argument('--warmup', type=float, default=1.0, help='Seconds of unmeasured traffic first.')
+        parser.add_argument('--header', action='append', default=[], help='Extra header, "Name: value".')
+        parser.add_argument('--json', action='store_true', help='Print the results as JSON.')
+        parser.add_argument('--compare', action='store_true', help='Run the paths under WSGI and under ASGI.')
+        parser.add_argument(
+            '--wsgi-command', default=STACK_COMMANDS['wsgi'], help='Server command for --compare; {port} is filled in.',
+        )
+        parser.add_argument(
+            '--asgi-command', default=STACK_COMMANDS['asgi'], help='Server command for --compare; {port} is filled in.',
+        )
+
+    def handle(self, *args, urls, concurrency, duration, warmup, header, **options):
+        headers = {}
+        for line in header:
+            name, sep, value = line.partition(':')
+            if not sep:
+                raise CommandError(f'Headers look like "Name: value", got {line!r}.')
+            headers[name.strip()] = value.strip()
+
+        if options['compare']:
+            commands = {'wsgi': options['wsgi_command'], 'asgi': options['asgi_command']}
+            results = self.compare(urls, commands, concurrency, duration, warmup, headers)
+        else:
+            results = [self.run(url, concurrency, duration, warmup, headers) for url in urls]
+        if options['json']:
+            self.stdout.write(json.dumps(results, indent=2))
+        elif options['compare']:
+            self.report_comparison(urls, results)
+        else:
+            for result in results:
+                self.stdout.write(
+                    f"{result['url']}\n"
+                    f"  {result['requests']} requests, {result['errors']} errors in {result['seconds']:.1f}s "
+                    f"({result['rps']:.1f} req/s)\n"
+                    f"  latency ms: p50 {result['p50_ms']}  p90 {result['p90_ms']}  "
+                    f"p99 {result['p99_ms']}  max {result['max_ms']}"
+                )
+
+    def compare(self, paths, commands, concurrency, duration, warmup, headers):
+        """Serve the project with each command in turn and run every path against it."""
+        results = []
+        for stack, command in commands.items():
+            with self.serve(command) as base_url:
+                for path in paths:
+                    result = self.run(base_url + path, concurrency, duration, warmup, headers)
+                    results.append({'stack': stack, 'path': path, **result})
+        return results
+
+    @contextmanager
+    def serve(self, command):
+        with socket.socket() as probe:
+            probe.bind(('127.0.0.1', 0))
+            port = probe.getsockname()[1]
+        with tempfile.TemporaryFile() as log:
+            try:
+                process = subprocess.Popen(
+                    shlex.split(command.format(port=port)), cwd=settings.BASE_DIR,
+                    stdout=subprocess.DEVNULL, stderr=log,
+                )
+            except OSError as exc:
+                raise CommandError(f'Cannot start {command!r}: {exc}')
+            try:
+                deadline = time.monotonic() + STARTUP_TIMEOUT
+                while True:
+                    try:
+                        socket.create_connection(('127.0.0.1', port), timeout=1).close()
+                        break
+                    except OSError:
+                        if process.poll() is not None or time.monotonic() > deadline:
+                            log.seek(0)
+                            output = log.read().decode(errors='replace').strip()[-2000:]
+                            raise CommandError(f'{command!r} did not start serving on port {port}.\n{output}')
+                        time.sleep(0.1)
+                yield f'http://127.0.0.1:{port}'
+            finally:
+                process.terminate()
+                try:
+                    process.wait(10)
+                except subprocess.TimeoutExpired:
+                    process.kill()
+                    process.wait()
+
+    def report_comparison(self, paths, results):
+        by_stack = {(result['stack'], result['path']): result for result in results}
+        for path in paths:
+            self.stdout.write(path)
+            for stack in ('wsgi', 'asgi'):
+                result = by_stack[stack, path]
+                self.stdout.write(
+                    f"  {stack}  {result['rps']:8.1f} req/s  p50 {result['p50_ms']}  p99 {result['p99_ms']}  "
+                    f"errors {result['errors']}"
+                )
+            wsgi_rps = by_stack['wsgi', path]['rps']
+            if wsgi_rps:
+                self.stdout.write(f"  asgi/wsgi throughput {by_stack['asgi', path]['rps'] / wsgi_rps:.2f}x")
+
+    def run(self, url, concurrency, duration, warmup, headers):
+        parts = urlsplit(url)
+        if parts.scheme not in ('http', 'https'):
+            raise CommandError(f'Not an http(s) URL: {url}')
+        connection_class = HTTPSConnection if parts.scheme == 'https' else HTTPConnection
+        target = parts.path + (f'?{parts.query}' if parts.query else '')
+
+        latencies = []
+        errors = [0]
+        lock = threading.Lock()
+        start_at = time.monotonic() + warmup
+        stop_at = start_at + duration
+
+        def client():
+            connection = connection_class(parts.netloc, timeout=30)
+            local_latencies, local_errors = [], 0
+            while True:
+                began = time.monotonic()
+                if began >= stop_at:
+                    break
+                try:
+                    connection.request('GET', target, headers=headers)
+                    response = connection.getresponse()
+                    response.read()
+                    failed = response.status >= 400
+                except OSError:
+                    connection.close()
+                    connection = connection_class(parts.netloc, timeout=30)
+                    failed = True
+                if began >= start_at:
+                    local_latencies.append(time.monotonic() - began)
+                    local_errors += failed
+            connection.close()
+            with lock:
+                latencies.extend(local_latencies)
+                errors[0] += local_errors
+
+        threads = [threading.Thread(target=client) for _ in range(concurrency)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        latencies.sort()
+
+        def ms(value):
+            return round(value * 1000, 2) if value is not None else None
+
+        return {
+            'url': url,
+            'concurrency': concurrency,
+            'seconds': duration,
+            'requests': len(latencies),
+            'errors': errors[0],
+            'rps': len(latencies) / duration,
+            'p50_ms': ms(statistics.median(latencies)) if latencies else None,
+            'p90_ms': ms(percentile(latencies, 0.90)),
+            'p99_ms': ms(percentile(latencies, 0.99)),
+            'max_ms': ms(latencies[-1] if latencies else None),
+        }
@@ -0,0 +1,19 @@
+from django.core.management.base import BaseCommand
+
+from api.models import ChefsData, Products
+from api.ratings import rebuild_ratings
+
+
+class Command(BaseCommand):
+    help = (
+        'Recompute product and chef rating aggregates from the reviews. Use it '
+        'to repair drift, e.g. after reviews were created or edited outside '
+        'the API.'
+    )
+
+    def handle(self, *args, **options):
+        rebuild_ratings()
+        self.stdout.write(self.style.SUCCESS(
+            f'Rebuilt ratings for {Products.objects.count()} products '
+            f'and {ChefsData.objects.count()} chefs.'
+        ))
@@ -0,0 +1,21 @@
+from django.core.management.base import BaseCommand
+
+from api.rollups import refresh_sales_rollups
+
+
+class Command(BaseCommand):
+    help = (
+        'Bring the hourly and daily sales rollups up to date, recomputing only the '
+        'buckets since the last refresh. Run it from cron, e.g. every few minutes.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--rebuild', action='store_true', help='Drop every rollup row and build them again.')
+
+    def handle(self, *args, rebuild, **options):
+        result = refresh_sales_rollups(rebuild=rebuild)
+        since = result['since'].isoformat() if result['since'] else 'the first order'
+        self.stdout.write(self.style.SUCCESS(
+            f"Recomputed rollups from {since} to {result['until'].isoformat()}: "
+            f"{result['deleted']} rows replaced by {result['created']}."
+        ))
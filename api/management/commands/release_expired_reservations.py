@@ -0,0 +1,19 @@
+from django.core.management.base import BaseCommand
+
+from api.reservations import RELEASE_BATCH_SIZE, release_expired
+
+
+class Command(BaseCommand):
+    help = (
+        'Delete the stock reservations that have expired, in short batches. '
+        'Run it from cron, e.g. every minute.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--batch-size', type=int, default=RELEASE_BATCH_SIZE, help='Reservations deleted per transaction.',
+        )
+
+    def handle(self, *args, batch_size, **options):
+        released = release_expired(batch_size=batch_size)
+        self.stdout.write(self.style.SUCCESS(f'Released {released} expired reservations.'))
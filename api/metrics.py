@@ -0,0 +1,183 @@
+"""
+In-process request metrics, exported in the Prometheus text format.
+
+``api.middleware.MetricsMiddleware`` opens a ``RequestStats`` for every
+request; database wrappers and ``TimedSerializerMixin`` add to whichever one is
+current (a context variable, so it follows async views into
+``sync_to_async`` threads). When the response is done the totals go into
+per-view histograms. Each process keeps its own histograms; scrape every
+worker, or aggregate them with the Prometheus server.
+"""
+import bisect
+import collections
+import sys
+import threading
+import time
+from contextvars import ContextVar
+
+DURATION_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+QUERY_BUCKETS = (0, 1, 2, 3, 5, 10, 20, 50, 100, 250)
+SIZE_BUCKETS = (256, 1024, 4096, 16384, 65536, 262144, 1048576, 4194304)
+
+
+class Histogram:
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value):
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+
+class MetricsRegistry:
+    """Named histograms keyed by label values, safe to update from any thread."""
+
+    def __init__(self):
+        self.definitions = {}
+        self.series = collections.defaultdict(dict)
+        self._lock = threading.Lock()
+
+    def define(self, name, help_text, label_names, buckets):
+        self.definitions[name] = (help_text, label_names, buckets)
+
+    def observe(self, name, labels, value):
+        with self._lock:
+            histogram = self.series[name].get(labels)
+            if histogram is None:
+                histogram = self.series[name][labels] = Histogram(self.definitions[name][2])
+            histogram.observe(value)
+
+    def clear(self):
+        with self._lock:
+            self.series.clear()
+
+    def render(self):
+        lines = []
+        with self._lock:
+            for name, (help_text, label_names, buckets) in self.definitions.items():
+                lines.append(f'# HELP {name} {help_text}')
+                lines.append(f'# TYPE {name} histogram')
+                for labels, histogram in sorted(self.series[name].items()):
+                    pairs = [f'{key}="{escape_label(value)}"' for key, value in zip(label_names, labels)]
+                    cumulative = 0
+                    for bound, count in zip((*buckets, '+Inf'), histogram.counts):
+                        cumulative += count
+                        bucket_labels = ','.join([*pairs, f'le="{bound}"'])
+                        lines.append(f'{name}_bucket{{{bucket_labels}}} {cumulative}')
+                    label_text = ','.join(pairs)
+                    lines.append(f'{name}_sum{{{label_text}}} {histogram.sum:.6f}')
+                    lines.append(f'{name}_count{{{label_text}}} {histogram.count}')
+        return '\n'.join(lines) + '\n'
+
+
+def escape_label(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+registry = MetricsRegistry()
+VIEW_LABELS = ('view', 'method')
+registry.define('http_request_duration_seconds', 'Wall time per request.', (*VIEW_LABELS, 'status'),
+                DURATION_BUCKETS)
+registry.define('http_request_db_queries', 'Database queries per request.', VIEW_LABELS, QUERY_BUCKETS)
+registry.define('http_request_db_duration_seconds', 'Time spent in database queries per request.',
+                VIEW_LABELS, DURATION_BUCKETS)
+registry.define('http_request_serialize_duration_seconds', 'Time spent building serializer data per request.',
+                VIEW_LABELS, DURATION_BUCKETS)
+registry.define('http_request_render_duration_seconds', 'Time spent rendering the response body.',
+                VIEW_LABELS, DURATION_BUCKETS)
+registry.define('http_response_size_bytes', 'Response body size.', VIEW_LABELS, SIZE_BUCKETS)
+
+
+class RequestStats:
+    __slots__ = ('queries', 'db_time', 'serialize_time', 'render_time', 'serializer_depth')
+
+    def __init__(self):
+        self.queries = 0
+        self.db_time = 0.0
+        self.serialize_time = 0.0
+        self.render_time = 0.0
+        self.serializer_depth = 0
+
+
+current_stats = ContextVar('request_stats', default=None)
+
+
+def record_query(execute, sql, params, many, context):
+    """``connection.execute_wrapper`` hook, installed on every connection."""
+    stats = current_stats.get()
+    if stats is None:
+        return execute(sql, params, many, context)
+    started = time.perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        stats.db_time += time.perf_counter() - started
+        stats.queries += 1
+
+
+def install_query_recorder(sender, connection, **kwargs):
+    """``connection_created`` receiver; reconnects reuse the wrapper list."""
+    if record_query not in connection.execute_wrappers:
+        connection.execute_wrappers.append(record_query)
+
+
+class TimedSerializerMixin:
+    """
+    Add the time spent in ``to_representation`` to the current request.
+    Nested serializers are counted once, as part of the outermost one; a
+    ``many=True`` list is the sum of its items.
+    """
+
+    def to_representation(self, instance):
+        stats = current_stats.get()
+        if stats is None:
+            return super().to_representation(instance)
+        stats.serializer_depth += 1
+        started = time.perf_counter()
+        try:
+            return super().to_representation(instance)
+        finally:
+            stats.serializer_depth -= 1
+            if stats.serializer_depth == 0:
+                stats.serialize_time += time.perf_counter() - started
+
+
+class SamplingProfiler:
+    """
+    Sample one thread's Python stack every ``interval`` seconds and report
+    the samples as folded stacks (``frame;frame;frame count``), the input
+    format of flamegraph.pl and speedscope.
+    """
+
+    def __init__(self, thread_id, interval=0.001):
+        self.thread_id = thread_id
+        self.interval = interval
+        self.samples = collections.Counter()
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self.run, name='request-profiler', daemon=True)
+
+    def run(self):
+        while not self._stop.wait(self.interval):
+            frame = sys._current_frames().get(self.thread_id)
+            stack = []
+            while frame is not None:
+                code = frame.f_code
+                stack.append(f'{code.co_name} ({code.co_filename}:{code.co_firstlineno})')
+                frame = frame.f_back
+            if stack:
+                self.samples[';'.join(reversed(stack))] += 1
+
+    def __enter__(self):
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc_info):
+        self._stop.set()
+        self._thread.join()
+
+    def folded(self):
+        return ''.join(f'{stack} {count}\n' for stack, count in self.samples.most_common())
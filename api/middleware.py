@@ -0,0 +1,109 @@
+import threading
+import time
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.http import HttpResponse
+from rest_framework.exceptions import AuthenticationFailed
+
+from .authentication import StatelessJWTAuthentication
+from .metrics import RequestStats, SamplingProfiler, current_stats, registry
+
+
+class MetricsMiddleware:
+    """
+    Record wall time, database queries and time, serializer and render time
+    and response size per view (see ``api.metrics``).
+
+    Staff can add ``?profile=1`` to any request to get the folded stacks of a
+    sampling profile of that request instead of its normal response. Under
+    ASGI only the event-loop thread is sampled, so profile sync views under
+    WSGI.
+    """
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.is_async = iscoroutinefunction(get_response)
+        if self.is_async:
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if self.is_async:
+            return self.__acall__(request)
+        profiler = self.profiler_for(request)
+        stats = RequestStats()
+        token = current_stats.set(stats)
+        started = time.perf_counter()
+        try:
+            if profiler is None:
+                response = self.get_response(request)
+            else:
+                with profiler:
+                    response = self.get_response(request)
+        finally:
+            current_stats.reset(token)
+        return self.finish(request, response, stats, time.perf_counter() - started, profiler)
+
+    async def __acall__(self, request):
+        profiler = self.profiler_for(request)
+        stats = RequestStats()
+        token = current_stats.set(stats)
+        started = time.perf_counter()
+        try:
+            if profiler is None:
+                response = await self.get_response(request)
+            else:
+                with profiler:
+                    response = await self.get_response(request)
+        finally:
+            current_stats.reset(token)
+        return self.finish(request, response, stats, time.perf_counter() - started, profiler)
+
+    def process_template_response(self, request, response):
+        # Runs last of all middleware, right before the response is rendered.
+        stats = current_stats.get()
+        if stats is not None:
+            started = time.perf_counter()
+
+            def rendered(response):
+                stats.render_time += time.perf_counter() - started
+
+            response.add_post_render_callback(rendered)
+        return response
+
+    def profiler_for(self, request):
+        if request.GET.get('profile') != '1':
+            return None
+        user = getattr(request, 'user', None)
+        if user is None or not user.is_authenticated:
+            try:
+                authenticated = StatelessJWTAuthentication().authenticate(request)
+            except AuthenticationFailed:
+                return None
+            user = authenticated[0] if authenticated else None
+        if user is None or not user.is_staff:
+            return None
+        return SamplingProfiler(threading.get_ident())
+
+    def finish(self, request, response, stats, elapsed, profiler):
+        match = request.resolver_match
+        labels = (match.view_name if match else 'unmatched', request.method)
+        registry.observe('http_request_duration_seconds', (*labels, str(response.status_code)), elapsed)
+        registry.observe('http_request_db_queries', labels, stats.queries)
+        registry.observe('http_request_db_duration_seconds', labels, stats.db_time)
+        registry.observe('http_request_serialize_duration_seconds', labels, stats.serialize_time)
+        registry.observe('http_request_render_duration_seconds', labels, stats.render_time)
+        if response.streaming:
+            size = response.get('Content-Length')
+        else:
+            size = len(response.content)
+        if size is not None:
+            registry.observe('http_response_size_bytes', labels, int(size))
+
+        if profiler is None:
+            return response
+        profile = HttpResponse(profiler.folded(), content_type='text/plain; charset=utf-8')
+        profile['X-Profile-Samples'] = str(sum(profiler.samples.values()))
+        profile['X-Profile-Status'] = str(response.status_code)
+        return profile
@@ -0,0 +1,17 @@
+# Generated by Django 5.1.4 on 2026-10-18 16:10
+
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0002_index_pagination_columns'),
+    ]
+
+    operations = [
+        migrations.RemoveField(
+            model_name='products',
+            name='is_favorite',
+        ),
+    ]
@@ -0,0 +1,74 @@
+# Generated by Django 5.1.4 on 2026-10-18 16:17
+
+from django.db import migrations, models
+from django.db.models import Case, Count, F, FloatField, OuterRef, Subquery, Sum, Value, When
+from django.db.models.functions import Cast, Coalesce
+
+
+def mean_from_totals():
+    return Case(
+        When(rating_count=0, then=Value(None)),
+        default=Cast(F('rating_sum'), FloatField()) / F('rating_count'),
+        output_field=FloatField(),
+    )
+
+
+def backfill_ratings(apps, schema_editor):
+    # Existing reviews, as api.ratings.rebuild_ratings counted them when this
+    # migration was written.
+    Products = apps.get_model('api', 'Products')
+    ChefsData = apps.get_model('api', 'ChefsData')
+    Review = apps.get_model('api', 'Review')
+    reviews = Review.objects.filter(product=OuterRef('pk')).order_by().values('product')
+    products = Products.objects.filter(chefs=OuterRef('pk')).order_by().values('chefs')
+    Products.objects.update(
+        rating_sum=Coalesce(Subquery(reviews.annotate(total=Sum('rating')).values('total')), 0),
+        rating_count=Coalesce(Subquery(reviews.annotate(total=Count('id')).values('total')), 0),
+    )
+    Products.objects.update(rating=mean_from_totals())
+    ChefsData.objects.update(
+        rating_sum=Coalesce(Subquery(products.annotate(total=Sum('rating_sum')).values('total')), 0),
+        rating_count=Coalesce(Subquery(products.annotate(total=Sum('rating_count')).values('total')), 0),
+    )
+    ChefsData.objects.update(rating=mean_from_totals())
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0003_remove_products_is_favorite'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='chefsdata',
+            name='rating_count',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='chefsdata',
+            name='rating_sum',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='products',
+            name='rating_count',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='products',
+            name='rating_sum',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AlterField(
+            model_name='chefsdata',
+            name='rating',
+            field=models.FloatField(blank=True, db_index=True, null=True),
+        ),
+        migrations.AlterField(
+            model_name='products',
+            name='rating',
+            field=models.FloatField(blank=True, db_index=True, null=True),
+        ),
+        migrations.RunPython(backfill_ratings, migrations.RunPython.noop),
+    ]
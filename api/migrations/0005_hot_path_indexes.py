@@ -0,0 +1,37 @@
+# Generated by Django 5.1.4 on 2026-10-18 16:18
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0004_rating_aggregates'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='ads',
+            index=models.Index(fields=['is_active', 'start_date', 'end_date'], name='ads_active_window_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='order',
+            index=models.Index(fields=['user', 'order_date'], name='order_user_date_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='order',
+            index=models.Index(fields=['status', 'order_date'], name='order_status_date_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='products',
+            index=models.Index(fields=['category', 'is_available', 'price'], name='product_menu_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='review',
+            index=models.Index(fields=['product', 'review_date'], name='review_product_date_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='userfavorites',
+            index=models.Index(fields=['user', 'added_at'], name='favorite_user_added_idx'),
+        ),
+    ]
@@ -0,0 +1,68 @@
+from django.db import migrations
+
+# The SQL as it stood when this migration was written; api.search may change
+# later, this must not.
+SQLITE_TABLE = 'api_products_fts'
+SQLITE_TRIGGERS = {
+    'api_products_fts_insert': (
+        "CREATE TRIGGER IF NOT EXISTS api_products_fts_insert AFTER INSERT ON api_products BEGIN "
+        "INSERT INTO api_products_fts(rowid, name, description, ingredients) "
+        "VALUES (new.id, new.name, new.description, new.ingredients); END"
+    ),
+    'api_products_fts_delete': (
+        "CREATE TRIGGER IF NOT EXISTS api_products_fts_delete AFTER DELETE ON api_products BEGIN "
+        "INSERT INTO api_products_fts(api_products_fts, rowid, name, description, ingredients) "
+        "VALUES ('delete', old.id, old.name, old.description, old.ingredients); END"
+    ),
+    'api_products_fts_update': (
+        "CREATE TRIGGER IF NOT EXISTS api_products_fts_update "
+        "AFTER UPDATE OF name, description, ingredients ON api_products BEGIN "
+        "INSERT INTO api_products_fts(api_products_fts, rowid, name, description, ingredients) "
+        "VALUES ('delete', old.id, old.name, old.description, old.ingredients); "
+        "INSERT INTO api_products_fts(rowid, name, description, ingredients) "
+        "VALUES (new.id, new.name, new.description, new.ingredients); END"
+    ),
+}
+POSTGRES_INDEX = 'api_products_search_idx'
+
+
+def create_index(apps, schema_editor):
+    connection = schema_editor.connection
+    with connection.cursor() as cursor:
+        if connection.vendor == 'sqlite':
+            cursor.execute(
+                "CREATE VIRTUAL TABLE IF NOT EXISTS api_products_fts USING fts5("
+                "name, description, ingredients, content='api_products', content_rowid='id', "
+                "tokenize='porter unicode61')"
+            )
+            for sql in SQLITE_TRIGGERS.values():
+                cursor.execute(sql)
+            cursor.execute("INSERT INTO api_products_fts(api_products_fts) VALUES ('rebuild')")
+        elif connection.vendor == 'postgresql':
+            cursor.execute(
+                f"CREATE INDEX IF NOT EXISTS {POSTGRES_INDEX} ON api_products USING GIN ("
+                "to_tsvector('english', coalesce(name, '') || ' ' || coalesce(description, '') "
+                "|| ' ' || coalesce(ingredients, '')))"
+            )
+
+
+def drop_index(apps, schema_editor):
+    connection = schema_editor.connection
+    with connection.cursor() as cursor:
+        if connection.vendor == 'sqlite':
+            for name in SQLITE_TRIGGERS:
+                cursor.execute(f'DROP TRIGGER IF EXISTS {name}')
+            cursor.execute(f'DROP TABLE IF EXISTS {SQLITE_TABLE}')
+        elif connection.vendor == 'postgresql':
+            cursor.execute(f'DROP INDEX IF EXISTS {POSTGRES_INDEX}')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0005_hot_path_indexes'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_index, drop_index),
+    ]
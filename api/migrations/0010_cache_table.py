@@ -0,0 +1,20 @@
+from django.core.management import call_command
+from django.db import migrations
+
+
+def create_cache_table(apps, schema_editor):
+    # Without REDIS_URL the default cache is a DatabaseCache (see settings);
+    # the JWT denylist and catalog versions live in it, so requests fail
+    # until its table exists. A no-op for other backends or an existing table.
+    call_command('createcachetable', database=schema_editor.connection.alias, verbosity=0)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0009_stock_reservations'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_cache_table, migrations.RunPython.noop),
+    ]
@@ -10,6 +10,7 @@ class CustomUser(AbstractUser):
         blank=True,
         null=True
     )
+    image_variants = models.JSONField(default=dict, blank=True, editable=False)
 
 class Category(models.Model):
     name = models.CharField(max_length=50)
@@ -19,6 +20,7 @@ class Category(models.Model):
         blank=True,
         null=True
     )
+    image_variants = models.JSONField(default=dict, blank=True, editable=False)
 
     def __str__(self):
         return self.name
@@ -33,16 +35,31 @@ class Products(models.Model):
     allergens = models.TextField(blank=True, null=True)
     description = models.TextField(blank=True, null=True)
     image = models.ImageField(upload_to='products/', blank=True, null=True)
+    image_variants = models.JSONField(default=dict, blank=True, editable=False)
     category = models.ForeignKey(Category, on_delete=models.SET_NULL, null=True, blank=True)
     quantity = models.PositiveIntegerField(default=0)
     is_available = models.BooleanField(default=True)
-    is_favorite = models.BooleanField(default=False)
     chefs = models.ForeignKey('ChefsData', on_delete=models.SET_NULL, null=True, blank=True)
-    rating = models.FloatField(blank=True, null=True)
+    # Maintained from Review writes by api.ratings; rating is the mean.
+    rating = models.FloatField(blank=True, null=True, db_index=True)
+    rating_sum = models.PositiveIntegerField(default=0)
+    rating_count = models.PositiveIntegerField(default=0)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['category', 'is_available', 'price'], name='product_menu_idx'),
+        ]
 
     def __str__(self):
         return self.name
 
+    @property
+    def unit_price(self):
+        """Price charged per unit: ``price`` less the ``discount`` percentage."""
+        if not self.discount:
+            return self.price
+        return round(self.price * (1 - self.discount / 100), 2)
+
 class Order(models.Model):
     STATUS_CHOICES = [
         ('Pending', 'Pending'),
@@ -50,10 +67,16 @@ class Order(models.Model):
         ('Cancelled', 'Cancelled'),
     ]
     user = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE)
-    order_date = models.DateTimeField(auto_now_add=True)
+    order_date = models.DateTimeField(auto_now_add=True, db_index=True)
     status = models.CharField(max_length=50, choices=STATUS_CHOICES, default='Pending')
     total = models.FloatField()
 
+    class Meta:
+        indexes = [
+            models.Index(fields=['user', 'order_date'], name='order_user_date_idx'),
+            models.Index(fields=['status', 'order_date'], name='order_status_date_idx'),
+        ]
+
     def __str__(self):
         return f"Order #{self.id} - {self.user.username}"
 
@@ -70,18 +93,23 @@ class Payment(models.Model):
     order = models.OneToOneField(Order, on_delete=models.CASCADE)
     payment_method = models.CharField(max_length=50)
     payment_status = models.CharField(max_length=50)
-    payment_date = models.DateTimeField(auto_now_add=True)
+    payment_date = models.DateTimeField(auto_now_add=True, db_index=True)
     amount = models.FloatField()
 
     def __str__(self):
-        return f"Payment for Order #{self.order.id}"
+        return f"Payment for Order #{self.order_id}"
 
 class Review(models.Model):
     user = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE)
     product = models.ForeignKey(Products, on_delete=models.CASCADE, null=True, blank=True)
     rating = models.PositiveIntegerField()
     comment = models.TextField(blank=True, null=True)
-    review_date = models.DateTimeField(auto_now_add=True)
+    review_date = models.DateTimeField(auto_now_add=True, db_index=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['product', 'review_date'], name='review_product_date_idx'),
+        ]
 
     def __str__(self):
         return f"Review by {self.user.username}"
@@ -89,9 +117,13 @@ class Review(models.Model):
 class ChefsData(models.Model):
     name = models.CharField(max_length=150)
     profile_picture = models.ImageField(upload_to='chefs/', blank=True, null=True)
+    profile_picture_variants = models.JSONField(default=dict, blank=True, editable=False)
     description = models.TextField(blank=True, null=True)
     text = models.TextField(blank=True, null=True)
-    rating = models.FloatField(blank=True, null=True)
+    # Rolled up from the reviews of the chef's products by api.ratings.
+    rating = models.FloatField(blank=True, null=True, db_index=True)
+    rating_sum = models.PositiveIntegerField(default=0)
+    rating_count = models.PositiveIntegerField(default=0)
 
     def __str__(self):
         return self.name
@@ -100,20 +132,29 @@ class Ads(models.Model):
     title = models.CharField(max_length=100)
     description = models.TextField()
     image = models.ImageField(upload_to='ads/', blank=True, null=True)
+    image_variants = models.JSONField(default=dict, blank=True, editable=False)
     start_date = models.DateTimeField()
     end_date = models.DateTimeField()
     is_active = models.BooleanField(default=True)
 
+    class Meta:
+        indexes = [
+            models.Index(fields=['is_active', 'start_date', 'end_date'], name='ads_active_window_idx'),
+        ]
+
     def __str__(self):
         return self.title
     
 class UserFavorites(models.Model):
     user = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE)  
     product = models.ForeignKey(Products, on_delete=models.CASCADE)  
-    added_at = models.DateTimeField(auto_now_add=True)  
+    added_at = models.DateTimeField(auto_now_add=True, db_index=True)
 
     class Meta:
         unique_together = ('user', 'product') 
+        indexes = [
+            models.Index(fields=['user', 'added_at'], name='favorite_user_added_idx'),
+        ]
 
     def __str__(self):
         return f"{self.user.username}'s favorite: {self.product.name}"
@@ -131,3 +172,60 @@ class CartItem(models.Model):
 
     class Meta:
         unique_together = ('cart', 'product')
+
+class StockReservation(models.Model):
+    """
+    Units of a product held for a cart until ``expires_at`` (see
+    api.reservations). ``Products.quantity`` is the stock on hand; shoppers
+    can add what is left after the unexpired reservations.
+    """
+    cart = models.ForeignKey(Cart, on_delete=models.CASCADE, related_name='reservations')
+    product = models.ForeignKey('Products', on_delete=models.CASCADE, related_name='reservations')
+    quantity = models.PositiveIntegerField()
+    expires_at = models.DateTimeField()
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['cart', 'product'], name='stock_reservation_unique'),
+        ]
+        indexes = [
+            models.Index(fields=['product', 'expires_at'], name='reservation_product_exp_idx'),
+            models.Index(fields=['expires_at'], name='reservation_expires_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.quantity} x product {self.product_id} for cart {self.cart_id}"
+
+class SalesRollup(models.Model):
+    """
+    Revenue, orders and units of one product, category or chef in one hour
+    or day, maintained by api.rollups. ``key`` is the id of the dimension's
+    object; 0 collects products without a category or chef.
+    """
+    PERIOD_CHOICES = [('hour', 'Hour'), ('day', 'Day')]
+    DIMENSION_CHOICES = [('product', 'Product'), ('category', 'Category'), ('chef', 'Chef')]
+
+    period = models.CharField(max_length=4, choices=PERIOD_CHOICES)
+    dimension = models.CharField(max_length=8, choices=DIMENSION_CHOICES)
+    key = models.PositiveBigIntegerField()
+    bucket = models.DateTimeField()
+    orders = models.PositiveIntegerField()
+    units = models.PositiveIntegerField()
+    revenue = models.FloatField()
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['period', 'dimension', 'bucket', 'key'], name='sales_rollup_unique'),
+        ]
+
+    def __str__(self):
+        return f"{self.dimension} {self.key} {self.period} {self.bucket:%Y-%m-%d %H:%M}"
+
+class RollupState(models.Model):
+    """How far a rollup has been refreshed: everything before ``high_water_mark``."""
+    name = models.CharField(max_length=50, unique=True)
+    high_water_mark = models.DateTimeField(null=True, blank=True)
+    refreshed_at = models.DateTimeField(null=True, blank=True)
+
+    def __str__(self):
+        return self.name
@@ -0,0 +1,131 @@
+from django.db import transaction
+from django.db.models import (
+    Case, Count, F, FloatField, IntegerField, Prefetch, Q, Sum, Value, When, prefetch_related_objects,
+)
+from django.db.models.functions import TruncMonth
+from rest_framework import serializers
+
+from .cache import bump_catalog_version
+from .db import retry_on_lock
+from .models import Order, OrderItem, Products
+from .reservations import available_stock, release_cart, reserved_elsewhere, stock_errors
+
+
+def merge_lines(lines):
+    """Collapse ``(product_id, quantity)`` pairs into ``{product_id: quantity}``."""
+    quantities = {}
+    for product_id, quantity in lines:
+        quantities[product_id] = quantities.get(product_id, 0) + quantity
+    return quantities
+
+
+def quantity_case(quantities, field='pk'):
+    """A CASE expression mapping each product id in ``field`` to its quantity."""
+    return Case(
+        *(When(**{field: product_id}, then=Value(quantity)) for product_id, quantity in quantities.items()),
+        output_field=IntegerField(),
+    )
+
+
+def take_stock(quantities, cart_id=None):
+    """
+    Take ``quantities`` out of stock with one conditional UPDATE, or raise a
+    ValidationError naming every line that cannot be filled.
+
+    The check and the decrement happen in the same statement, so concurrent
+    checkouts cannot oversell a product. Units reserved by other carts than
+    ``cart_id`` are not for sale (see api.reservations).
+    """
+    requested = quantity_case(quantities)
+    updated = Products.objects.filter(
+        pk__in=quantities, is_available=True, quantity__gte=requested + reserved_elsewhere(cart_id),
+    ).update(quantity=F('quantity') - requested)
+    if updated == len(quantities):
+        return
+    raise serializers.ValidationError({'items': stock_errors(quantities, available_stock(quantities, cart_id))})
+
+
+@retry_on_lock
+def place_order(user_id, lines, status='Pending', cart_id=None):
+    """
+    Create an order for ``lines`` (``(product_id, quantity)`` pairs) in one
+    transaction: stock is decremented first, then prices and the total are
+    computed from the current product rows and the items are bulk-inserted.
+    An order checked out from ``cart_id`` may use the cart's reservations,
+    which the sale replaces.
+    """
+    quantities = merge_lines(lines)
+    if not quantities:
+        raise serializers.ValidationError({'items': 'An order needs at least one item.'})
+
+    with transaction.atomic():
+        # Writing first takes SQLite's write lock up front, so concurrent
+        # checkouts queue on the busy timeout instead of failing to upgrade
+        # a read lock.
+        take_stock(quantities, cart_id)
+        products = Products.objects.in_bulk(quantities)
+        total = round(sum(products[pk].unit_price * qty for pk, qty in quantities.items()), 2)
+        order = Order.objects.create(user_id=user_id, status=status, total=total)
+        OrderItem.objects.bulk_create(
+            OrderItem(order=order, product_id=pk, quantity=qty, price=products[pk].unit_price)
+            for pk, qty in quantities.items()
+        )
+        if cart_id is not None:
+            release_cart(cart_id)
+        transaction.on_commit(lambda: bump_catalog_version('products'))
+    return order
+
+
+def order_items_prefetch():
+    """An order's items with their product names, fetched in one query."""
+    return Prefetch('items', queryset=OrderItem.objects.select_related('product').only(
+        'order', 'product', 'quantity', 'price', 'product__name',
+    ).order_by('id'))
+
+
+def orders_with_items():
+    return Order.objects.prefetch_related(order_items_prefetch())
+
+
+def prefetch_order_items(order):
+    """Load a new order's items for serializing, with one query."""
+    prefetch_related_objects([order], order_items_prefetch())
+    return order
+
+
+def order_summary(orders, top=5):
+    """
+    Totals over the ``orders`` queryset, computed in the database with three
+    queries however many orders there are. Cancelled orders are counted but
+    do not add to spend or to the top products.
+    """
+    paid = ~Q(status='Cancelled')
+    totals = orders.aggregate(
+        orders=Count('id'),
+        cancelled=Count('id', filter=~paid),
+        spend=Sum('total', filter=paid, default=0.0),
+    )
+    monthly = (
+        orders.filter(paid).annotate(month=TruncMonth('order_date')).values('month')
+        .annotate(orders=Count('id'), spend=Sum('total')).order_by('month')
+    )
+    top_products = (
+        OrderItem.objects.filter(order__in=orders.filter(paid))
+        .values('product_id', 'product__name')
+        .annotate(units=Sum('quantity'), spend=Sum(F('quantity') * F('price'), output_field=FloatField()))
+        .order_by('-units', 'product_id')[:top]
+    )
+    return {
+        'orders': totals['orders'],
+        'cancelled': totals['cancelled'],
+        'lifetime_spend': round(totals['spend'], 2),
+        'monthly': [
+            {'month': row['month'].strftime('%Y-%m'), 'orders': row['orders'], 'spend': round(row['spend'], 2)}
+            for row in monthly
+        ],
+        'top_products': [
+            {'product': row['product_id'], 'name': row['product__name'],
+             'quantity': row['units'], 'spend': round(row['spend'], 2)}
+            for row in top_products
+        ],
+    }
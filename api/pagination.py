@@ -0,0 +1,64 @@
+from rest_framework.pagination import CursorPagination, LimitOffsetPagination
+
+
+class KeysetPagination(CursorPagination):
+    """
+    Cursor pagination on the view's ``ordering`` (an indexed column), so the
+    cost of fetching a page does not depend on how deep the client has paged.
+    The ordering must be unique: end it with the primary key, or rows that
+    tie on the first column can be skipped or repeated between pages.
+
+    Clients that need random access can send ``limit``/``offset`` instead and
+    get classic limit/offset pages over the same ordering. Views with a
+    per-request ordering implement ``get_ordering()``; orderings that start
+    on a nullable column always use limit/offset, since a cursor cannot
+    encode a NULL position.
+    """
+    page_size_query_param = 'page_size'
+    max_page_size = 100
+    ordering = '-id'
+    offset_query_params = ('limit', 'offset')
+
+    def __init__(self):
+        self.offset_paginator = None
+
+    def get_ordering(self, request, queryset, view):
+        if hasattr(view, 'get_ordering'):
+            ordering = view.get_ordering()
+        else:
+            ordering = getattr(view, 'ordering', None) or self.ordering
+        if isinstance(ordering, str):
+            return (ordering,)
+        return tuple(ordering)
+
+    def use_offset_pagination(self, request, queryset, view):
+        if any(param in request.query_params for param in self.offset_query_params):
+            return True
+        field_name = self.get_ordering(request, queryset, view)[0].lstrip('-')
+        return queryset.model._meta.get_field(field_name).null
+
+    def paginate_queryset(self, queryset, request, view=None):
+        if self.use_offset_pagination(request, queryset, view):
+            self.offset_paginator = LimitOffsetPagination()
+            self.offset_paginator.default_limit = self.page_size
+            self.offset_paginator.max_limit = self.max_page_size
+            ordering = self.get_ordering(request, queryset, view)
+            return self.offset_paginator.paginate_queryset(
+                queryset.order_by(*ordering), request, view
+            )
+        return super().paginate_queryset(queryset, request, view)
+
+    def get_paginated_response(self, data):
+        if self.offset_paginator is not None:
+            return self.offset_paginator.get_paginated_response(data)
+        return super().get_paginated_response(data)
+
+    def get_html_context(self):
+        if self.offset_paginator is not None:
+            return self.offset_paginator.get_html_context()
+        return super().get_html_context()
+
+    def to_html(self):
+        if self.offset_paginator is not None:
+            return self.offset_paginator.to_html()
+        return super().to_html()
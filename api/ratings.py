@@ -0,0 +1,107 @@
+from django.db import transaction
+from django.db.models import Case, Count, F, FloatField, OuterRef, Subquery, Sum, Value, When
+from django.db.models.functions import Cast, Coalesce
+
+from .cache import bump_catalog_version
+from .models import ChefsData, Products, Review
+
+
+def rating_updates(sum_delta, count_delta):
+    """
+    UPDATE assignments that move ``rating_sum``/``rating_count`` by the given
+    deltas and recompute the mean from the new values in the same statement
+    (the right-hand sides all see the row as it was before the update).
+    """
+    new_sum = F('rating_sum') + sum_delta
+    new_count = F('rating_count') + count_delta
+    return {
+        'rating_sum': new_sum,
+        'rating_count': new_count,
+        'rating': Case(
+            When(rating_count__lte=-count_delta, then=Value(None)),
+            default=Cast(new_sum, FloatField()) / new_count,
+            output_field=FloatField(),
+        ),
+    }
+
+
+def apply_rating_delta(product_id, sum_delta, count_delta):
+    """Apply a review change to its product and roll it up to the product's chef."""
+    if product_id is None or (sum_delta == 0 and count_delta == 0):
+        return
+    updates = rating_updates(sum_delta, count_delta)
+    with transaction.atomic():
+        Products.objects.filter(pk=product_id).update(**updates)
+        chef_id = Products.objects.filter(pk=product_id).values('chefs_id')
+        ChefsData.objects.filter(pk=Subquery(chef_id)).update(**updates)
+        transaction.on_commit(lambda: bump_catalog_version('products', 'chefs'))
+
+
+def review_created(review):
+    apply_rating_delta(review.product_id, review.rating, 1)
+
+
+def review_deleted(review):
+    apply_rating_delta(review.product_id, -review.rating, -1)
+
+
+def review_updated(old_product_id, old_rating, review):
+    if old_product_id == review.product_id:
+        apply_rating_delta(review.product_id, review.rating - old_rating, 0)
+    else:
+        apply_rating_delta(old_product_id, -old_rating, -1)
+        apply_rating_delta(review.product_id, review.rating, 1)
+
+
+def product_chef_changed(product_id, old_chef_id, new_chef_id):
+    """Move a product's rating totals from its previous chef to its new one."""
+    with transaction.atomic():
+        rating_sum, rating_count = Products.objects.select_for_update().filter(pk=product_id).values_list(
+            'rating_sum', 'rating_count'
+        ).get()
+        if rating_count == 0:
+            return
+        if old_chef_id is not None:
+            ChefsData.objects.filter(pk=old_chef_id).update(**rating_updates(-rating_sum, -rating_count))
+        if new_chef_id is not None:
+            ChefsData.objects.filter(pk=new_chef_id).update(**rating_updates(rating_sum, rating_count))
+        transaction.on_commit(lambda: bump_catalog_version('chefs'))
+
+
+def product_deleting(product_id):
+    """
+    Take a product's rating totals out of its chef before the product is
+    deleted. The product is detached from the chef first, so the reviews
+    deleted with it no longer reach the chef, whichever goes first.
+    """
+    with transaction.atomic():
+        chef_id = Products.objects.filter(pk=product_id).values_list('chefs_id', flat=True).first()
+        if chef_id is not None:
+            Products.objects.filter(pk=product_id).update(chefs=None)
+            product_chef_changed(product_id, chef_id, None)
+
+
+def mean_from_totals():
+    return Case(
+        When(rating_count=0, then=Value(None)),
+        default=Cast(F('rating_sum'), FloatField()) / F('rating_count'),
+        output_field=FloatField(),
+    )
+
+
+def rebuild_ratings():
+    """Recompute every product and chef aggregate from the Review table."""
+    reviews = Review.objects.filter(product=OuterRef('pk')).order_by().values('product')
+    products = Products.objects.filter(chefs=OuterRef('pk')).order_by().values('chefs')
+    with transaction.atomic():
+        Products.objects.update(
+            rating_sum=Coalesce(Subquery(reviews.annotate(total=Sum('rating')).values('total')), 0),
+            rating_count=Coalesce(Subquery(reviews.annotate(total=Count('id')).values('total')), 0),
+        )
+        Products.objects.update(rating=mean_from_totals())
+        ChefsData.objects.update(
+            rating_sum=Coalesce(Subquery(products.annotate(total=Sum('rating_sum')).values('total')), 0),
+            rating_count=Coalesce(Subquery(products.annotate(total=Sum('rating_count')).values('total')), 0),
+        )
+        ChefsData.objects.update(rating=mean_from_totals())
+        transaction.on_commit(lambda: bump_catalog_version('products', 'chefs'))
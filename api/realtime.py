@@ -0,0 +1,61 @@
+"""
+Push order and payment status changes to the owning user over WebSockets.
+
+Each connected client joins its user's group (``user_group``). Saving an
+Order or Payment whose status changed sends one event to that group after
+the transaction commits (see ``api.signals``), so clients no longer need to
+poll ``/api/orders/``.
+"""
+from urllib.parse import parse_qs
+
+from asgiref.sync import async_to_sync
+from channels.db import database_sync_to_async
+from channels.layers import get_channel_layer
+from channels.middleware import BaseMiddleware
+from django.contrib.auth.models import AnonymousUser
+from django.db import transaction
+from rest_framework_simplejwt.exceptions import TokenError
+from rest_framework_simplejwt.models import TokenUser
+from rest_framework_simplejwt.settings import api_settings as jwt_settings
+from rest_framework_simplejwt.tokens import AccessToken
+
+from .authentication import is_revoked
+
+
+def user_group(user_id):
+    return f'orders.user.{user_id}'
+
+
+def push_status(user_id, payload):
+    """Send ``payload`` to the user's sockets once the current transaction commits."""
+    channel_layer = get_channel_layer()
+    if channel_layer is None:
+        return
+    message = {'type': 'status.changed', 'payload': payload}
+    transaction.on_commit(lambda: async_to_sync(channel_layer.group_send)(user_group(user_id), message))
+
+
+def user_for_token(raw_token):
+    try:
+        token = AccessToken(raw_token)
+    except TokenError:
+        return AnonymousUser()
+    if is_revoked(token) or jwt_settings.USER_ID_CLAIM not in token:
+        return AnonymousUser()
+    return TokenUser(token)
+
+
+class JWTQueryStringAuthMiddleware(BaseMiddleware):
+    """
+    Authenticate sockets from an access token in ``?token=``: browsers cannot
+    set an Authorization header on a WebSocket handshake. Cookies are never
+    consulted, so cross-site pages cannot open sockets as the user.
+    """
+
+    async def __call__(self, scope, receive, send):
+        query = parse_qs(scope.get('query_string', b'').decode())
+        tokens = query.get('token')
+        # The denylist may live in the database cache.
+        user = await database_sync_to_async(user_for_token)(tokens[0]) if tokens else AnonymousUser()
+        scope = dict(scope, user=user)
+        return await super().__call__(scope, receive, send)
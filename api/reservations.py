@@ -0,0 +1,138 @@
+"""
+Stock held for carts.
+
+Adding to a cart reserves the line's units for ``STOCK_RESERVATION_TTL``,
+and every change to the cart renews its unexpired reservations. What a
+shopper can still add is the product's ``quantity`` (stock on hand) less the
+unexpired reservations of other carts, summed in the same query over the
+(product, expires_at) index. Checkout converts the cart's reservations into
+the sale: stock is decremented and the reservations deleted in one
+transaction. A reservation stops counting the moment it expires;
+``release_expired_reservations`` deletes the expired rows in bulk.
+"""
+from datetime import timedelta
+
+from django.conf import settings
+from django.db.models import F, OuterRef, Subquery, Sum, Value
+from django.db.models.functions import Coalesce
+from django.utils import timezone
+from rest_framework import serializers
+
+from .db import retry_on_lock
+from .models import Products, StockReservation
+
+DEFAULT_TTL = timedelta(minutes=15)
+RELEASE_BATCH_SIZE = 5000
+
+
+def reservation_ttl():
+    return getattr(settings, 'STOCK_RESERVATION_TTL', DEFAULT_TTL)
+
+
+def reserved_elsewhere(cart_id=None, now=None):
+    """
+    The units of product ``OuterRef('pk')`` held by unexpired reservations,
+    leaving out those of ``cart_id``.
+    """
+    reservations = StockReservation.objects.filter(product=OuterRef('pk'), expires_at__gt=now or timezone.now())
+    if cart_id is not None:
+        reservations = reservations.exclude(cart_id=cart_id)
+    held = reservations.order_by().values('product').annotate(units=Sum('quantity')).values('units')
+    return Coalesce(Subquery(held), Value(0))
+
+
+def available_stock(product_ids, cart_id=None, now=None, lock=False):
+    """
+    ``{product_id: (is_available, units)}`` where ``units`` is the stock not
+    reserved by other carts, read with one query. ``lock`` locks the product
+    rows until the transaction ends (a no-op on SQLite, where the writer
+    already holds the database lock).
+    """
+    products = Products.objects.filter(pk__in=product_ids)
+    if lock:
+        products = products.select_for_update().order_by('pk')
+    rows = products.annotate(units=F('quantity') - reserved_elsewhere(cart_id, now)).values_list(
+        'id', 'is_available', 'units',
+    )
+    return {product_id: (is_available, max(units, 0)) for product_id, is_available, units in rows}
+
+
+def stock_errors(quantities, available):
+    """
+    ``{product_id: message}`` for each of ``quantities`` that ``available``
+    (from ``available_stock``) cannot fill.
+    """
+    errors = {}
+    for product_id, quantity in quantities.items():
+        if product_id not in available:
+            errors[str(product_id)] = 'Product not found.'
+        elif not available[product_id][0]:
+            errors[str(product_id)] = 'Product is not available.'
+        elif available[product_id][1] < quantity:
+            errors[str(product_id)] = f'Only {available[product_id][1]} left in stock.'
+    return errors
+
+
+def reserve_for_cart(cart_id, quantities, now=None):
+    """
+    Hold ``{product_id: units}``, the cart's new line quantities, for
+    ``cart_id`` and renew its other unexpired reservations, or raise a
+    ValidationError naming every line that cannot be held. A quantity of 0
+    releases the line. Call it inside the transaction that changed the lines,
+    so a failure rolls them back.
+    """
+    now = now or timezone.now()
+    expires_at = now + reservation_ttl()
+    held = {pk: qty for pk, qty in quantities.items() if qty > 0}
+    released = [pk for pk, qty in quantities.items() if qty == 0]
+
+    if held:
+        errors = stock_errors(held, available_stock(held, cart_id, now, lock=True))
+        if errors:
+            raise serializers.ValidationError({'items': errors})
+        StockReservation.objects.bulk_create(
+            [StockReservation(cart_id=cart_id, product_id=pk, quantity=qty, expires_at=expires_at)
+             for pk, qty in held.items()],
+            update_conflicts=True,
+            unique_fields=['cart', 'product'],
+            update_fields=['quantity', 'expires_at'],
+        )
+    if released:
+        StockReservation.objects.filter(cart_id=cart_id, product_id__in=released).delete()
+    # Lapsed reservations stay lapsed: their units may be held by others now.
+    StockReservation.objects.filter(cart_id=cart_id, expires_at__gt=now).exclude(product_id__in=held).update(
+        expires_at=expires_at
+    )
+
+
+def release_cart(cart_id, product_ids=None):
+    reservations = StockReservation.objects.filter(cart_id=cart_id)
+    if product_ids is not None:
+        reservations = reservations.filter(product_id__in=product_ids)
+    reservations.delete()
+
+
+@retry_on_lock
+def release_batch(now, batch_size):
+    ids = list(
+        StockReservation.objects.filter(expires_at__lte=now).order_by().values_list('id', flat=True)[:batch_size]
+    )
+    if not ids:
+        return 0, 0
+    # Rechecked, in case a cart renewed a reservation after it was read.
+    released, _ = StockReservation.objects.filter(pk__in=ids, expires_at__lte=now).delete()
+    return len(ids), released
+
+
+def release_expired(now=None, batch_size=RELEASE_BATCH_SIZE):
+    """
+    Delete the reservations that expired by ``now``, ``batch_size`` rows per
+    short transaction, and return how many were deleted.
+    """
+    now = now or timezone.now()
+    total = 0
+    while True:
+        read, released = release_batch(now, batch_size)
+        total += released
+        if read < batch_size:
+            return total
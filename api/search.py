@@ -0,0 +1,98 @@
+"""
+Full-text search over product name, description and ingredients.
+
+SQLite uses an external-content FTS5 table kept in sync by triggers;
+PostgreSQL uses a GIN index on the same ``to_tsvector`` expression the query
+filters on. Other backends fall back to ``icontains``.
+"""
+import re
+
+from django.db import connections
+from django.db.models import BooleanField, Q
+from django.db.models.expressions import RawSQL
+
+SEARCH_FIELDS = ('name', 'description', 'ingredients')
+
+SQLITE_TABLE = 'api_products_fts'
+SQLITE_CREATE_TABLE = (
+    f"CREATE VIRTUAL TABLE IF NOT EXISTS {SQLITE_TABLE} USING fts5("
+    f"{', '.join(SEARCH_FIELDS)}, content='api_products', content_rowid='id', "
+    "tokenize='porter unicode61')"
+)
+SQLITE_TRIGGERS = {
+    f'{SQLITE_TABLE}_insert': (
+        f"CREATE TRIGGER IF NOT EXISTS {SQLITE_TABLE}_insert AFTER INSERT ON api_products BEGIN "
+        f"INSERT INTO {SQLITE_TABLE}(rowid, name, description, ingredients) "
+        "VALUES (new.id, new.name, new.description, new.ingredients); END"
+    ),
+    f'{SQLITE_TABLE}_delete': (
+        f"CREATE TRIGGER IF NOT EXISTS {SQLITE_TABLE}_delete AFTER DELETE ON api_products BEGIN "
+        f"INSERT INTO {SQLITE_TABLE}({SQLITE_TABLE}, rowid, name, description, ingredients) "
+        "VALUES ('delete', old.id, old.name, old.description, old.ingredients); END"
+    ),
+    # Only text changes touch the index; stock and price updates skip it.
+    f'{SQLITE_TABLE}_update': (
+        f"CREATE TRIGGER IF NOT EXISTS {SQLITE_TABLE}_update "
+        "AFTER UPDATE OF name, description, ingredients ON api_products BEGIN "
+        f"INSERT INTO {SQLITE_TABLE}({SQLITE_TABLE}, rowid, name, description, ingredients) "
+        "VALUES ('delete', old.id, old.name, old.description, old.ingredients); "
+        f"INSERT INTO {SQLITE_TABLE}(rowid, name, description, ingredients) "
+        "VALUES (new.id, new.name, new.description, new.ingredients); END"
+    ),
+}
+SQLITE_REBUILD = f"INSERT INTO {SQLITE_TABLE}({SQLITE_TABLE}) VALUES ('rebuild')"
+
+POSTGRES_INDEX = 'api_products_search_idx'
+
+
+def postgres_document(prefix=''):
+    """The indexed ``to_tsvector`` expression; queries must repeat it exactly."""
+    columns = " || ' ' || ".join(f"coalesce({prefix}{field}, '')" for field in SEARCH_FIELDS)
+    return f"to_tsvector('english', {columns})"
+
+
+def repair_search_index(connection):
+    """
+    Recreate the SQLite sync triggers if a migration dropped them.
+
+    Django rebuilds a table on SQLite to alter most columns, which drops its
+    triggers; the index is rebuilt so rows written meanwhile are searchable.
+    """
+    if connection.vendor != 'sqlite':
+        return
+    with connection.cursor() as cursor:
+        cursor.execute("SELECT name FROM sqlite_master WHERE type = 'table' AND name = %s", [SQLITE_TABLE])
+        if cursor.fetchone() is None:
+            return
+        cursor.execute("SELECT name FROM sqlite_master WHERE type = 'trigger' AND tbl_name = 'api_products'")
+        existing = {row[0] for row in cursor.fetchall()}
+        if existing >= SQLITE_TRIGGERS.keys():
+            return
+        for sql in SQLITE_TRIGGERS.values():
+            cursor.execute(sql)
+        cursor.execute(SQLITE_REBUILD)
+
+
+def fts5_query(term):
+    """Turn free text into an FTS5 query that ANDs quoted prefix matches."""
+    return ' '.join(f'"{token}"*' for token in re.findall(r'\w+', term))
+
+
+def search_products(queryset, term):
+    vendor = connections[queryset.db].vendor
+    if vendor == 'sqlite':
+        match = fts5_query(term)
+        if not match:
+            return queryset
+        return queryset.filter(
+            id__in=RawSQL(f'SELECT rowid FROM {SQLITE_TABLE} WHERE {SQLITE_TABLE} MATCH %s', [match])
+        )
+    if vendor == 'postgresql':
+        return queryset.filter(RawSQL(
+            f"{postgres_document('api_products.')} @@ websearch_to_tsquery('english', %s)", [term],
+            output_field=BooleanField(),
+        ))
+    condition = Q()
+    for field in SEARCH_FIELDS:
+        condition |= Q(**{f'{field}__icontains': term})
+    return queryset.filter(condition)
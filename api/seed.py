@@ -0,0 +1,172 @@
+"""
+Synthetic data for benchmarks and load tests.
+
+Everything is inserted with ``bulk_create`` in batches and driven by a seeded
+``random.Random``, so the same scale and seed always produce the same data.
+"""
+import random
+from contextlib import contextmanager
+from datetime import timedelta
+
+from django.contrib.auth import get_user_model
+from django.contrib.auth.hashers import make_password
+from django.utils import timezone
+
+from .models import (
+    Ads, Cart, CartItem, Category, ChefsData, Order, OrderItem, Payment, Products, Review, UserFavorites,
+)
+
+User = get_user_model()
+
+SEED_PASSWORD = 'benchmark-pass'
+BATCH_SIZE = 2000
+
+DEFAULT_SCALE = {
+    'users': 200,
+    'categories': 12,
+    'chefs': 25,
+    'products': 2000,
+    'reviews': 10000,
+    'orders': 5000,
+    'items_per_order': 3,
+    'favorites_per_user': 20,
+    'carts': 100,
+    'items_per_cart': 4,
+    'ads': 200,
+}
+
+WORDS = (
+    'spicy smoked grilled crispy vegan chicken beef lamb tofu paneer rice noodle taco pizza burger '
+    'salad soup curry garlic lemon chili basil mint cheese mushroom tomato honey ginger sesame'
+).split()
+ALLERGENS = ('gluten', 'dairy', 'nuts', 'egg', 'soy', 'fish', 'sesame', 'shellfish')
+
+
+@contextmanager
+def explicit_timestamps(*models):
+    """Let bulk_create keep the given models' ``auto_now_add`` values."""
+    fields = [field for model in models for field in model._meta.fields if getattr(field, 'auto_now_add', False)]
+    for field in fields:
+        field.auto_now_add = False
+    try:
+        yield
+    finally:
+        for field in fields:
+            field.auto_now_add = True
+
+
+def words(rng, count):
+    return ' '.join(rng.choice(WORDS) for _ in range(count))
+
+
+def seed_database(scale=None, random_seed=0, days=365):
+    """
+    Insert a synthetic dataset and return the row counts per model.
+
+    ``scale`` overrides entries of ``DEFAULT_SCALE``; timestamps are spread
+    over the last ``days`` days.
+    """
+    scale = {**DEFAULT_SCALE, **(scale or {})}
+    rng = random.Random(random_seed)
+    now = timezone.now()
+
+    def past():
+        return now - timedelta(seconds=rng.randrange(days * 24 * 3600))
+
+    password = make_password(SEED_PASSWORD)
+    User.objects.bulk_create(
+        (User(username=f'seed-user-{i}', email=f'seed-user-{i}@example.com', password=password)
+         for i in range(scale['users'])),
+        batch_size=BATCH_SIZE,
+    )
+    user_ids = list(User.objects.filter(username__startswith='seed-user-').values_list('id', flat=True))
+
+    Category.objects.bulk_create(
+        Category(name=f'{words(rng, 1).title()} {i}', description=words(rng, 12))
+        for i in range(scale['categories'])
+    )
+    category_ids = list(Category.objects.values_list('id', flat=True))
+
+    ChefsData.objects.bulk_create(
+        ChefsData(name=f'Chef {i}', description=words(rng, 20)) for i in range(scale['chefs'])
+    )
+    chef_ids = list(ChefsData.objects.values_list('id', flat=True))
+
+    def product(i):
+        price = round(rng.uniform(2, 60), 2)
+        return Products(
+            name=f'{words(rng, 2).title()} {i}',
+            price=price,
+            old_price=round(price * 1.2, 2),
+            discount=rng.choice((None, 5.0, 10.0, 20.0)),
+            description=words(rng, 30),
+            ingredients=', '.join(rng.sample(WORDS, 6)),
+            allergens=', '.join(rng.sample(ALLERGENS, rng.randrange(3))),
+            category_id=rng.choice(category_ids),
+            chefs_id=rng.choice(chef_ids),
+            quantity=rng.randrange(0, 500),
+            is_available=rng.random() > 0.1,
+        )
+
+    Products.objects.bulk_create((product(i) for i in range(scale['products'])), batch_size=BATCH_SIZE)
+    products = list(Products.objects.values_list('id', 'price'))
+    product_ids = [product_id for product_id, _ in products]
+
+    with explicit_timestamps(Review, Order, Payment, UserFavorites, Ads):
+        Review.objects.bulk_create(
+            (Review(user_id=rng.choice(user_ids), product_id=rng.choice(product_ids),
+                    rating=rng.randint(1, 5), comment=words(rng, 15), review_date=past())
+             for _ in range(scale['reviews'])),
+            batch_size=BATCH_SIZE,
+        )
+
+        statuses = [choice for choice, _ in Order.STATUS_CHOICES]
+        orders = Order.objects.bulk_create(
+            (Order(user_id=rng.choice(user_ids), status=rng.choice(statuses), total=0, order_date=past())
+             for _ in range(scale['orders'])),
+            batch_size=BATCH_SIZE,
+        )
+        items = []
+        for order in orders:
+            for product_id, price in rng.sample(products, scale['items_per_order']):
+                quantity = rng.randint(1, 4)
+                items.append(OrderItem(order=order, product_id=product_id, quantity=quantity, price=price))
+                order.total += price * quantity
+        OrderItem.objects.bulk_create(items, batch_size=BATCH_SIZE)
+        Order.objects.bulk_update(orders, ['total'], batch_size=BATCH_SIZE)
+        Payment.objects.bulk_create(
+            (Payment(order=order, payment_method=rng.choice(('card', 'cash')), payment_status='Completed',
+                     amount=order.total, payment_date=order.order_date)
+             for order in orders if order.status == 'Completed'),
+            batch_size=BATCH_SIZE,
+        )
+
+        favorites_per_user = min(scale['favorites_per_user'], len(product_ids))
+        UserFavorites.objects.bulk_create(
+            (UserFavorites(user_id=user_id, product_id=product_id, added_at=past())
+             for user_id in user_ids
+             for product_id in rng.sample(product_ids, favorites_per_user)),
+            batch_size=BATCH_SIZE,
+        )
+
+        def ad(i):
+            start = past()
+            return Ads(title=f'Promo {i}', description=words(rng, 10), start_date=start,
+                       end_date=start + timedelta(days=rng.randint(1, 60)), is_active=rng.random() > 0.3)
+
+        Ads.objects.bulk_create((ad(i) for i in range(scale['ads'])), batch_size=BATCH_SIZE)
+
+    carts = Cart.objects.bulk_create(Cart(user_id=user_id) for user_id in user_ids[:scale['carts']])
+    items_per_cart = min(scale['items_per_cart'], len(product_ids))
+    CartItem.objects.bulk_create(
+        (CartItem(cart=cart, product_id=product_id, quantity=rng.randint(1, 3))
+         for cart in carts
+         for product_id in rng.sample(product_ids, items_per_cart)),
+        batch_size=BATCH_SIZE,
+    )
+
+    return {
+        model.__name__: model.objects.count()
+        for model in (User, Category, ChefsData, Products, Review, Order, OrderItem, Payment,
+                      UserFavorites, Ads, Cart, CartItem)
+    }
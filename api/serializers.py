@@ -1,45 +1,105 @@
 from rest_framework import serializers
-from .models import CustomUser, Products, Order, OrderItem, Category, Payment, Review, ChefsData, Ads, UserFavorites, Cart, CartItem
+from .models import CustomUser, Products, Order, OrderItem, Category, Payment, Review, ChefsData, Ads, UserFavorites, Cart, CartItem, SalesRollup
 from django.contrib.auth import get_user_model
 from rest_framework import serializers
 from django.contrib.auth import get_user_model
 from django.contrib.auth.password_validation import validate_password
+from django.core.files.storage import default_storage
 from rest_framework.validators import UniqueValidator
+from rest_framework_simplejwt import serializers as jwt_serializers
+from rest_framework_simplejwt.exceptions import InvalidToken, TokenError
+from rest_framework_simplejwt.settings import api_settings as jwt_settings
+from rest_framework_simplejwt.tokens import RefreshToken
+from .authentication import TOKEN_VERSION_CLAIM, is_revoked, user_token_version
+from .favorites import get_favorite_product_ids
+from .metrics import TimedSerializerMixin
+from .orders import place_order, prefetch_order_items
 
 User = get_user_model()
 
-class UserSerializer(serializers.ModelSerializer):
+def requested_expansions(request):
+    """Names listed in the request's ``?expand=a,b`` query parameter."""
+    if request is None:
+        return set()
+    return {name.strip() for name in request.query_params.get('expand', '').split(',') if name.strip()}
+
+class ExpandableFieldsMixin:
+    """
+    Serialize the relations in ``expandable_fields`` as plain ids unless the
+    request asks for the nested representation with ``?expand=``.
+    """
+    expandable_fields = {}
+
+    def get_fields(self):
+        fields = super().get_fields()
+        expand = requested_expansions(self.context.get('request'))
+        for name, serializer_class in self.expandable_fields.items():
+            if name in expand:
+                fields[name] = serializer_class(read_only=True)
+        return fields
+
+class ImageSrcsetField(serializers.ReadOnlyField):
+    """
+    Render an ``api.images`` variants column as ``{format: {'480w': url}}``,
+    ready to join into an ``<img srcset>``; empty until the derivatives exist.
+    """
+
+    def to_representation(self, variants):
+        request = self.context.get('request')
+        srcset = {}
+        for fmt in ('webp', 'jpeg', 'png'):
+            for width, name in variants.get(fmt, {}).items():
+                url = default_storage.url(name)
+                srcset.setdefault(fmt, {})[f'{width}w'] = request.build_absolute_uri(url) if request else url
+        return srcset
+
+class UserSerializer(TimedSerializerMixin, serializers.ModelSerializer):
     password = serializers.CharField(write_only=True)
+    image_srcset = ImageSrcsetField(source='image_variants')
     
     class Meta:
         model = User
         fields = [
             'id', 'username', 'email', 'password',
             'first_name', 'last_name', 'phone_number',
-            'address', 'image'
+            'address', 'image', 'image_srcset'
         ]
         extra_kwargs = {
             'password': {'write_only': True},
         }
 
-class CategorySerializer(serializers.ModelSerializer):
+class CategorySerializer(TimedSerializerMixin, serializers.ModelSerializer):
+    image_srcset = ImageSrcsetField(source='image_variants')
+
     class Meta:
         model = Category
-        fields = '__all__'
+        exclude = ['image_variants']
         
     def get_photo_url(self, obj):
         request = self.context.get('request')
         photo_url = obj.fingerprint.url
         return request.build_absolute_url(photo_url)
 
-class ProductsSerializer(serializers.ModelSerializer):
+class ProductsSerializer(TimedSerializerMixin, serializers.ModelSerializer):
     category = CategorySerializer(read_only=True)
+    is_favorite = serializers.SerializerMethodField()
+    image_srcset = ImageSrcsetField(source='image_variants')
     
     def get_is_favorite(self, obj):
         request = self.context.get('request')
         if request and request.user.is_authenticated:
-            return UserFavorites.objects.filter(user=request.user, product=obj).exists()
+            # Looked up once for every product the serializer renders.
+            if 'favorite_ids' not in self.context:
+                self.context['favorite_ids'] = get_favorite_product_ids(request.user.id, self.rendered_product_ids(obj))
+            return obj.id in self.context['favorite_ids']
         return False
+
+    def rendered_product_ids(self, obj):
+        # A page of products, or of rows pointing at them (expanded favorites).
+        rows = self.root.instance if isinstance(self.root, serializers.ListSerializer) else None
+        if rows is None:
+            return [obj.id]
+        return {obj.id, *(getattr(row, 'product_id', row.pk) for row in rows)}
     
     def get_photo_url(self, obj):
         request = self.context.get('request')
@@ -56,88 +116,197 @@ class ProductsSerializer(serializers.ModelSerializer):
     
     class Meta:
         model = Products
-        fields = '__all__'
+        exclude = ['image_variants']
+        read_only_fields = ['rating', 'rating_sum', 'rating_count']
+
+class ProductFilterSerializer(serializers.Serializer):
+    ORDERING_CHOICES = ['price', '-price', 'rating', '-rating', 'discount', '-discount']
+
+    category = serializers.IntegerField(required=False)
+    available = serializers.BooleanField(required=False)
+    min_price = serializers.FloatField(required=False, min_value=0)
+    max_price = serializers.FloatField(required=False, min_value=0)
+    exclude_allergens = serializers.CharField(required=False)
+    search = serializers.CharField(required=False, max_length=200)
+    ordering = serializers.ChoiceField(choices=ORDERING_CHOICES, required=False)
+
+    def validate_exclude_allergens(self, value):
+        # Normalized the way api.views.allergen_list normalizes the column.
+        allergens = (allergen.replace(' ', '').lower() for allergen in value.split(','))
+        return [allergen for allergen in allergens if allergen]
+
+class ProductAvailabilitySerializer(serializers.Serializer):
+    MAX_IDS = 100
+
+    ids = serializers.CharField()
+
+    def validate_ids(self, value):
+        try:
+            ids = {int(product_id) for product_id in value.split(',') if product_id.strip()}
+        except ValueError:
+            raise serializers.ValidationError('Expected comma-separated product ids.')
+        if not ids or len(ids) > self.MAX_IDS:
+            raise serializers.ValidationError(f'Give between 1 and {self.MAX_IDS} product ids.')
+        return sorted(ids)
+
+class CategoryImportSerializer(TimedSerializerMixin, serializers.ModelSerializer):
+    class Meta:
+        model = Category
+        fields = ['name', 'description']
+
+class ChefImportSerializer(TimedSerializerMixin, serializers.ModelSerializer):
+    class Meta:
+        model = ChefsData
+        fields = ['name', 'description', 'text']
+
+class ProductImportSerializer(TimedSerializerMixin, serializers.ModelSerializer):
+    # Names, resolved to ids by api.catalog_io a chunk at a time.
+    category = serializers.CharField(required=False, allow_null=True, max_length=50)
+    chef = serializers.CharField(required=False, allow_null=True, max_length=150)
+
+    class Meta:
+        model = Products
+        fields = [
+            'name', 'price', 'old_price', 'discount', 'text', 'ingredients', 'allergens', 'description',
+            'quantity', 'is_available', 'category', 'chef',
+        ]
 
-class OrderItemSerializer(serializers.ModelSerializer):
+class SalesRollupSerializer(TimedSerializerMixin, serializers.ModelSerializer):
+    class Meta:
+        model = SalesRollup
+        fields = ['period', 'dimension', 'key', 'bucket', 'orders', 'units', 'revenue']
+
+class SalesRollupFilterSerializer(serializers.Serializer):
+    period = serializers.ChoiceField(choices=SalesRollup.PERIOD_CHOICES, default='day')
+    dimension = serializers.ChoiceField(choices=SalesRollup.DIMENSION_CHOICES, default='product')
+    key = serializers.IntegerField(required=False, min_value=0)
+    start = serializers.DateTimeField(required=False)
+    end = serializers.DateTimeField(required=False)
+
+class ExportRangeSerializer(serializers.Serializer):
+    start = serializers.DateTimeField(required=False)
+    end = serializers.DateTimeField(required=False)
+
+    def validate(self, attrs):
+        if 'start' in attrs and 'end' in attrs and attrs['start'] >= attrs['end']:
+            raise serializers.ValidationError({'end': 'Must be after start.'})
+        return attrs
+
+class SalesRollupRefreshSerializer(serializers.Serializer):
+    rebuild = serializers.BooleanField(default=False)
+
+class OrderItemSerializer(TimedSerializerMixin, serializers.ModelSerializer):
     product = serializers.PrimaryKeyRelatedField(queryset=Products.objects.all())
     
     class Meta:
         model = OrderItem
         fields = ['product', 'quantity', 'price']
 
-class OrderSerializer(serializers.ModelSerializer):
-    items = OrderItemSerializer(many=True)
+class OrderLineSerializer(TimedSerializerMixin, serializers.ModelSerializer):
+    # A plain id: place_order() fetches every product of the order in one query.
+    product = serializers.IntegerField(source='product_id')
+    product_name = serializers.CharField(source='product.name', read_only=True)
+    quantity = serializers.IntegerField(min_value=1)
+
+    class Meta:
+        model = OrderItem
+        fields = ['product', 'product_name', 'quantity', 'price']
+        read_only_fields = ['price']
+
+class OrderSerializer(TimedSerializerMixin, serializers.ModelSerializer):
+    items = OrderLineSerializer(many=True)
     
     class Meta:
         model = Order
         fields = ['id', 'user', 'order_date', 'status', 'total', 'items']
-        read_only_fields = ['order_date', 'user']
+        read_only_fields = ['order_date', 'user', 'total']
     
     def create(self, validated_data):
         items_data = validated_data.pop('items')
-        order = Order.objects.create(**validated_data)
-        
-        for item_data in items_data:
-            OrderItem.objects.create(
-                order=order,
-                product_id=item_data['product'].id,  # Explicitly use product_id
-                quantity=item_data['quantity'],
-                price=item_data['price']
-            )
-        
-        return order 
+        return prefetch_order_items(place_order(
+            validated_data['user_id'],
+            [(item['product_id'], item['quantity']) for item in items_data],
+            status=validated_data.get('status', 'Pending'),
+        ))
     
-class PaymentSerializer(serializers.ModelSerializer):
+class PaymentSerializer(TimedSerializerMixin, serializers.ModelSerializer):
     class Meta:
         model = Payment
         fields = '__all__'
 
-class ReviewSerializer(serializers.ModelSerializer):
-    user = UserSerializer(read_only=True)
-    product = ProductsSerializer(read_only=True)
+class ReviewSerializer(ExpandableFieldsMixin, TimedSerializerMixin, serializers.ModelSerializer):
+    expandable_fields = {
+        'user': UserSerializer,
+        'product': ProductsSerializer,
+    }
     
     class Meta:
         model = Review
         fields = '__all__'
+        read_only_fields = ['user']
         
-class ChefsDataSerializer(serializers.ModelSerializer):
+class ChefsDataSerializer(TimedSerializerMixin, serializers.ModelSerializer):
+    profile_picture_srcset = ImageSrcsetField(source='profile_picture_variants')
+
     class Meta:
         model = ChefsData
-        fields = '__all__'
+        exclude = ['profile_picture_variants']
+        read_only_fields = ['rating', 'rating_sum', 'rating_count']
         
-class AdsSerializer(serializers.ModelSerializer):
+class AdsSerializer(TimedSerializerMixin, serializers.ModelSerializer):
+    image_srcset = ImageSrcsetField(source='image_variants')
+
     class Meta:
         model = Ads
-        fields = '__all__'
+        exclude = ['image_variants']
         
-class UserFavoritesSerializer(serializers.ModelSerializer):
-    product = ProductsSerializer(read_only=True)
+class UserFavoritesSerializer(ExpandableFieldsMixin, TimedSerializerMixin, serializers.ModelSerializer):
+    expandable_fields = {
+        'product': ProductsSerializer,
+    }
     
     class Meta:
         model = UserFavorites
         fields = ['id', 'user', 'product', 'added_at']
-        read_only_fields = ['user', 'added_at']
+        read_only_fields = ['user', 'product', 'added_at']
         
-class CartItemSerializer(serializers.ModelSerializer):
+class CartItemSerializer(TimedSerializerMixin, serializers.ModelSerializer):
     product = serializers.PrimaryKeyRelatedField(queryset=Products.objects.all())
     
     class Meta:
         model = CartItem
         fields = ['id', 'product', 'quantity']
 
-class CartSerializer(serializers.ModelSerializer):
+class CartSerializer(TimedSerializerMixin, serializers.ModelSerializer):
     items = CartItemSerializer(many=True, read_only=True)
     total = serializers.SerializerMethodField()
+    reserved_until = serializers.SerializerMethodField()
 
     class Meta:
         model = Cart
-        fields = ['id', 'items', 'total', 'created_at', 'updated_at']
+        fields = ['id', 'items', 'total', 'reserved_until', 'created_at', 'updated_at']
 
     def get_total(self, obj):
-        return sum(item.product.price * item.quantity for item in obj.items.all())
+        return round(sum(item.product.unit_price * item.quantity for item in obj.items.all()), 2)
+
+    def get_reserved_until(self, obj):
+        # Annotated by api.carts.carts_with_items: when the first of the
+        # cart's stock reservations lapses.
+        reserved_until = getattr(obj, 'reserved_until', None)
+        return serializers.DateTimeField().to_representation(reserved_until) if reserved_until else None
+
+class CartLineSerializer(serializers.Serializer):
+    product = serializers.IntegerField()
+    quantity = serializers.IntegerField(min_value=0)
+
+class CartLinesSerializer(serializers.Serializer):
+    MODE_CHOICES = ['merge', 'set']
+
+    items = CartLineSerializer(many=True, allow_empty=False)
+    mode = serializers.ChoiceField(choices=MODE_CHOICES, default='merge')
     
 
-class RegisterSerializer(serializers.ModelSerializer):
+class RegisterSerializer(TimedSerializerMixin, serializers.ModelSerializer):
     email = serializers.EmailField(
         required=True,
         validators=[UniqueValidator(queryset=User.objects.all())]
@@ -176,11 +345,43 @@ class RegisterSerializer(serializers.ModelSerializer):
         user = User.objects.create_user(**validated_data)
         return user
 
-class UserProfileSerializer(serializers.ModelSerializer):
+class UserProfileSerializer(TimedSerializerMixin, serializers.ModelSerializer):
     class Meta:
         model = User
         fields = [
             'id', 'username', 'email', 'first_name', 'last_name',
             'phone_number', 'address', 'image'
         ]
-        read_only_fields = ['email']
\ No newline at end of file
+        read_only_fields = ['email']
+
+class ClaimsTokenObtainPairSerializer(jwt_serializers.TokenObtainPairSerializer):
+    """Put the claims ``TokenUser`` reads into the token, so requests need no user lookup."""
+
+    @classmethod
+    def get_token(cls, user):
+        token = super().get_token(user)
+        token['username'] = user.get_username()
+        token['is_staff'] = user.is_staff
+        version = user_token_version(user.pk)
+        if version is not None:
+            token[TOKEN_VERSION_CLAIM] = version
+        return token
+
+class DenylistTokenRefreshSerializer(jwt_serializers.TokenRefreshSerializer):
+    def validate(self, attrs):
+        if is_revoked(RefreshToken(attrs['refresh'])):
+            raise InvalidToken({'detail': 'Token has been revoked.', 'code': 'token_revoked'})
+        return super().validate(attrs)
+
+class TokenRevokeSerializer(serializers.Serializer):
+    refresh = serializers.CharField(required=False)
+    all = serializers.BooleanField(default=False)
+
+    def validate_refresh(self, value):
+        try:
+            token = RefreshToken(value)
+        except TokenError as exc:
+            raise serializers.ValidationError(str(exc))
+        if str(token.get(jwt_settings.USER_ID_CLAIM)) != str(self.context['request'].user.id):
+            raise serializers.ValidationError('Token belongs to another user.')
+        return token
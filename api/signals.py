@@ -0,0 +1,129 @@
+from django.db import connections
+from django.db.models.signals import post_delete, post_init, post_save, pre_delete, pre_save
+from django.dispatch import receiver
+
+from . import ratings
+from .authentication import full_user_cache, revoke_user_tokens
+from .cache import CATALOG_NAMESPACES, bump_catalog_version
+from .images import IMAGE_FIELDS, needs_derivatives, schedule_derivatives
+from .models import CustomUser, Order, OrderItem, Payment, Products, Review
+from .realtime import push_status
+from .rollups import rewind_sales_rollups
+from .search import repair_search_index
+
+def catalog_changed(sender, **kwargs):
+    bump_catalog_version(CATALOG_NAMESPACES[sender._meta.label])
+
+
+for label in CATALOG_NAMESPACES:
+    post_save.connect(catalog_changed, sender=label)
+    post_delete.connect(catalog_changed, sender=label)
+
+
+def image_saved(sender, instance, **kwargs):
+    field_name = IMAGE_FIELDS[sender._meta.label]
+    if needs_derivatives(instance, field_name):
+        schedule_derivatives(instance, field_name)
+
+
+for label in IMAGE_FIELDS:
+    post_save.connect(image_saved, sender=label)
+
+
+# Model -> status field whose transitions are pushed to the owner's sockets.
+STATUS_FIELDS = {Order: 'status', Payment: 'payment_status'}
+
+
+def remember_status(sender, instance, **kwargs):
+    field_name = STATUS_FIELDS[sender]
+    # Deferred loads skip the field; reading it here would cost a query.
+    instance._saved_status = instance.__dict__.get(field_name)
+
+
+def status_saved(sender, instance, created, **kwargs):
+    status = getattr(instance, STATUS_FIELDS[sender])
+    previous = None if created else instance._saved_status
+    instance._saved_status = status
+    if status == previous:
+        return
+    if sender is Order:
+        if not created:
+            # Rolled-up sales leave cancelled orders out.
+            rewind_sales_rollups(instance.order_date)
+        payload = {'event': 'order.status', 'order': instance.pk}
+        user_id = instance.user_id
+    else:
+        payload = {'event': 'payment.status', 'order': instance.order_id, 'payment': instance.pk}
+        user_id = instance.order.user_id
+    push_status(user_id, {**payload, 'status': status, 'previous_status': previous})
+
+
+for model in STATUS_FIELDS:
+    post_init.connect(remember_status, sender=model)
+    post_save.connect(status_saved, sender=model)
+
+
+@receiver(post_delete, sender=Order)
+def order_deleted(sender, instance, **kwargs):
+    rewind_sales_rollups(instance.order_date)
+
+
+# Lines edited through the API or the admin change a rolled-up order's totals.
+@receiver(post_save, sender=OrderItem)
+@receiver(post_delete, sender=OrderItem)
+def order_item_changed(sender, instance, **kwargs):
+    rewind_sales_rollups(instance.order.order_date)
+
+
+# Every delete, including cascades from a user or product, takes the rating out.
+@receiver(post_delete, sender=Review)
+def review_deleted(sender, instance, **kwargs):
+    ratings.review_deleted(instance)
+
+
+@receiver(pre_delete, sender=Products)
+def product_deleting(sender, instance, **kwargs):
+    ratings.product_deleting(instance.pk)
+
+
+@receiver(pre_save, sender=Products)
+def remember_chef(sender, instance, update_fields=None, **kwargs):
+    if instance.pk is not None and (update_fields is None or 'chefs' in update_fields):
+        instance._stored_chef_id = Products.objects.filter(pk=instance.pk).values_list('chefs_id', flat=True).first()
+
+
+@receiver(post_save, sender=Products)
+def product_saved(sender, instance, **kwargs):
+    if '_stored_chef_id' not in instance.__dict__:
+        return
+    stored_chef_id = instance.__dict__.pop('_stored_chef_id')
+    if stored_chef_id != instance.chefs_id:
+        ratings.product_chef_changed(instance.pk, stored_chef_id, instance.chefs_id)
+
+
+# Token claims and the denylist cover these; a change must end old sessions.
+CREDENTIAL_FIELDS = ('password', 'is_active', 'is_staff', 'is_superuser')
+
+
+@receiver(post_init, sender=CustomUser)
+def remember_credentials(sender, instance, **kwargs):
+    instance._saved_credentials = tuple(instance.__dict__.get(field) for field in CREDENTIAL_FIELDS)
+
+
+@receiver(post_save, sender=CustomUser)
+def user_saved(sender, instance, created, **kwargs):
+    full_user_cache.invalidate(instance.pk)
+    credentials = tuple(getattr(instance, field) for field in CREDENTIAL_FIELDS)
+    if not created and credentials != instance._saved_credentials:
+        revoke_user_tokens(instance.pk)
+    instance._saved_credentials = credentials
+
+
+@receiver(post_delete, sender=CustomUser)
+def user_deleted(sender, instance, **kwargs):
+    full_user_cache.invalidate(instance.pk)
+    revoke_user_tokens(instance.pk)
+
+
+def search_index_migrated(sender, using, **kwargs):
+    repair_search_index(connections[using])
@@ -0,0 +1,63 @@
+import hashlib
+import os
+import posixpath
+import re
+import tempfile
+
+from django.core.files.storage import FileSystemStorage
+
+HASHED_NAME = re.compile(r'^[0-9a-f]{2}/[0-9a-f]{2}/(?P<digest>[0-9a-f]{64})(\.[\w]+)?$')
+
+
+def content_digest(name):
+    """The sha256 embedded in a content-addressed ``name``, or None."""
+    match = HASHED_NAME.match(name)
+    return match['digest'] if match else None
+
+
+class ContentAddressedStorage(FileSystemStorage):
+    """
+    Store every file under the sha256 of its bytes, e.g. ``3f/a1/3fa1…e9.jpg``.
+
+    Identical uploads map to the same name and are written once, and a name
+    never points at different bytes, so its URL can be cached forever (see
+    ``api.media.serve_media``). The requested name only contributes its
+    extension. Because files are shared, deleting one may break other rows
+    that uploaded the same content.
+    """
+
+    def get_available_name(self, name, max_length=None):
+        # Names are derived from content in _save; a taken name is a duplicate.
+        return name
+
+    def _save(self, name, content):
+        digest = hashlib.sha256()
+        content.seek(0)
+        for chunk in content.chunks():
+            digest.update(chunk)
+        digest = digest.hexdigest()
+        extension = posixpath.splitext(name)[1].lower()
+        name = f'{digest[:2]}/{digest[2:4]}/{digest}{extension}'
+        if self.exists(name):
+            return name
+
+        full_path = self.path(name)
+        directory = os.path.dirname(full_path)
+        os.makedirs(directory, exist_ok=True)
+        if self.directory_permissions_mode is not None:
+            os.chmod(directory, self.directory_permissions_mode)
+        # Write beside the target and rename, so concurrent uploads of the same
+        # content never expose a partially written file.
+        fd, temp_path = tempfile.mkstemp(dir=directory, prefix='.upload-')
+        try:
+            content.seek(0)
+            with os.fdopen(fd, 'wb') as temp_file:
+                for chunk in content.chunks():
+                    temp_file.write(chunk)
+            os.chmod(temp_path, self.file_permissions_mode or 0o644)
+            os.replace(temp_path, full_path)
+        except BaseException:
+            if os.path.exists(temp_path):
+                os.remove(temp_path)
+            raise
+        return name
@@ -1,3 +1,1870 @@
-from django.test import TestCase
+import csv
+import hashlib
+import importlib
+import io
+import json
+import os
+import shutil
+import sys
+import tempfile
+import threading
+import time
+from contextlib import contextmanager
+from datetime import timedelta
+from io import StringIO
+from types import SimpleNamespace
+from unittest import mock
 
-# Create your tests here.
+from asgiref.sync import sync_to_async
+from asgiref.testing import ApplicationCommunicator
+from backend.asgi import application as asgi_application
+from django.contrib.auth import get_user_model
+from django.core.cache import cache, caches
+from django.core.cache.backends.db import BaseDatabaseCache
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import call_command
+from django.db import OperationalError, connection, transaction
+from django.db.migrations.executor import MigrationExecutor
+from django.test import TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from django.utils.http import http_date
+from rest_framework import serializers
+from PIL import Image
+from rest_framework.test import APIClient
+from rest_framework_simplejwt.tokens import AccessToken, RefreshToken
+
+from . import catalog_io, metrics
+from .authentication import full_user_cache
+from .benchmarks import DEFAULT_MIX, SCENARIOS, run_benchmarks, run_mixed
+from .cache import CatalogCache, DjangoCacheBackend, LRUBackend, bump_catalog_version, get_catalog_cache
+from .db import retry_on_lock
+from .models import (
+    Ads, Cart, CartItem, Category, ChefsData, Order, OrderItem, Payment, Products, Review, RollupState, SalesRollup,
+    StockReservation, UserFavorites,
+)
+from .carts import carts_with_items, update_cart_lines
+from .orders import place_order
+from .pagination import KeysetPagination
+from .reservations import available_stock, release_expired
+from .rollups import refresh_sales_rollups
+from .search import repair_search_index
+from .seed import seed_database
+from .serializers import ClaimsTokenObtainPairSerializer, ProductsSerializer, ReviewSerializer
+from .streaming import read_records
+from .views import OrderViewSet, PaymentViewSet, ReviewViewSet, UserFavoritesViewSet
+
+User = get_user_model()
+
+
+def reset_caches():
+    cache.clear()
+    get_catalog_cache().clear()
+    full_user_cache.clear()
+
+
+class ProductListQueryCountTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(username='alice', password='pass12345')
+        cls.category = Category.objects.create(name='Pizza')
+        cls.chef = ChefsData.objects.create(name='Mario')
+
+    def setUp(self):
+        reset_caches()
+        self.client = APIClient()
+
+    def create_products(self, count):
+        Products.objects.bulk_create(
+            Products(name=f'Product {i}', price=10 + i, category=self.category, chefs=self.chef)
+            for i in range(count)
+        )
+        bump_catalog_version('products')
+
+    def test_anonymous_list_query_count_is_constant(self):
+        self.create_products(1000)
+        for page_size in (10, 100):
+            with self.subTest(page_size=page_size), self.assertNumQueries(1):
+                response = self.client.get('/api/products/', {'page_size': page_size})
+            self.assertEqual(len(response.data['results']), page_size)
+
+    def authenticate(self):
+        token = ClaimsTokenObtainPairSerializer.get_token(self.user).access_token
+        self.client.credentials(HTTP_AUTHORIZATION=f'Bearer {token}')
+
+    def test_authenticated_list_query_count_is_constant(self):
+        self.authenticate()
+        self.create_products(1000)
+        UserFavorites.objects.create(user=self.user, product=Products.objects.order_by('id').first())
+        for page_size in (10, 100):
+            # The page, the favorites on it, and the token denylist, which is
+            # in the database cache unless REDIS_URL is set.
+            with self.subTest(page_size=page_size), self.assertNumQueries(3):
+                response = self.client.get('/api/products/', {'page_size': page_size})
+            self.assertEqual(len(response.data['results']), page_size)
+            self.assertEqual(sum(p['is_favorite'] for p in response.data['results']), 1)
+            # Warm, only the per-user lookups remain.
+            with self.subTest(page_size=page_size, warm=True), self.assertNumQueries(2):
+                self.client.get('/api/products/', {'page_size': page_size})
+
+    def test_paging_through_every_product_takes_one_query_per_page(self):
+        self.create_products(1000)
+        seen = []
+        url = '/api/products/?page_size=100'
+        while url:
+            with self.assertNumQueries(1):
+                response = self.client.get(url)
+            self.assertEqual(response.status_code, 200)
+            seen += [product['id'] for product in response.data['results']]
+            self.assertEqual(response.data['results'][0]['category']['name'], 'Pizza')
+            self.assertEqual(response.data['results'][0]['chefs'], self.chef.id)
+            url = response.data['next']
+        self.assertEqual(sorted(seen), sorted(Products.objects.values_list('id', flat=True)))
+
+    def test_detail_includes_category_and_favorite_flag(self):
+        self.create_products(1)
+        product = Products.objects.get()
+        UserFavorites.objects.create(user=self.user, product=product)
+        self.authenticate()
+        with self.assertNumQueries(3):
+            response = self.client.get(f'/api/products/{product.id}/')
+        self.assertEqual(response.data['category']['name'], 'Pizza')
+        self.assertTrue(response.data['is_favorite'])
+
+
+class FavoriteFlagTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(username='carol', password='pass12345')
+        Products.objects.bulk_create(Products(name=f'Product {i}', price=i) for i in range(5))
+        cls.products = list(Products.objects.order_by('id'))
+
+    def setUp(self):
+        reset_caches()
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def favorite_flags(self):
+        response = self.client.get('/api/products/')
+        return {p['id']: p['is_favorite'] for p in response.data['results']}
+
+    def test_warm_listing_only_looks_up_the_page(self):
+        UserFavorites.objects.bulk_create(UserFavorites(user=self.user, product=p) for p in self.products)
+        self.favorite_flags()
+        with self.assertNumQueries(1) as queries:
+            flags = self.favorite_flags()
+        self.assertTrue(all(flags.values()))
+        self.assertIn('"product_id" IN', queries.captured_queries[0]['sql'])
+
+    def test_toggle_endpoints_keep_flags_in_sync(self):
+        first, second = self.products[0], self.products[1]
+        self.client.post(f'/api/favorites/toggle/{first.id}/')
+        self.client.post(f'/api/favorites/{second.id}/toggle_favorite/')
+        flags = self.favorite_flags()
+        self.assertTrue(flags[first.id])
+        self.assertTrue(flags[second.id])
+        self.assertEqual(sum(flags.values()), 2)
+
+        self.client.post(f'/api/favorites/toggle/{first.id}/')
+        flags = self.favorite_flags()
+        self.assertFalse(flags[first.id])
+        self.assertTrue(flags[second.id])
+
+    def test_flags_are_per_user(self):
+        other = User.objects.create_user(username='dave', password='pass12345')
+        UserFavorites.objects.create(user=other, product=self.products[0])
+        self.assertFalse(any(self.favorite_flags().values()))
+
+
+class CatalogCacheTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.staff = User.objects.create_user(username='erin', password='pass12345', is_staff=True)
+        cls.category = Category.objects.create(name='Tacos')
+
+    def setUp(self):
+        reset_caches()
+        self.client = APIClient()
+
+    def test_repeat_reads_are_served_from_cache(self):
+        self.client.get('/api/categories/')
+        with self.assertNumQueries(0):
+            response = self.client.get('/api/categories/')
+        self.assertEqual(response.data['results'][0]['name'], 'Tacos')
+
+    def test_save_bumps_the_version(self):
+        self.client.get(f'/api/categories/{self.category.id}/')
+        self.category.name = 'Burritos'
+        self.category.save()
+        response = self.client.get(f'/api/categories/{self.category.id}/')
+        self.assertEqual(response.data['name'], 'Burritos')
+
+    def test_category_change_invalidates_nested_products(self):
+        Products.objects.create(name='Taco', price=5, category=self.category)
+        self.client.get('/api/products/')
+        self.category.name = 'Street food'
+        self.category.save()
+        response = self.client.get('/api/products/')
+        self.assertEqual(response.data['results'][0]['category']['name'], 'Street food')
+
+    def test_conditional_get_returns_304(self):
+        response = self.client.get('/api/categories/')
+        etag = response.headers['ETag']
+        self.assertIn('Last-Modified', response.headers)
+
+        response = self.client.get('/api/categories/', HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+
+        Category.objects.create(name='Desserts')
+        response = self.client.get('/api/categories/', HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response.headers['ETag'], etag)
+
+    def test_favorites_do_not_leak_between_users(self):
+        product = Products.objects.create(name='Taco', price=5)
+        fan = User.objects.create_user(username='frank', password='pass12345')
+        UserFavorites.objects.create(user=fan, product=product)
+        self.client.force_authenticate(fan)
+        fan_response = self.client.get('/api/products/')
+        self.assertTrue(fan_response.data['results'][0]['is_favorite'])
+
+        self.client.force_authenticate(None)
+        response = self.client.get('/api/products/', HTTP_IF_NONE_MATCH=fan_response.headers['ETag'])
+        self.assertEqual(response.status_code, 200)
+        self.assertFalse(response.data['results'][0]['is_favorite'])
+
+    @override_settings(CATALOG_CACHE={'BACKEND': 'api.cache.LRUBackend', 'OPTIONS': {'max_entries': 2}})
+    def test_lru_evicts_and_reports_stats(self):
+        for category in Category.objects.bulk_create(Category(name=f'C{i}') for i in range(3)):
+            self.client.get(f'/api/categories/{category.id}/')
+        self.client.get(f'/api/categories/{category.id}/')
+
+        self.client.force_authenticate(self.staff)
+        stats = self.client.get('/api/catalog-cache/stats/').data
+        self.assertEqual(stats['entries'], 2)
+        self.assertEqual(stats['evictions'], 1)
+        self.assertEqual((stats['hits'], stats['misses']), (1, 3))
+        self.assertEqual(stats['hit_rate'], 0.25)
+
+    @override_settings(CATALOG_CACHE={'BACKEND': 'api.cache.DjangoCacheBackend', 'OPTIONS': {'alias': 'default'}})
+    def test_django_cache_backend(self):
+        self.client.get('/api/categories/')
+        # The entry itself comes from the default (database) cache.
+        with self.assertNumQueries(1):
+            self.client.get('/api/categories/')
+        Category.objects.create(name='Desserts')
+        response = self.client.get('/api/categories/')
+        self.assertEqual(len(response.data['results']), 2)
+
+    def test_stats_are_staff_only(self):
+        response = self.client.get('/api/catalog-cache/stats/')
+        self.assertEqual(response.status_code, 401)
+
+    def test_version_bumps_reach_every_worker(self):
+        # Two processes: each has its own LRU, both share the default cache.
+        first, second = CatalogCache(LRUBackend()), CatalogCache(LRUBackend())
+        key, _ = first.make_key(['categories'], '/api/categories/')
+        self.assertEqual(second.make_key(['categories'], '/api/categories/')[0], key)
+        first.bump('categories')
+        self.assertNotEqual(first.make_key(['categories'], '/api/categories/')[0], key)
+        # The other worker keeps its copy of the version for versions_timeout.
+        self.assertEqual(second.make_key(['categories'], '/api/categories/')[0], key)
+        with mock.patch('api.cache.time.monotonic', return_value=time.monotonic() + second.versions_timeout):
+            self.assertNotEqual(second.make_key(['categories'], '/api/categories/')[0], key)
+
+    def test_concurrent_bumps_cannot_share_a_version_on_the_database_cache(self):
+        database_cache = {'default': {'BACKEND': 'django.core.cache.backends.db.DatabaseCache', 'LOCATION': 'api_cache'}}
+        with override_settings(CACHES=database_cache):
+            first, second = CatalogCache(LRUBackend()), CatalogCache(LRUBackend())
+            start = first.get_versions(['ads'])[0]
+            self.assertEqual(second.get_versions(['ads'])[0], start)
+            # incr is a get-then-set on this backend, so bumps must not use it.
+            with mock.patch.object(caches['default'], 'incr', side_effect=AssertionError):
+                bumped = {first.bump('ads')[0], second.bump('ads')[0]}
+            self.assertEqual(len(bumped), 2)
+            self.assertNotIn(start[0], bumped)
+            self.assertIn(second.get_versions(['ads'])[0][0], bumped)
+
+    def test_lru_entries_expire_by_default(self):
+        backend = LRUBackend(timeout=60)
+        backend.set('key', 'value')
+        with mock.patch('api.cache.time.monotonic', return_value=time.monotonic() + 61):
+            self.assertIsNone(backend.get('key'))
+
+    def test_clearing_the_django_backend_keeps_other_cache_data(self):
+        catalog_cache = CatalogCache(DjangoCacheBackend(alias='default'))
+        key, _ = catalog_cache.make_key(['products'], '/api/products/')
+        catalog_cache.set(key, 'entry')
+        cache.set('jwt:denylist:user:1', 123)
+        catalog_cache.clear()
+        self.assertEqual(cache.get('jwt:denylist:user:1'), 123)
+        self.assertIsNone(catalog_cache.get(catalog_cache.make_key(['products'], '/api/products/')[0]))
+
+
+class PaginationTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(username='bob', password='pass12345')
+        Products.objects.bulk_create(Products(name=f'Product {i}', price=i) for i in range(45))
+
+    def setUp(self):
+        reset_caches()
+        self.client = APIClient()
+
+    def test_cursor_pages_walk_the_whole_table(self):
+        seen = []
+        url = '/api/products/'
+        while url:
+            with self.assertNumQueries(1):
+                response = self.client.get(url)
+            seen.extend(p['id'] for p in response.data['results'])
+            url = response.data['next']
+        self.assertEqual(seen, list(Products.objects.order_by('id').values_list('id', flat=True)))
+
+    def test_page_size_is_capped(self):
+        response = self.client.get('/api/products/', {'page_size': 1000})
+        self.assertEqual(len(response.data['results']), 45)
+        Products.objects.bulk_create(Products(name='Extra', price=1) for _ in range(100))
+        bump_catalog_version('products')
+        response = self.client.get('/api/products/', {'page_size': 1000})
+        self.assertEqual(len(response.data['results']), 100)
+
+    def test_limit_offset_fallback(self):
+        response = self.client.get('/api/products/', {'limit': 10, 'offset': 40})
+        self.assertEqual(response.data['count'], 45)
+        self.assertEqual(len(response.data['results']), 5)
+        self.assertEqual(response.data['results'][0]['name'], 'Product 40')
+
+    def test_orders_are_newest_first(self):
+        self.client.force_authenticate(self.user)
+        for total in (1, 2, 3):
+            Order.objects.create(user=self.user, total=total)
+        response = self.client.get('/api/orders/')
+        self.assertEqual([o['total'] for o in response.data['results']], [3, 2, 1])
+
+    def test_cursor_pages_break_timestamp_ties_by_id(self):
+        self.client.force_authenticate(self.user)
+        Order.objects.bulk_create(Order(user=self.user, total=i) for i in range(7))
+        Order.objects.update(order_date=timezone.now())
+        UserFavorites.objects.bulk_create(UserFavorites(user=self.user, product=p) for p in Products.objects.all()[:7])
+        UserFavorites.objects.update(added_at=timezone.now())
+        for url, model in (('/api/orders/', Order), ('/api/favorites/', UserFavorites)):
+            seen = []
+            url += '?page_size=2'
+            while url:
+                response = self.client.get(url)
+                seen.extend(row['id'] for row in response.data['results'])
+                url = response.data['next']
+            with self.subTest(model=model.__name__):
+                self.assertEqual(seen, list(model.objects.order_by('-id').values_list('id', flat=True)))
+
+    def test_paginated_orderings_are_unique(self):
+        paginator = KeysetPagination()
+        for view_class in (OrderViewSet, PaymentViewSet, ReviewViewSet, UserFavoritesViewSet):
+            with self.subTest(view=view_class.__name__):
+                self.assertEqual(paginator.get_ordering(None, None, view_class())[-1].lstrip('-'), 'id')
+
+
+class OrderCreateTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(username='gina', password='pass12345')
+        cls.pizza = Products.objects.create(name='Pizza', price=20, discount=10, quantity=5)
+        cls.taco = Products.objects.create(name='Taco', price=4, quantity=10)
+
+    def setUp(self):
+        reset_caches()
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def test_total_and_prices_are_computed_server_side(self):
+        response = self.client.post('/api/orders/', {
+            'total': 1,
+            'items': [
+                {'product': self.pizza.id, 'quantity': 2, 'price': 0.01},
+                {'product': self.taco.id, 'quantity': 3},
+            ],
+        }, format='json')
+        self.assertEqual(response.status_code, 201, response.data)
+        self.assertEqual(response.data['total'], 48)
+        prices = dict(OrderItem.objects.values_list('product_id', 'price'))
+        self.assertEqual(prices, {self.pizza.id: 18, self.taco.id: 4})
+        self.pizza.refresh_from_db()
+        self.taco.refresh_from_db()
+        self.assertEqual((self.pizza.quantity, self.taco.quantity), (3, 7))
+
+    def test_query_count_does_not_grow_with_items(self):
+        products = Products.objects.bulk_create(
+            Products(name=f'Side {i}', price=1, quantity=10) for i in range(20)
+        )
+        with self.assertNumQueries(6):
+            place_order(self.user.id, [(product.id, 1) for product in products])
+
+    def test_out_of_stock_rolls_back_the_whole_order(self):
+        response = self.client.post('/api/orders/', {
+            'items': [
+                {'product': self.taco.id, 'quantity': 1},
+                {'product': self.pizza.id, 'quantity': 6},
+                {'product': 9999, 'quantity': 1},
+            ],
+        }, format='json')
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(set(response.data['items']), {str(self.pizza.id), '9999'})
+        self.assertFalse(Order.objects.exists())
+        self.taco.refresh_from_db()
+        self.assertEqual(self.taco.quantity, 10)
+
+
+class CartCheckoutTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(username='hank', password='pass12345')
+        cls.products = Products.objects.bulk_create(
+            Products(name=f'Dish {i}', price=5, quantity=3) for i in range(10)
+        )
+
+    def setUp(self):
+        reset_caches()
+        self.cart = Cart.objects.create(user=self.user)
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def fill_cart(self, count, quantity=1):
+        CartItem.objects.bulk_create(
+            CartItem(cart=self.cart, product=product, quantity=quantity)
+            for product in self.products[:count]
+        )
+
+    def test_checkout_turns_the_cart_into_an_order(self):
+        self.fill_cart(3, quantity=2)
+        response = self.client.post(f'/api/carts/{self.cart.id}/checkout/', {'payment_method': 'card'})
+        self.assertEqual(response.status_code, 201, response.data)
+        self.assertEqual(response.data['total'], 30)
+        self.assertEqual(len(response.data['items']), 3)
+        order = Order.objects.get()
+        self.assertEqual(Payment.objects.get(order=order).amount, 30)
+        self.assertFalse(self.cart.items.exists())
+
+    def test_query_count_does_not_grow_with_cart_size(self):
+        for count in (1, 10):
+            CartItem.objects.all().delete()
+            self.fill_cart(count)
+            with self.subTest(count=count), self.assertNumQueries(15):
+                self.client.post(f'/api/carts/{self.cart.id}/checkout/', {'payment_method': 'card'})
+
+    def test_failed_checkout_keeps_the_cart(self):
+        self.fill_cart(2, quantity=4)
+        response = self.client.post(f'/api/carts/{self.cart.id}/checkout/')
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(self.cart.items.count(), 2)
+        self.assertFalse(Order.objects.exists())
+
+    def test_empty_cart(self):
+        response = self.client.post(f'/api/carts/{self.cart.id}/checkout/')
+        self.assertEqual(response.status_code, 400)
+
+
+class CartLinesTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(username='ivy', password='pass12345')
+        cls.products = Products.objects.bulk_create(
+            Products(name=f'Dish {i}', price=2, quantity=50) for i in range(30)
+        )
+
+    def setUp(self):
+        self.cart = Cart.objects.create(user=self.user)
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def post_lines(self, lines, mode='merge'):
+        return self.client.post(f'/api/carts/{self.cart.id}/set_items/', {
+            'mode': mode,
+            'items': [{'product': product.id, 'quantity': quantity} for product, quantity in lines],
+        }, format='json')
+
+    def quantities(self):
+        return dict(self.cart.items.values_list('product_id', 'quantity'))
+
+    def test_merge_adds_to_existing_lines(self):
+        first, second = self.products[:2]
+        self.post_lines([(first, 1)])
+        response = self.post_lines([(first, 2), (second, 3), (first, 1)])
+        self.assertEqual(response.status_code, 200, response.data)
+        self.assertEqual(self.quantities(), {first.id: 4, second.id: 3})
+        self.assertEqual(response.data['total'], 14)
+
+    def test_set_overwrites_and_removes_lines(self):
+        first, second, third = self.products[:3]
+        self.post_lines([(first, 5), (second, 5)])
+        self.post_lines([(first, 1), (second, 0), (third, 2)], mode='set')
+        self.assertEqual(self.quantities(), {first.id: 1, third.id: 2})
+
+    def test_query_count_does_not_grow_with_lines(self):
+        for count in (1, 30):
+            lines = [(product, 1) for product in self.products[:count]]
+            with self.subTest(count=count), self.assertNumQueries(13):
+                self.post_lines(lines)
+
+    def test_unknown_product_changes_nothing(self):
+        response = self.client.post(f'/api/carts/{self.cart.id}/set_items/', {
+            'items': [{'product': self.products[0].id, 'quantity': 1}, {'product': 9999, 'quantity': 1}],
+        }, format='json')
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(self.quantities(), {})
+
+    def test_add_item_increments_in_the_database(self):
+        product = self.products[0]
+        for _ in range(3):
+            self.client.post(f'/api/carts/{self.cart.id}/add_item/', {'product': product.id, 'quantity': 2})
+        self.assertEqual(self.quantities(), {product.id: 6})
+
+
+class ExpandTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(username='jack', password='pass12345')
+        category = Category.objects.create(name='Grill', description='x' * 200)
+        products = Products.objects.bulk_create(
+            Products(name=f'Dish {i}', price=5, category=category, description='y' * 300)
+            for i in range(20)
+        )
+        Review.objects.bulk_create(Review(user=cls.user, product=p, rating=4) for p in products)
+        UserFavorites.objects.bulk_create(UserFavorites(user=cls.user, product=p) for p in products)
+
+    def setUp(self):
+        reset_caches()
+        self.client = APIClient()
+
+    def test_reviews_are_compact_by_default(self):
+        with self.assertNumQueries(1):
+            response = self.client.get('/api/reviews/')
+        review = response.data['results'][0]
+        self.assertIsInstance(review['user'], int)
+        self.assertIsInstance(review['product'], int)
+
+    def test_expand_nests_relations_without_extra_queries(self):
+        compact = self.client.get('/api/reviews/')
+        with self.assertNumQueries(1):
+            expanded = self.client.get('/api/reviews/', {'expand': 'product,user'})
+        review = expanded.data['results'][0]
+        self.assertEqual(review['user']['username'], 'jack')
+        self.assertEqual(review['product']['category']['name'], 'Grill')
+        self.assertGreater(len(expanded.content), 5 * len(compact.content))
+
+    def test_favorites_expand_product(self):
+        self.client.force_authenticate(self.user)
+        response = self.client.get('/api/favorites/')
+        self.assertIsInstance(response.data['results'][0]['product'], int)
+        response = self.client.get('/api/favorites/my_favorites/', {'expand': 'product'})
+        self.assertTrue(response.data['results'][0]['product']['is_favorite'])
+
+    def test_reviews_can_name_their_product(self):
+        self.client.force_authenticate(self.user)
+        product = Products.objects.first()
+        response = self.client.post('/api/reviews/', {'product': product.id, 'rating': 5})
+        self.assertEqual(response.status_code, 201, response.data)
+        self.assertEqual(response.data['user'], self.user.id)
+
+
+class RatingAggregateTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(username='kim', password='pass12345')
+        cls.chef = ChefsData.objects.create(name='Luigi')
+        cls.pasta = Products.objects.create(name='Pasta', price=9, chefs=cls.chef)
+        cls.soup = Products.objects.create(name='Soup', price=4, chefs=cls.chef)
+
+    def setUp(self):
+        reset_caches()
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def review(self, product, rating):
+        response = self.client.post('/api/reviews/', {'product': product.id, 'rating': rating})
+        self.assertEqual(response.status_code, 201, response.data)
+        return response.data['id']
+
+    def aggregates(self, obj):
+        obj.refresh_from_db()
+        return obj.rating_sum, obj.rating_count, obj.rating
+
+    def test_reviews_maintain_product_and_chef_aggregates(self):
+        self.review(self.pasta, 5)
+        self.review(self.pasta, 2)
+        soup_review = self.review(self.soup, 4)
+        self.assertEqual(self.aggregates(self.pasta), (7, 2, 3.5))
+        self.assertEqual(self.aggregates(self.chef), (11, 3, 11 / 3))
+
+        self.client.patch(f'/api/reviews/{soup_review}/', {'rating': 1})
+        self.assertEqual(self.aggregates(self.soup), (1, 1, 1.0))
+        self.assertEqual(self.aggregates(self.chef), (8, 3, 8 / 3))
+
+        self.client.patch(f'/api/reviews/{soup_review}/', {'product': self.pasta.id})
+        self.assertEqual(self.aggregates(self.soup), (0, 0, None))
+        self.assertEqual(self.aggregates(self.pasta), (8, 3, 8 / 3))
+
+        self.client.delete(f'/api/reviews/{soup_review}/')
+        self.assertEqual(self.aggregates(self.pasta), (7, 2, 3.5))
+        self.assertEqual(self.aggregates(self.chef), (7, 2, 3.5))
+
+    def test_edits_start_from_the_stored_rating(self):
+        review_id = self.review(self.pasta, 3)
+        stale = Review.objects.get(pk=review_id)
+        self.client.patch(f'/api/reviews/{review_id}/', {'rating': 5})
+        # A second edit that loaded the review before the first one committed.
+        serializer = ReviewSerializer(stale, data={'rating': 4}, partial=True)
+        serializer.is_valid(raise_exception=True)
+        ReviewViewSet().perform_update(serializer)
+        self.assertEqual(self.aggregates(self.pasta), (4, 1, 4.0))
+
+        ReviewViewSet().perform_destroy(stale)
+        ReviewViewSet().perform_destroy(stale)
+        self.assertEqual(self.aggregates(self.pasta), (0, 0, None))
+
+    def test_cascaded_deletes_take_the_ratings_out(self):
+        self.review(self.pasta, 5)
+        self.client.force_authenticate(User.objects.create_user(username='ivy', password='pass12345'))
+        self.review(self.soup, 2)
+        self.assertEqual(self.aggregates(self.chef), (7, 2, 3.5))
+
+        self.user.delete()
+        self.assertEqual(self.aggregates(self.pasta), (0, 0, None))
+        self.assertEqual(self.aggregates(self.chef), (2, 1, 2.0))
+        self.soup.delete()
+        self.assertEqual(self.aggregates(self.chef), (0, 0, None))
+
+    def test_moving_a_product_moves_its_ratings(self):
+        self.review(self.pasta, 5)
+        self.review(self.soup, 3)
+        other = ChefsData.objects.create(name='Rosa')
+        self.pasta.refresh_from_db()
+        self.pasta.chefs = other
+        self.pasta.save()
+        self.assertEqual(self.aggregates(self.chef), (3, 1, 3.0))
+        self.assertEqual(self.aggregates(other), (5, 1, 5.0))
+
+    def test_migration_backfills_existing_reviews(self):
+        Review.objects.create(user=self.user, product=self.pasta, rating=4)
+        Review.objects.create(user=self.user, product=self.soup, rating=2)
+        migration = importlib.import_module('api.migrations.0004_rating_aggregates')
+        state = MigrationExecutor(connection).loader.project_state(('api', '0004_rating_aggregates'))
+        migration.backfill_ratings(state.apps, None)
+        self.assertEqual(self.aggregates(self.pasta), (4, 1, 4.0))
+        self.assertEqual(self.aggregates(self.chef), (6, 2, 3.0))
+
+    def test_catalog_shows_the_new_rating(self):
+        self.client.get(f'/api/products/{self.pasta.id}/')
+        with self.captureOnCommitCallbacks(execute=True):
+            self.review(self.pasta, 4)
+        response = self.client.get(f'/api/products/{self.pasta.id}/')
+        self.assertEqual(response.data['rating'], 4.0)
+
+    def test_rebuild_command_repairs_drift(self):
+        Review.objects.create(user=self.user, product=self.pasta, rating=3)
+        Review.objects.create(user=self.user, product=self.soup, rating=5)
+        Products.objects.filter(pk=self.soup.pk).update(rating_sum=99, rating_count=1, rating=99)
+        call_command('rebuild_ratings', stdout=StringIO())
+        self.assertEqual(self.aggregates(self.pasta), (3, 1, 3.0))
+        self.assertEqual(self.aggregates(self.soup), (5, 1, 5.0))
+        self.assertEqual(self.aggregates(self.chef), (8, 2, 4.0))
+
+
+class ProductCatalogFilterTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.mains = Category.objects.create(name='Mains')
+        cls.desserts = Category.objects.create(name='Desserts')
+        cls.curry = Products.objects.create(
+            name='Green curry', price=12, category=cls.mains, discount=10,
+            description='Coconut and basil', ingredients='chicken, coconut milk', allergens='fish',
+        )
+        cls.noodles = Products.objects.create(
+            name='Sesame noodles', price=8, category=cls.mains, description='Cold noodles',
+            ingredients='wheat noodles, sesame', allergens='gluten, sesame',
+        )
+        cls.cake = Products.objects.create(
+            name='Lemon cake', price=5, category=cls.desserts, is_available=False,
+            description='Baked daily', ingredients='flour, lemon, butter', allergens='gluten, dairy',
+        )
+
+    def setUp(self):
+        reset_caches()
+        self.client = APIClient()
+
+    def names(self, **params):
+        response = self.client.get('/api/products/', params)
+        self.assertEqual(response.status_code, 200, response.data)
+        return [product['name'] for product in response.data['results']]
+
+    def test_filters(self):
+        self.assertEqual(self.names(category=self.mains.id), ['Green curry', 'Sesame noodles'])
+        self.assertEqual(self.names(available='false'), ['Lemon cake'])
+        self.assertEqual(self.names(min_price=6, max_price=10), ['Sesame noodles'])
+        self.assertEqual(self.names(exclude_allergens='gluten'), ['Green curry'])
+        self.assertEqual(self.names(exclude_allergens='fish, dairy'), ['Sesame noodles'])
+
+    def test_allergens_match_whole_entries(self):
+        Products.objects.create(name='Baba ganoush', price=7, allergens='Eggplant, Tree nuts')
+        bump_catalog_version('products')
+        self.assertIn('Baba ganoush', self.names(exclude_allergens='egg'))
+        self.assertNotIn('Baba ganoush', self.names(exclude_allergens='EGGPLANT'))
+        self.assertNotIn('Baba ganoush', self.names(exclude_allergens='tree nuts'))
+
+    def test_sorting(self):
+        self.assertEqual(self.names(ordering='price'), ['Lemon cake', 'Sesame noodles', 'Green curry'])
+        self.assertEqual(self.names(ordering='-price'), ['Green curry', 'Sesame noodles', 'Lemon cake'])
+        self.assertEqual(self.names(ordering='-discount')[0], 'Green curry')
+
+    def test_sorted_pages_follow_cursors(self):
+        Products.objects.bulk_create(Products(name=f'Side {i}', price=i % 7) for i in range(30))
+        bump_catalog_version('products')
+        prices, url = [], '/api/products/?ordering=price&page_size=7'
+        while url:
+            response = self.client.get(url)
+            prices.extend(product['price'] for product in response.data['results'])
+            url = response.data['next']
+        self.assertEqual(len(prices), 33)
+        self.assertEqual(prices, sorted(prices))
+
+    def test_full_text_search(self):
+        self.assertEqual(self.names(search='coconut'), ['Green curry'])
+        self.assertEqual(self.names(search='noodle'), ['Sesame noodles'])
+        self.assertEqual(self.names(search='lem'), ['Lemon cake'])
+        self.assertEqual(self.names(search='sesame cold'), ['Sesame noodles'])
+        self.assertEqual(self.names(search='sesame', category=self.desserts.id), [])
+
+    def test_search_index_follows_writes(self):
+        self.cake.description = 'Topped with pistachio'
+        self.cake.save()
+        self.assertEqual(self.names(search='pistachio'), ['Lemon cake'])
+        self.curry.delete()
+        self.assertEqual(self.names(search='coconut'), [])
+
+    def test_missing_triggers_are_repaired(self):
+        if connection.vendor != 'sqlite':
+            self.skipTest('SQLite FTS5 only')
+        with connection.cursor() as cursor:
+            cursor.execute('DROP TRIGGER api_products_fts_insert')
+        Products.objects.create(name='Mango lassi', price=3)
+        repair_search_index(connection)
+        self.assertEqual(self.names(search='mango'), ['Mango lassi'])
+
+    def test_invalid_parameters(self):
+        response = self.client.get('/api/products/', {'ordering': 'name', 'min_price': 'cheap'})
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(set(response.data), {'ordering', 'min_price'})
+
+
+class ActiveAdsTests(TestCase):
+    def setUp(self):
+        reset_caches()
+        self.client = APIClient()
+        self.now = timezone.now()
+
+    def ad(self, title, start, end, is_active=True):
+        return Ads.objects.create(
+            title=title, description='', is_active=is_active,
+            start_date=self.now + timedelta(hours=start), end_date=self.now + timedelta(hours=end),
+        )
+
+    def active_titles(self):
+        response = self.client.get('/api/ads/active/')
+        return [ad['title'] for ad in response.data]
+
+    def test_only_running_ads_are_served(self):
+        self.ad('Running', -1, 1)
+        self.ad('Expired', -3, -2)
+        self.ad('Upcoming', 2, 3)
+        self.ad('Paused', -1, 1, is_active=False)
+        self.assertEqual(self.active_titles(), ['Running'])
+
+    def test_cached_until_the_next_schedule_boundary(self):
+        self.ad('Running', -1, 1)
+        self.ad('Upcoming', 2, 3)
+        self.active_titles()
+        with self.assertNumQueries(0):
+            self.assertEqual(self.active_titles(), ['Running'])
+
+        later = time.monotonic() + 2 * 3600
+        with mock.patch('api.cache.time.monotonic', return_value=later), \
+                mock.patch('api.views.timezone.now', return_value=self.now + timedelta(hours=2, minutes=1)):
+            self.assertEqual(self.active_titles(), ['Upcoming'])
+
+    def test_only_the_etag_validates_running_ads(self):
+        self.ad('Running', -1, 1)
+        response = self.client.get('/api/ads/active/')
+        self.assertNotIn('Last-Modified', response.headers)
+        since = http_date(time.time() + 3600)
+        self.assertEqual(self.client.get('/api/ads/active/', HTTP_IF_MODIFIED_SINCE=since).status_code, 200)
+        self.assertEqual(
+            self.client.get('/api/ads/active/', HTTP_IF_NONE_MATCH=response.headers['ETag']).status_code, 304
+        )
+
+    def test_saving_an_ad_refreshes_the_cache(self):
+        running = self.ad('Running', -1, 1)
+        self.active_titles()
+        running.is_active = False
+        running.save()
+        self.assertEqual(self.active_titles(), [])
+
+
+def image_upload(name='dish.png', size=(200, 100), mode='RGB'):
+    buffer = io.BytesIO()
+    Image.new(mode, size, (200, 80, 40, 128)[:len(mode)]).save(buffer, 'PNG')
+    return SimpleUploadedFile(name, buffer.getvalue(), content_type='image/png')
+
+
+class ImageDerivativeTests(TestCase):
+    def setUp(self):
+        reset_caches()
+        self.media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.media_root, ignore_errors=True)
+        overrides = override_settings(
+            MEDIA_ROOT=self.media_root,
+            IMAGE_DERIVATIVES={'WIDTHS': (40, 80, 400), 'ASYNC': False},
+        )
+        overrides.enable()
+        self.addCleanup(overrides.disable)
+
+    def create_product(self, **kwargs):
+        with self.captureOnCommitCallbacks(execute=True):
+            return Products.objects.create(name='Pho', price=9, **kwargs)
+
+    def test_upload_builds_jpeg_and_webp_without_upscaling(self):
+        product = self.create_product(image=image_upload())
+        product.refresh_from_db()
+        variants = product.image_variants
+        self.assertEqual(variants['source'], product.image.name)
+        self.assertEqual((variants['width'], variants['height']), (200, 100))
+        self.assertEqual(sorted(variants['jpeg']), ['40', '80'])
+        self.assertEqual(sorted(variants['webp']), ['40', '80'])
+        with default_storage.open(variants['webp']['80']) as stored:
+            image = Image.open(stored)
+            self.assertEqual((image.format, image.size), ('WEBP', (80, 40)))
+
+    def test_transparent_images_fall_back_to_png(self):
+        product = self.create_product(image=image_upload(mode='RGBA'))
+        product.refresh_from_db()
+        self.assertNotIn('jpeg', product.image_variants)
+        self.assertEqual(sorted(product.image_variants['png']), ['40', '80'])
+
+    def test_catalog_serializers_expose_srcset(self):
+        product = self.create_product(image=image_upload())
+        response = APIClient().get(f'/api/products/{product.id}/')
+        srcset = response.data['image_srcset']
+        self.assertEqual(sorted(srcset), ['jpeg', 'webp'])
+        self.assertTrue(srcset['webp']['40w'].startswith('http://testserver/media/'))
+        self.assertNotIn('image_variants', response.data)
+
+    def test_replacing_or_clearing_the_image_refreshes_variants(self):
+        product = self.create_product(image=image_upload())
+        product.refresh_from_db()
+        with self.captureOnCommitCallbacks(execute=True):
+            product.image = image_upload('other.png', size=(60, 60))
+            product.save()
+        product.refresh_from_db()
+        self.assertEqual(product.image_variants['source'], product.image.name)
+        self.assertEqual(sorted(product.image_variants['webp']), ['40'])
+
+        with self.captureOnCommitCallbacks(execute=True):
+            product.image = None
+            product.save()
+        product.refresh_from_db()
+        self.assertEqual(product.image_variants, {})
+
+    def test_superseded_variants_are_deleted_unless_shared(self):
+        product = self.create_product(image=image_upload())
+        twin = self.create_product(image=image_upload())
+        product.refresh_from_db()
+        old_files = [name for fmt in ('jpeg', 'webp') for name in product.image_variants[fmt].values()]
+        with self.captureOnCommitCallbacks(execute=True):
+            product.image = image_upload('other.png', size=(60, 60))
+            product.save()
+        # Same content, same files: the twin still lists them.
+        self.assertTrue(all(default_storage.exists(name) for name in old_files))
+
+        twin.refresh_from_db()
+        with self.captureOnCommitCallbacks(execute=True):
+            twin.image = None
+            twin.save()
+        self.assertFalse(any(default_storage.exists(name) for name in old_files))
+
+    def test_saves_that_keep_the_image_do_not_schedule_work(self):
+        product = self.create_product(image=image_upload())
+        product.refresh_from_db()
+        with self.captureOnCommitCallbacks() as callbacks:
+            product.quantity = 5
+            product.save()
+        self.assertEqual(callbacks, [])
+
+    def test_unreadable_images_are_recorded_not_raised(self):
+        broken = SimpleUploadedFile('broken.png', b'not an image', content_type='image/png')
+        with self.assertLogs('api.images', 'ERROR'):
+            product = self.create_product(image=broken)
+        product.refresh_from_db()
+        self.assertEqual(product.image_variants['error'], 'unreadable image')
+
+    def test_backfill_command_builds_missing_variants(self):
+        product = self.create_product(image=image_upload())
+        chef = ChefsData.objects.create(name='Rosa')
+        ChefsData.objects.filter(pk=chef.pk).update(profile_picture=default_storage.save('chefs/rosa.png', image_upload()))
+        Products.objects.filter(pk=product.pk).update(image_variants={})
+        out = StringIO()
+        call_command('generate_image_derivatives', workers=1, stdout=out)
+        self.assertIn('Built derivatives for 2 images', out.getvalue())
+        chef.refresh_from_db()
+        self.assertEqual(sorted(chef.profile_picture_variants['webp']), ['40', '80'])
+        self.assertTrue(Products.objects.get(pk=product.pk).image_variants['webp'])
+
+
+class MediaStorageTests(TestCase):
+    def setUp(self):
+        self.media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.media_root, ignore_errors=True)
+        overrides = override_settings(MEDIA_ROOT=self.media_root)
+        overrides.enable()
+        self.addCleanup(overrides.disable)
+        self.body = bytes(range(256)) * 4
+        self.name = default_storage.save('products/Menu.PDF', ContentFile(self.body))
+
+    def test_identical_uploads_share_one_content_addressed_file(self):
+        digest = hashlib.sha256(self.body).hexdigest()
+        self.assertEqual(self.name, f'{digest[:2]}/{digest[2:4]}/{digest}.pdf')
+        self.assertEqual(default_storage.save('ads/copy.pdf', ContentFile(self.body)), self.name)
+        self.assertNotEqual(default_storage.save('ads/other.pdf', ContentFile(b'other')), self.name)
+        stored = [name for _, _, names in os.walk(self.media_root) for name in names]
+        self.assertEqual(len(stored), 2)
+
+    def test_hashed_media_is_immutable_and_revalidates_by_digest(self):
+        response = self.client.get(default_storage.url(self.name))
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(b''.join(response.streaming_content), self.body)
+        self.assertEqual(response['Content-Type'], 'application/pdf')
+        self.assertIn('immutable', response['Cache-Control'])
+        self.assertIn('max-age=31536000', response['Cache-Control'])
+        self.assertEqual(response['ETag'], f'"{hashlib.sha256(self.body).hexdigest()}"')
+
+        response = self.client.get(default_storage.url(self.name), HTTP_IF_NONE_MATCH=response['ETag'])
+        self.assertEqual(response.status_code, 304)
+
+    def test_byte_ranges(self):
+        url = default_storage.url(self.name)
+        response = self.client.get(url, HTTP_RANGE='bytes=10-19')
+        self.assertEqual(response.status_code, 206)
+        self.assertEqual(response['Content-Range'], f'bytes 10-19/{len(self.body)}')
+        self.assertEqual(b''.join(response.streaming_content), self.body[10:20])
+
+        response = self.client.get(url, HTTP_RANGE='bytes=-4')
+        self.assertEqual(b''.join(response.streaming_content), self.body[-4:])
+
+        response = self.client.get(url, HTTP_RANGE=f'bytes={len(self.body)}-')
+        self.assertEqual(response.status_code, 416)
+
+        response = self.client.get(url, HTTP_RANGE='bytes=0-3', HTTP_IF_RANGE='"stale"')
+        self.assertEqual(response.status_code, 200)
+
+    def test_sendfile_hands_the_transfer_to_the_front_server(self):
+        with self.settings(MEDIA_SENDFILE='x-accel-redirect'):
+            response = self.client.get(default_storage.url(self.name))
+        self.assertEqual(response['X-Accel-Redirect'], f'/protected-media/{self.name}')
+        self.assertEqual(response.content, b'')
+        self.assertIn('immutable', response['Cache-Control'])
+
+    def test_legacy_names_revalidate_and_traversal_is_rejected(self):
+        os.makedirs(os.path.join(self.media_root, 'products'))
+        with open(os.path.join(self.media_root, 'products', 'old.jpg'), 'wb') as file:
+            file.write(b'old')
+        response = self.client.get('/media/products/old.jpg')
+        self.assertEqual(response.status_code, 200)
+        self.assertIn('no-cache', response['Cache-Control'])
+        self.assertEqual(self.client.get('/media/../manage.py').status_code, 404)
+        self.assertEqual(self.client.get('/media/products/missing.jpg').status_code, 404)
+
+
+class AsyncReadViewTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(username='hana', password='pass12345')
+        cls.category = Category.objects.create(name='Noodles')
+        Products.objects.bulk_create(
+            Products(name=f'Product {i}', price=i, category=cls.category if i % 2 else None) for i in range(25)
+        )
+        cls.product = Products.objects.order_by('id').first()
+        UserFavorites.objects.create(user=cls.user, product=cls.product)
+        cls.token = str(RefreshToken.for_user(cls.user).access_token)
+
+    def setUp(self):
+        reset_caches()
+
+    def auth(self):
+        return {'headers': {'Authorization': f'Bearer {self.token}'}}
+
+    async def test_product_detail_matches_the_sync_view(self):
+        sync_response = await sync_to_async(self.client.get)(f'/api/products/{self.product.id}/', **self.auth())
+        response = await self.async_client.get(f'/api/async/products/{self.product.id}/', **self.auth())
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json(), sync_response.json())
+        self.assertTrue(response.json()['is_favorite'])
+
+        response = await self.async_client.get('/api/async/products/999999/')
+        self.assertEqual(response.status_code, 404)
+
+    async def test_product_list_filters_and_pages_by_offset(self):
+        response = await self.async_client.get('/api/async/products/', {'limit': 10, 'ordering': '-price'})
+        data = response.json()
+        self.assertEqual([p['price'] for p in data['results']][:2], [24.0, 23.0])
+        self.assertEqual(len(data['results']), 10)
+        self.assertIn('offset=10', data['next'])
+        self.assertIsNone(data['previous'])
+
+        response = await self.async_client.get('/api/async/products/', {'category': self.category.id, 'offset': 10})
+        data = response.json()
+        self.assertEqual(len(data['results']), 2)
+        self.assertIsNone(data['next'])
+        self.assertNotIn('offset', data['previous'])
+
+        response = await self.async_client.get('/api/async/products/', {'min_price': 'cheap'})
+        self.assertEqual(response.status_code, 400)
+
+    async def test_categories(self):
+        response = await self.async_client.get('/api/async/categories/')
+        self.assertEqual([c['name'] for c in response.json()['results']], ['Noodles'])
+
+    async def test_current_user_and_favorites_require_a_valid_token(self):
+        response = await self.async_client.get('/api/async/users/me/')
+        self.assertEqual(response.status_code, 401)
+        response = await self.async_client.get('/api/async/users/me/', headers={'Authorization': 'Bearer nope'})
+        self.assertEqual(response.status_code, 401)
+
+        response = await self.async_client.get('/api/async/users/me/', **self.auth())
+        self.assertEqual(response.json()['username'], 'hana')
+
+        response = await self.async_client.get(
+            '/api/async/favorites/my_favorites/', {'expand': 'product'}, **self.auth()
+        )
+        results = response.json()['results']
+        self.assertEqual([f['product']['id'] for f in results], [self.product.id])
+        self.assertTrue(results[0]['product']['is_favorite'])
+
+    async def test_only_reads_are_allowed(self):
+        response = await self.async_client.post('/api/async/products/')
+        self.assertEqual(response.status_code, 405)
+
+
+class OrderStatusSocketTests(TransactionTestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username='ivan', password='pass12345')
+        self.other = User.objects.create_user(username='judy', password='pass12345')
+        self.order = Order.objects.create(user=self.user, total=10)
+
+    async def connect(self, token=None):
+        query = f'token={token}'.encode() if token else b''
+        communicator = ApplicationCommunicator(
+            asgi_application, {'type': 'websocket', 'path': '/ws/orders/', 'query_string': query, 'headers': []}
+        )
+        await communicator.send_input({'type': 'websocket.connect'})
+        return communicator, await communicator.receive_output(timeout=2)
+
+    async def receive_json(self, communicator):
+        message = await communicator.receive_output(timeout=2)
+        return json.loads(message['text'])
+
+    async def test_sockets_without_a_valid_token_are_rejected(self):
+        for token in (None, 'garbage'):
+            _, message = await self.connect(token)
+            self.assertEqual(message, {'type': 'websocket.close', 'code': 4401})
+
+    async def test_status_transitions_are_pushed_to_the_owner_only(self):
+        owner, message = await self.connect(str(AccessToken.for_user(self.user)))
+        self.assertEqual(message['type'], 'websocket.accept')
+        other, _ = await self.connect(str(AccessToken.for_user(self.other)))
+
+        def complete_order():
+            order = Order.objects.get(pk=self.order.pk)
+            order.total = 12
+            order.save()
+            order.status = 'Completed'
+            order.save()
+            Payment.objects.create(order=order, payment_method='card', payment_status='Completed', amount=12)
+
+        await sync_to_async(complete_order)()
+        self.assertEqual(await self.receive_json(owner), {
+            'event': 'order.status', 'order': self.order.pk, 'status': 'Completed', 'previous_status': 'Pending',
+        })
+        payment = await self.receive_json(owner)
+        self.assertEqual((payment['event'], payment['status'], payment['previous_status']),
+                         ('payment.status', 'Completed', None))
+        self.assertTrue(await owner.receive_nothing())
+        self.assertTrue(await other.receive_nothing())
+        await owner.send_input({'type': 'websocket.disconnect', 'code': 1000})
+        await other.send_input({'type': 'websocket.disconnect', 'code': 1000})
+
+
+class StatelessAuthTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(username='kira', password='pass12345', is_staff=True)
+        cls.product = Products.objects.create(name='Dumplings', price=6, quantity=10)
+
+    def setUp(self):
+        reset_caches()
+        self.client = APIClient()
+        response = self.client.post('/api/token/', {'username': 'kira', 'password': 'pass12345'})
+        self.access, self.refresh = response.data['access'], response.data['refresh']
+        self.client.credentials(HTTP_AUTHORIZATION=f'Bearer {self.access}')
+
+    @contextmanager
+    def assertNoUserQueries(self):
+        # The denylist lookup may hit the database cache table; the user table never.
+        with CaptureQueriesContext(connection) as queries:
+            yield
+        user_table = User._meta.db_table
+        self.assertEqual([q['sql'] for q in queries.captured_queries if user_table in q['sql']], [])
+
+    def test_tokens_carry_the_claims_the_token_user_needs(self):
+        token = AccessToken(self.access)
+        self.assertEqual((token['username'], token['is_staff']), ('kira', True))
+        with self.assertNoUserQueries():
+            response = self.client.get('/api/catalog-cache/stats/')
+        self.assertEqual(response.status_code, 200)
+
+    def test_full_user_is_cached_briefly_and_dropped_on_save(self):
+        self.assertEqual(self.client.get('/api/users/me/').data['username'], 'kira')
+        with self.assertNoUserQueries():
+            self.client.get('/api/users/me/')
+        User.objects.filter(pk=self.user.pk).update(first_name='Stale')
+        user = User.objects.get(pk=self.user.pk)
+        user.first_name = 'Kira'
+        user.save()
+        self.assertEqual(self.client.get('/api/users/me/').data['first_name'], 'Kira')
+        # Profile edits keep the session alive.
+        self.assertEqual(self.client.get('/api/users/me/').status_code, 200)
+
+    def test_writes_use_the_token_user_id(self):
+        response = self.client.post(
+            '/api/orders/', {'items': [{'product': self.product.id, 'quantity': 2}]}, format='json'
+        )
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(Order.objects.get().user_id, self.user.id)
+
+    def test_revoking_the_current_tokens(self):
+        response = self.client.post('/api/token/revoke/', {'refresh': self.refresh})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(self.client.get('/api/users/me/').status_code, 401)
+        response = APIClient().post('/api/token/refresh/', {'refresh': self.refresh})
+        self.assertEqual(response.status_code, 401)
+
+    def test_revoking_every_session(self):
+        other_refresh = RefreshToken.for_user(self.user)
+        self.client.post('/api/token/revoke/', {'all': True})
+        response = APIClient().post('/api/token/refresh/', {'refresh': str(other_refresh)})
+        self.assertEqual(response.status_code, 401)
+
+    def test_deactivating_or_demoting_a_user_ends_their_sessions(self):
+        self.user.is_staff = False
+        self.user.save()
+        self.assertEqual(self.client.get('/api/users/me/').status_code, 401)
+
+    def test_tokens_issued_right_after_a_password_change_are_valid(self):
+        self.user.set_password('fresh12345')
+        self.user.save()
+        self.assertEqual(self.client.get('/api/users/me/').status_code, 401)
+        # Usually within the same second as the change.
+        response = APIClient().post('/api/token/', {'username': 'kira', 'password': 'fresh12345'})
+        client = APIClient()
+        client.credentials(HTTP_AUTHORIZATION=f"Bearer {response.data['access']}")
+        self.assertEqual(client.get('/api/users/me/').status_code, 200)
+        refreshed = APIClient().post('/api/token/refresh/', {'refresh': response.data['refresh']})
+        client.credentials(HTTP_AUTHORIZATION=f"Bearer {refreshed.data['access']}")
+        self.assertEqual(client.get('/api/users/me/').status_code, 200)
+
+    def test_refresh_tokens_of_other_users_cannot_be_revoked(self):
+        other = User.objects.create_user(username='leo', password='pass12345')
+        response = self.client.post('/api/token/revoke/', {'refresh': str(RefreshToken.for_user(other))})
+        self.assertEqual(response.status_code, 400)
+
+
+class MetricsTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.staff = User.objects.create_user(username='mona', password='pass12345', is_staff=True)
+        cls.user = User.objects.create_user(username='nate', password='pass12345')
+        Products.objects.bulk_create(Products(name=f'Product {i}', price=i) for i in range(3))
+
+    def setUp(self):
+        reset_caches()
+        metrics.registry.clear()
+
+    def bearer(self, user):
+        token = ClaimsTokenObtainPairSerializer.get_token(user).access_token
+        return {'HTTP_AUTHORIZATION': f'Bearer {token}'}
+
+    def test_histograms_render_in_prometheus_format(self):
+        registry = metrics.MetricsRegistry()
+        registry.define('demo_seconds', 'Demo.', ('view',), (0.1, 1))
+        for value in (0.05, 0.5, 5):
+            registry.observe('demo_seconds', ('a"b',), value)
+        self.assertEqual(registry.render().splitlines(), [
+            '# HELP demo_seconds Demo.',
+            '# TYPE demo_seconds histogram',
+            'demo_seconds_bucket{view="a\\"b",le="0.1"} 1',
+            'demo_seconds_bucket{view="a\\"b",le="1"} 2',
+            'demo_seconds_bucket{view="a\\"b",le="+Inf"} 3',
+            'demo_seconds_sum{view="a\\"b"} 5.550000',
+            'demo_seconds_count{view="a\\"b"} 3',
+        ])
+
+    def test_requests_are_recorded_per_view(self):
+        self.client.get('/api/products/')
+        self.client.get('/api/products/')
+        response = self.client.get('/api/metrics/', **self.bearer(self.staff))
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response['Content-Type'].startswith('text/plain; version=0.0.4'))
+        body = response.content.decode()
+        labels = 'view="products-list",method="GET"'
+        self.assertIn(f'http_request_duration_seconds_count{{{labels},status="200"}} 2', body)
+        self.assertIn(f'http_request_db_queries_count{{{labels}}} 2', body)
+        self.assertIn(f'http_request_serialize_duration_seconds_count{{{labels}}} 2', body)
+        self.assertIn(f'http_request_render_duration_seconds_count{{{labels}}} 2', body)
+        self.assertIn(f'http_response_size_bytes_count{{{labels}}} 2', body)
+        # The cached second response ran no queries.
+        self.assertIn(f'http_request_db_queries_bucket{{{labels},le="0"}} 1', body)
+
+    def test_only_api_serializers_are_timed(self):
+        class PlainSerializer(serializers.Serializer):
+            name = serializers.CharField()
+
+        stats = metrics.RequestStats()
+        token = metrics.current_stats.set(stats)
+        try:
+            PlainSerializer(Products.objects.all(), many=True).data
+            self.assertEqual(stats.serialize_time, 0)
+            ProductsSerializer(Products.objects.all(), many=True, context={'favorite_ids': frozenset()}).data
+        finally:
+            metrics.current_stats.reset(token)
+        self.assertGreater(stats.serialize_time, 0)
+        self.assertEqual(stats.serializer_depth, 0)
+
+    def test_metrics_are_staff_only(self):
+        self.assertEqual(self.client.get('/api/metrics/', **self.bearer(self.user)).status_code, 403)
+
+    def test_staff_can_profile_a_request(self):
+        def slow_ordering(params):
+            time.sleep(0.05)
+            return ('id',)
+
+        with mock.patch('api.views.product_ordering', side_effect=slow_ordering):
+            response = self.client.get('/api/products/?profile=1', **self.bearer(self.staff))
+            self.assertEqual(response['Content-Type'], 'text/plain; charset=utf-8')
+            self.assertEqual(response['X-Profile-Status'], '200')
+            stacks = response.content.decode().splitlines()
+            self.assertTrue(any('slow_ordering' in line for line in stacks))
+            stack, count = stacks[0].rsplit(' ', 1)
+            self.assertIn(';', stack)
+            self.assertGreater(int(count), 0)
+
+            response = self.client.get('/api/products/?profile=1', **self.bearer(self.user))
+            self.assertEqual(response['Content-Type'], 'application/json')
+
+
+class BenchmarkTests(TestCase):
+    def setUp(self):
+        reset_caches()
+        seed_database({
+            'users': 6, 'categories': 3, 'chefs': 2, 'products': 30, 'reviews': 20, 'orders': 10,
+            'carts': 4, 'ads': 2, 'favorites_per_user': 3,
+        })
+
+    def test_every_scenario_runs_without_errors(self):
+        report = run_benchmarks(iterations=3)
+        self.assertEqual(set(report), set(SCENARIOS))
+        for name, result in report.items():
+            self.assertEqual(result['errors'], 0, name)
+            self.assertEqual(result['requests'], 3)
+            self.assertLessEqual(result['p50_ms'], result['max_ms'])
+        self.assertGreater(report['checkout']['mean_queries'], 0)
+
+    def test_loadtest_compares_both_stacks(self):
+        # Stand-in servers: gunicorn and uvicorn are not installed here.
+        server = f'{sys.executable} -m http.server {{port}} --bind 127.0.0.1'
+        out = StringIO()
+        call_command(
+            'loadtest', '/', '--compare', '--wsgi-command', server, '--asgi-command', server,
+            '--concurrency', '2', '--duration', '0.3', '--warmup', '0', '--json', stdout=out,
+        )
+        results = json.loads(out.getvalue())
+        self.assertEqual([(r['stack'], r['path']) for r in results], [('wsgi', '/'), ('asgi', '/')])
+        for result in results:
+            self.assertGreater(result['requests'], 0)
+            self.assertEqual(result['errors'], 0)
+
+
+@override_settings(DATABASE_WRITE_RETRY={'ATTEMPTS': 3, 'BACKOFF': 0})
+class WriteRetryTests(TransactionTestCase):
+    def failing(self, *errors):
+        calls = []
+
+        @retry_on_lock
+        def write():
+            calls.append(1)
+            if len(calls) <= len(errors):
+                raise errors[len(calls) - 1]
+            return 'done'
+
+        return write, calls
+
+    def test_lock_errors_are_retried(self):
+        write, calls = self.failing(OperationalError('database is locked'), OperationalError('database is locked'))
+        self.assertEqual(write(), 'done')
+        self.assertEqual(len(calls), 3)
+
+    def test_gives_up_after_the_last_attempt(self):
+        write, calls = self.failing(*[OperationalError('database is locked')] * 3)
+        with self.assertRaises(OperationalError):
+            write()
+        self.assertEqual(len(calls), 3)
+
+    def test_other_errors_and_inner_transactions_are_not_retried(self):
+        write, calls = self.failing(OperationalError('no such table: api_products'))
+        with self.assertRaises(OperationalError):
+            write()
+        self.assertEqual(len(calls), 1)
+
+        write, calls = self.failing(OperationalError('database is locked'))
+        with self.assertRaises(OperationalError), transaction.atomic():
+            write()
+        self.assertEqual(len(calls), 1)
+
+    def test_mixed_load_runs_from_several_threads(self):
+        if connection.vendor == 'sqlite' and connection.is_in_memory_db():
+            self.skipTest('needs a database that allows concurrent writers')
+        seed_database({
+            'users': 6, 'categories': 3, 'chefs': 2, 'products': 30, 'reviews': 10, 'orders': 5,
+            'carts': 6, 'ads': 2, 'favorites_per_user': 2,
+        })
+        report = run_mixed(threads=2, duration=0.5, users_per_thread=3)
+        self.assertGreater(report['requests'], 0)
+        self.assertEqual(report['errors'], 0)
+        self.assertEqual(set(report['scenarios']), set(DEFAULT_MIX))
+
+
+class OrderHistoryTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(username='hana', password='pass12345')
+        cls.other = User.objects.create_user(username='ivan', password='pass12345')
+        cls.staff = User.objects.create_user(username='judy', password='pass12345', is_staff=True)
+        cls.pizza = Products.objects.create(name='Pizza', price=10, quantity=100)
+        cls.soup = Products.objects.create(name='Soup', price=4, quantity=100)
+
+    def setUp(self):
+        reset_caches()
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def order(self, user, lines, date, status='Completed'):
+        order = place_order(user.id, lines, status=status)
+        Order.objects.filter(pk=order.pk).update(order_date=date)
+        return order
+
+    def test_users_only_see_their_own_orders(self):
+        mine = self.order(self.user, [(self.pizza.id, 1)], timezone.now())
+        theirs = self.order(self.other, [(self.soup.id, 1)], timezone.now())
+        response = self.client.get('/api/orders/')
+        self.assertEqual([o['id'] for o in response.data['results']], [mine.id])
+        self.assertEqual(self.client.get(f'/api/orders/{theirs.id}/').status_code, 404)
+
+        self.client.force_authenticate(self.staff)
+        response = self.client.get('/api/orders/')
+        self.assertEqual({o['id'] for o in response.data['results']}, {mine.id, theirs.id})
+        response = self.client.get('/api/orders/', {'user': self.other.id})
+        self.assertEqual([o['id'] for o in response.data['results']], [theirs.id])
+
+    def test_list_query_count_does_not_grow_with_orders(self):
+        for count in (2, 10):
+            for _ in range(count):
+                self.order(self.user, [(self.pizza.id, 1), (self.soup.id, 2)], timezone.now())
+            # One query for the page, one for the items and their product names.
+            with self.subTest(count=count), self.assertNumQueries(2):
+                response = self.client.get('/api/orders/')
+            self.assertEqual(response.data['results'][0]['items'][0]['product_name'], 'Pizza')
+
+    def test_summary_is_aggregated_in_the_database(self):
+        now = timezone.now()
+        self.order(self.user, [(self.pizza.id, 2)], now - timedelta(days=62))
+        self.order(self.user, [(self.pizza.id, 1), (self.soup.id, 3)], now)
+        self.order(self.user, [(self.soup.id, 5)], now, status='Cancelled')
+        self.order(self.other, [(self.soup.id, 9)], now)
+        with self.assertNumQueries(3):
+            response = self.client.get('/api/orders/summary/')
+        self.assertEqual(response.data['orders'], 3)
+        self.assertEqual(response.data['cancelled'], 1)
+        self.assertEqual(response.data['lifetime_spend'], 42)
+        self.assertEqual([row['spend'] for row in response.data['monthly']], [20, 22])
+        self.assertEqual(response.data['monthly'][-1]['month'], now.strftime('%Y-%m'))
+        self.assertEqual(
+            [(row['name'], row['quantity'], row['spend']) for row in response.data['top_products']],
+            [('Pizza', 3, 30), ('Soup', 3, 12)],
+        )
+
+
+class SalesRollupTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(username='kim', password='pass12345')
+        cls.staff = User.objects.create_user(username='lee', password='pass12345', is_staff=True)
+        cls.chef = ChefsData.objects.create(name='Ana')
+        cls.pizzas = Category.objects.create(name='Pizza')
+        cls.margherita = Products.objects.create(
+            name='Margherita', price=10, quantity=100, category=cls.pizzas, chefs=cls.chef,
+        )
+        cls.salami = Products.objects.create(name='Salami', price=12, quantity=100, category=cls.pizzas)
+        cls.day = timezone.now().replace(hour=0, minute=0, second=0, microsecond=0) - timedelta(days=3)
+
+    def setUp(self):
+        reset_caches()
+
+    def order(self, lines, at, status='Completed'):
+        order = place_order(self.user.id, lines, status=status)
+        Order.objects.filter(pk=order.pk).update(order_date=at)
+        return Order.objects.get(pk=order.pk)
+
+    def rollup(self, period, dimension, key):
+        return list(
+            SalesRollup.objects.filter(period=period, dimension=dimension, key=key)
+            .order_by('bucket').values_list('orders', 'units', 'revenue')
+        )
+
+    def test_rollups_by_period_and_dimension(self):
+        self.order([(self.margherita.id, 2), (self.salami.id, 1)], self.day + timedelta(hours=9, minutes=5))
+        self.order([(self.margherita.id, 1)], self.day + timedelta(hours=9, minutes=50))
+        self.order([(self.salami.id, 3)], self.day + timedelta(hours=18))
+        self.order([(self.salami.id, 5)], self.day + timedelta(hours=19), status='Cancelled')
+        refresh_sales_rollups()
+
+        self.assertEqual(self.rollup('day', 'product', self.margherita.id), [(2, 3, 30)])
+        self.assertEqual(self.rollup('hour', 'product', self.salami.id), [(1, 1, 12), (1, 3, 36)])
+        self.assertEqual(self.rollup('day', 'category', self.pizzas.id), [(3, 7, 78)])
+        self.assertEqual(self.rollup('hour', 'chef', self.chef.id), [(2, 3, 30)])
+        # Salami has no chef.
+        self.assertEqual(self.rollup('day', 'chef', 0), [(2, 4, 48)])
+
+    def test_refresh_only_recomputes_from_the_high_water_mark(self):
+        self.order([(self.margherita.id, 1)], self.day)
+        refresh_sales_rollups()
+        old_row = SalesRollup.objects.get(period='day', dimension='product', key=self.margherita.id)
+
+        self.order([(self.margherita.id, 4)], timezone.now() - timedelta(seconds=1))
+        result = refresh_sales_rollups()
+        self.assertGreater(result['since'], self.day)
+        self.assertTrue(SalesRollup.objects.filter(pk=old_row.pk).exists())
+        self.assertEqual(self.rollup('day', 'product', self.margherita.id), [(1, 1, 10), (1, 4, 40)])
+
+        # A second run with nothing new changes nothing.
+        refresh_sales_rollups()
+        self.assertEqual(self.rollup('day', 'product', self.margherita.id), [(1, 1, 10), (1, 4, 40)])
+
+    def test_status_change_rewinds_the_high_water_mark(self):
+        order = self.order([(self.margherita.id, 2)], self.day)
+        refresh_sales_rollups()
+        order.status = 'Cancelled'
+        order.save()
+        self.assertEqual(RollupState.objects.get().high_water_mark, self.day)
+        refresh_sales_rollups()
+        self.assertEqual(self.rollup('day', 'product', self.margherita.id), [])
+
+    def test_line_edits_rewind_the_high_water_mark(self):
+        order = self.order([(self.margherita.id, 2), (self.salami.id, 1)], self.day)
+        refresh_sales_rollups()
+        item = order.items.get(product=self.margherita)
+        item.quantity = 5
+        item.save()
+        self.assertEqual(RollupState.objects.get().high_water_mark, self.day)
+        refresh_sales_rollups()
+        self.assertEqual(self.rollup('day', 'product', self.margherita.id), [(1, 5, 50)])
+
+        order.items.get(product=self.salami).delete()
+        self.assertEqual(RollupState.objects.get().high_water_mark, self.day)
+        refresh_sales_rollups()
+        self.assertEqual(self.rollup('day', 'product', self.salami.id), [])
+
+        # Deleting the order cascades to its remaining lines.
+        order.delete()
+        refresh_sales_rollups()
+        self.assertEqual(self.rollup('day', 'product', self.margherita.id), [])
+
+    def test_staff_api(self):
+        self.order([(self.margherita.id, 2)], self.day + timedelta(hours=1))
+        client = APIClient()
+        client.force_authenticate(self.user)
+        self.assertEqual(client.get('/api/analytics/sales/').status_code, 403)
+
+        client.force_authenticate(self.staff)
+        response = client.post('/api/analytics/sales/refresh/', {}, format='json')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['since'], None)
+        with self.assertNumQueries(1):
+            response = client.get('/api/analytics/sales/', {'dimension': 'category', 'start': self.day.isoformat()})
+        self.assertEqual(
+            [(row['key'], row['units'], row['revenue']) for row in response.data['results']],
+            [(self.pizzas.id, 2, 20)],
+        )
+        response = client.get('/api/analytics/sales/', {'period': 'week'})
+        self.assertEqual(response.status_code, 400)
+
+    def test_command(self):
+        self.order([(self.salami.id, 1)], self.day)
+        out = StringIO()
+        call_command('refresh_sales_rollups', '--rebuild', stdout=out)
+        self.assertIn('from the first order', out.getvalue())
+        self.assertEqual(self.rollup('day', 'product', self.salami.id), [(1, 1, 12)])
+
+
+class CatalogImportExportTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.staff = User.objects.create_user(username='mia', password='pass12345', is_staff=True)
+        cls.pizzas = Category.objects.create(name='Pizza')
+        cls.chef = ChefsData.objects.create(name='Ana')
+        cls.margherita = Products.objects.create(name='Margherita', price=10, quantity=5, category=cls.pizzas)
+
+    def setUp(self):
+        reset_caches()
+        self.client = APIClient()
+        self.client.force_authenticate(self.staff)
+
+    def upload(self, kind, name, content):
+        with self.captureOnCommitCallbacks(execute=True):
+            return self.client.post(
+                f'/api/catalog/import/{kind}/', {'file': SimpleUploadedFile(name, content.encode())},
+                format='multipart',
+            )
+
+    def test_csv_upsert_reports_row_errors(self):
+        content = (
+            'name,price,quantity,category,chef,is_available\n'
+            'Margherita,11.5,,Pizza,Ana,\n'
+            'Calzone,9,3,Pizza,,false\n'
+            'Hawaii,abc,1,Pizza,,\n'
+            'Tofu bowl,7,1,Bowls,,\n'
+            ',5,1,,,\n'
+            'Salad,,1,,,\n'
+        )
+        response = self.upload('products', 'menu.csv', content)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual((response.data['created'], response.data['updated'], response.data['failed']), (1, 1, 4))
+        self.assertEqual(
+            {error['line']: sorted(error['errors']) for error in response.data['errors']},
+            {4: ['price'], 5: ['category'], 6: ['name'], 7: ['price']},
+        )
+        self.margherita.refresh_from_db()
+        # Blank cells leave the stock and availability alone.
+        self.assertEqual((self.margherita.price, self.margherita.quantity, self.margherita.chefs_id), (11.5, 5, self.chef.id))
+        calzone = Products.objects.get(name='Calzone')
+        self.assertEqual((calzone.category_id, calzone.is_available, calzone.chefs_id), (self.pizzas.id, False, None))
+        self.assertEqual(self.client.get('/api/products/', {'search': 'calzone'}).data['results'][0]['name'], 'Calzone')
+
+    def test_jsonl_import_in_batches(self):
+        lines = [json.dumps({'name': f'Chef {i}', 'text': 'x'}) for i in range(7)]
+        lines.insert(3, '{not json')
+        report = catalog_io.import_records(
+            'chefs', read_records(io.BytesIO('\n'.join(lines).encode()), 'jsonl'), batch_size=3,
+        )
+        self.assertEqual((report['created'], report['updated'], report['failed']), (7, 0, 1))
+        self.assertEqual(report['errors'][0]['line'], 4)
+
+    def test_export_streams_rows_that_import_back(self):
+        Products.objects.create(name='Plain', price=3, chefs=self.chef)
+        response = self.client.get('/api/catalog/export/products.csv')
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response.streaming)
+        body = b''.join(response.streaming_content)
+        rows = list(csv.DictReader(io.StringIO(body.decode())))
+        self.assertEqual([(row['name'], row['category'], row['chef']) for row in rows],
+                         [('Margherita', 'Pizza', ''), ('Plain', '', 'Ana')])
+
+        report = catalog_io.import_records('products', read_records(io.BytesIO(body), 'csv'))
+        self.assertEqual((report['created'], report['updated'], report['failed']), (0, 2, 0))
+
+        response = self.client.get('/api/catalog/export/categories.jsonl')
+        self.assertEqual(response['Content-Type'], 'application/x-ndjson')
+        self.assertEqual(
+            [json.loads(line) for line in b''.join(response.streaming_content).splitlines()],
+            [{'name': 'Pizza', 'description': None}],
+        )
+
+    def test_staff_only_and_unknown_kinds(self):
+        self.assertEqual(self.client.get('/api/catalog/export/orders.csv').status_code, 404)
+        self.assertEqual(self.client.get('/api/catalog/export/products.xml').status_code, 404)
+        self.assertEqual(self.upload('products', 'menu.xlsx', 'x').status_code, 400)
+        self.client.force_authenticate(User.objects.create_user(username='ned', password='pass12345'))
+        self.assertEqual(self.client.get('/api/catalog/export/products.csv').status_code, 403)
+
+    def test_commands(self):
+        out = StringIO()
+        call_command('catalog_export', 'categories', '--format', 'jsonl', stdout=out)
+        self.assertEqual(json.loads(out.getvalue())['name'], 'Pizza')
+        with tempfile.NamedTemporaryFile('w', suffix='.csv', delete=False) as records_file:
+            records_file.write('name,description\nPizza,Stone baked\nSoups,\n')
+        self.addCleanup(os.remove, records_file.name)
+        out = StringIO()
+        call_command('catalog_import', 'categories', records_file.name, stdout=out)
+        self.assertIn('1 created, 1 updated, 0 failed', out.getvalue())
+        self.assertEqual(Category.objects.get(name='Pizza').description, 'Stone baked')
+
+
+class ExportTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.staff = User.objects.create_user(username='olga', password='pass12345', is_staff=True)
+        cls.user = User.objects.create_user(username='pete', password='pass12345')
+        cls.pizza = Products.objects.create(name='Pizza', price=10, quantity=100)
+        cls.soup = Products.objects.create(name='Soup', price=4, quantity=100)
+        cls.day = timezone.now().replace(hour=12, minute=0, second=0, microsecond=0) - timedelta(days=10)
+        cls.orders = []
+        for offset, lines in enumerate(([(cls.pizza.id, 1), (cls.soup.id, 2)], [(cls.soup.id, 1)], [(cls.pizza.id, 3)])):
+            order = place_order(cls.user.id, lines)
+            Order.objects.filter(pk=order.pk).update(order_date=cls.day + timedelta(days=offset))
+            cls.orders.append(order)
+        Payment.objects.create(order=cls.orders[0], payment_method='card', payment_status='Paid', amount=18)
+        Review.objects.create(user=cls.user, product=cls.pizza, rating=5, comment='Great, "really"')
+
+    def setUp(self):
+        reset_caches()
+        self.client = APIClient()
+        self.client.force_authenticate(self.staff)
+
+    def test_orders_as_ndjson_with_items_and_payment(self):
+        response = self.client.get('/api/exports/orders.ndjson')
+        self.assertTrue(response.streaming)
+        # Orders and their items, read chunk by chunk as the body is consumed.
+        with self.assertNumQueries(2):
+            lines = [json.loads(line) for line in b''.join(response.streaming_content).splitlines()]
+        self.assertEqual([line['id'] for line in lines], [order.id for order in self.orders])
+        self.assertEqual(lines[0]['username'], 'pete')
+        self.assertEqual(lines[0]['payment']['method'], 'card')
+        self.assertEqual(
+            [(item['product_name'], item['quantity']) for item in lines[0]['items']], [('Pizza', 1), ('Soup', 2)],
+        )
+        self.assertIsNone(lines[1]['payment'])
+
+    def test_orders_as_csv_in_a_date_range(self):
+        response = self.client.get('/api/exports/orders.csv', {
+            'start': (self.day + timedelta(days=1)).isoformat(), 'end': (self.day + timedelta(days=3)).isoformat(),
+        })
+        self.assertEqual(response['Content-Type'], 'text/csv; charset=utf-8')
+        rows = list(csv.DictReader(io.StringIO(b''.join(response.streaming_content).decode())))
+        self.assertEqual(
+            [(int(row['order']), row['product_name'], row['payment_method']) for row in rows],
+            [(self.orders[1].id, 'Soup', ''), (self.orders[2].id, 'Pizza', '')],
+        )
+
+    def test_reviews_and_validation(self):
+        response = self.client.get('/api/exports/reviews.csv')
+        rows = list(csv.DictReader(io.StringIO(b''.join(response.streaming_content).decode())))
+        self.assertEqual([(row['product_name'], row['comment']) for row in rows], [('Pizza', 'Great, "really"')])
+
+        response = self.client.get('/api/exports/reviews.jsonl', {'start': '2020-01-02', 'end': '2020-01-01'})
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(self.client.get('/api/exports/payments.csv').status_code, 404)
+        self.client.force_authenticate(self.user)
+        self.assertEqual(self.client.get('/api/exports/orders.csv').status_code, 403)
+
+
+class StockReservationTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.ann, cls.ben = (User.objects.create_user(username=name, password='pass12345') for name in ('ann', 'ben'))
+        cls.product = Products.objects.create(name='Momo', price=4, quantity=5)
+
+    def setUp(self):
+        self.carts = {user: Cart.objects.create(user=user) for user in (self.ann, self.ben)}
+
+    def add(self, user, quantity, product=None):
+        client = APIClient()
+        client.force_authenticate(user)
+        return client.post(
+            f'/api/carts/{self.carts[user].id}/add_item/', {'product': (product or self.product).id, 'quantity': quantity},
+        )
+
+    def held(self):
+        return dict(StockReservation.objects.values_list('cart__user__username', 'quantity'))
+
+    def test_adding_to_a_cart_reserves_the_units(self):
+        response = self.add(self.ann, 2)
+        self.assertEqual(response.status_code, 200, response.data)
+        self.assertIsNotNone(response.data['reserved_until'])
+        self.add(self.ann, 1)
+        self.assertEqual(self.held(), {'ann': 3})
+        self.assertEqual(available_stock([self.product.id])[self.product.id], (True, 2))
+        self.assertEqual(available_stock([self.product.id], self.carts[self.ann].id)[self.product.id], (True, 5))
+
+    def test_lapsed_reservations_do_not_count_towards_reserved_until(self):
+        self.add(self.ann, 2)
+        cart = self.carts[self.ann]
+        self.assertIsNotNone(carts_with_items().get(pk=cart.pk).reserved_until)
+        StockReservation.objects.filter(cart=cart).update(expires_at=timezone.now() - timedelta(minutes=1))
+        self.assertIsNone(carts_with_items().get(pk=cart.pk).reserved_until)
+
+    def test_units_reserved_by_another_cart_cannot_be_added(self):
+        self.add(self.ann, 4)
+        response = self.add(self.ben, 2)
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.data['items'][str(self.product.id)], 'Only 1 left in stock.')
+        self.assertFalse(self.carts[self.ben].items.exists())
+        self.assertEqual(self.add(self.ben, 1).status_code, 200)
+
+    def test_availability_endpoint_counts_the_shoppers_own_reservations(self):
+        self.add(self.ann, 3)
+        client = APIClient()
+        url = f'/api/products/availability/?ids={self.product.id},9999'
+        self.assertEqual(client.get(url).data, [{'product': self.product.id, 'available': 2}])
+        client.force_authenticate(self.ann)
+        self.assertEqual(client.get(url).data, [{'product': self.product.id, 'available': 5}])
+        self.assertEqual(client.get('/api/products/availability/?ids=a').status_code, 400)
+
+    def test_checkout_converts_the_reservation_into_a_sale(self):
+        self.add(self.ann, 3)
+        self.add(self.ben, 2)
+        client = APIClient()
+        client.force_authenticate(self.ann)
+        response = client.post(f'/api/carts/{self.carts[self.ann].id}/checkout/')
+        self.assertEqual(response.status_code, 201, response.data)
+        self.product.refresh_from_db()
+        self.assertEqual(self.product.quantity, 2)
+        self.assertEqual(self.held(), {'ben': 2})
+
+    def test_orders_cannot_take_units_held_by_carts(self):
+        self.add(self.ann, 4)
+        with self.assertRaises(serializers.ValidationError) as raised:
+            place_order(self.ben.id, [(self.product.id, 2)])
+        self.assertEqual(raised.exception.detail['items'][str(self.product.id)], 'Only 1 left in stock.')
+        place_order(self.ben.id, [(self.product.id, 1)])
+
+    def test_expired_reservations_stop_counting_and_are_swept(self):
+        self.add(self.ann, 5)
+        StockReservation.objects.update(expires_at=timezone.now() - timedelta(seconds=1))
+        self.add(self.ben, 5)
+        self.assertEqual(self.add(self.ann, 1).status_code, 400)
+
+        self.assertEqual(release_expired(batch_size=1), 1)
+        self.assertEqual(self.held(), {'ben': 5})
+        out = StringIO()
+        call_command('release_expired_reservations', stdout=out)
+        self.assertIn('Released 0', out.getvalue())
+
+    def test_removing_lines_releases_their_reservations(self):
+        other = Products.objects.create(name='Thukpa', price=6, quantity=5)
+        self.add(self.ann, 2)
+        self.add(self.ann, 2, product=other)
+        client = APIClient()
+        client.force_authenticate(self.ann)
+        cart_url = f'/api/carts/{self.carts[self.ann].id}'
+        client.post(f'{cart_url}/set_items/', {
+            'mode': 'set', 'items': [{'product': self.product.id, 'quantity': 0}],
+        }, format='json')
+        client.post(f'{cart_url}/remove_item/', {'product_id': other.id})
+        self.assertFalse(StockReservation.objects.exists())
+
+
+class DefaultCacheTests(TestCase):
+    def test_migrations_create_the_database_cache_table(self):
+        default_cache = caches['default']
+        if not isinstance(default_cache, BaseDatabaseCache):
+            self.skipTest('REDIS_URL is set')
+        migration = importlib.import_module('api.migrations.0010_cache_table')
+        with connection.cursor() as cursor:
+            cursor.execute(f'DROP TABLE {default_cache._table}')
+        migration.create_cache_table(None, SimpleNamespace(connection=connection))
+
+        user = User.objects.create_user(username='cora', password='pass12345')
+        client = APIClient()
+        client.credentials(HTTP_AUTHORIZATION=f'Bearer {ClaimsTokenObtainPairSerializer.get_token(user).access_token}')
+        self.assertEqual(client.get('/api/products/').status_code, 200)
+
+
+class ConcurrencyTests(TransactionTestCase):
+    def setUp(self):
+        if connection.vendor == 'sqlite' and connection.is_in_memory_db():
+            self.skipTest('needs a database that allows concurrent writers')
+
+    def test_concurrent_checkouts_cannot_oversell(self):
+        users = [User.objects.create_user(username=f'buyer{i}', password='pass12345') for i in range(20)]
+        product = Products.objects.create(name='Last slices', price=3, quantity=5)
+        results = []
+        barrier = threading.Barrier(len(users))
+
+        def checkout(user):
+            barrier.wait()
+            try:
+                place_order(user.id, [(product.id, 1)])
+                results.append('ok')
+            except serializers.ValidationError:
+                results.append('sold out')
+            finally:
+                connection.close()
+
+        threads = [threading.Thread(target=checkout, args=(user,)) for user in users]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        product.refresh_from_db()
+        self.assertEqual(results.count('ok'), 5)
+        self.assertEqual(results.count('sold out'), 15)
+        self.assertEqual(product.quantity, 0)
+        self.assertEqual(Order.objects.count(), 5)
+
+    def test_concurrent_cart_increments_are_not_lost(self):
+        user = User.objects.create_user(username='shopper', password='pass12345')
+        cart = Cart.objects.create(user=user)
+        product = Products.objects.create(name='Fries', price=2, quantity=100)
+        barrier = threading.Barrier(10)
+
+        def add_one():
+            barrier.wait()
+            try:
+                update_cart_lines(cart, [(product.id, 1)])
+            finally:
+                connection.close()
+
+        threads = [threading.Thread(target=add_one) for _ in range(10)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual(CartItem.objects.get(cart=cart, product=product).quantity, 10)
+
+    def test_concurrent_carts_cannot_over_reserve_a_hot_product(self):
+        users = [User.objects.create_user(username=f'rush{i}', password='pass12345') for i in range(20)]
+        carts = [Cart.objects.create(user=user) for user in users]
+        product = Products.objects.create(name='Festival momo', price=4, quantity=5)
+        results = []
+        barrier = threading.Barrier(len(carts))
+
+        def add_one(cart):
+            barrier.wait()
+            try:
+                update_cart_lines(cart, [(product.id, 1)])
+                results.append('ok')
+            except serializers.ValidationError:
+                results.append('sold out')
+            finally:
+                connection.close()
+
+        threads = [threading.Thread(target=add_one, args=(cart,)) for cart in carts]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual(results.count('ok'), 5)
+        self.assertEqual(results.count('sold out'), 15)
+        self.assertEqual(StockReservation.objects.filter(product=product).count(), 5)
+        self.assertEqual(CartItem.objects.filter(product=product).count(), 5)
+        self.assertEqual(available_stock([product.id])[product.id], (True, 0))
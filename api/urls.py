@@ -1,7 +1,8 @@
 from django.urls import path, include
 from rest_framework.routers import DefaultRouter
-from .views import ProductsViewSet, OrderViewSet, CategoryViewSet, PaymentViewSet, ReviewViewSet,  ToggleFavoriteView, UserFavoritesViewSet, ChefsDataViewSet, AdsViewSet, UserViewSet, CurrentUserView, CartViewSet, OrderItemViewSet
+from .views import ProductsViewSet, OrderViewSet, CategoryViewSet, PaymentViewSet, ReviewViewSet,  ToggleFavoriteView, UserFavoritesViewSet, ChefsDataViewSet, AdsViewSet, UserViewSet, CurrentUserView, CartViewSet, OrderItemViewSet, CatalogCacheStatsView, CatalogExportView, CatalogImportView, ExportView, MetricsView, SalesRollupRefreshView, SalesRollupView, TokenRevokeView
 from rest_framework_simplejwt.views import TokenObtainPairView, TokenRefreshView
+from . import async_views
 
 router = DefaultRouter()
 router.register(r'users', UserViewSet)
@@ -17,10 +18,24 @@ router.register(r'orderitems', OrderItemViewSet, basename='orderitems')
 router.register(r'favorites', UserFavoritesViewSet, basename='users-favourites' )
 
 urlpatterns = [
+    # Ahead of the router, whose users/<pk>/ route would otherwise match "me".
+    path('users/me/', CurrentUserView.as_view(), name='current-user'),
     path('', include(router.urls)),
     # path('favorites/', UserFavoritesViewSet.as_view(), name='user-favorites-list'),
     path('favorites/toggle/<int:product_id>/', ToggleFavoriteView.as_view(), name='toggle-favorite'),
     path('token/', TokenObtainPairView.as_view(), name='token_obtain_pair'),
     path('token/refresh/', TokenRefreshView.as_view(), name='token_refresh'),
-    path('users/me/', CurrentUserView.as_view(), name='current-user'),
+    path('token/revoke/', TokenRevokeView.as_view(), name='token_revoke'),
+    path('catalog-cache/stats/', CatalogCacheStatsView.as_view(), name='catalog-cache-stats'),
+    path('metrics/', MetricsView.as_view(), name='metrics'),
+    path('catalog/export/<str:kind>.<str:fmt>', CatalogExportView.as_view(), name='catalog-export'),
+    path('catalog/import/<str:kind>/', CatalogImportView.as_view(), name='catalog-import'),
+    path('exports/<str:kind>.<str:fmt>', ExportView.as_view(), name='export'),
+    path('analytics/sales/', SalesRollupView.as_view(), name='sales-rollups'),
+    path('analytics/sales/refresh/', SalesRollupRefreshView.as_view(), name='sales-rollups-refresh'),
+    path('async/products/', async_views.product_list, name='async-product-list'),
+    path('async/products/<int:pk>/', async_views.product_detail, name='async-product-detail'),
+    path('async/categories/', async_views.category_list, name='async-category-list'),
+    path('async/users/me/', async_views.current_user, name='async-current-user'),
+    path('async/favorites/my_favorites/', async_views.my_favorites, name='async-my-favorites'),
 ]
\ No newline at end of file
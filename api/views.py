@@ -1,11 +1,18 @@
 from rest_framework import viewsets, permissions
 from .models import Products, Order, OrderItem, Category, Payment, Review, Ads, ChefsData
 from .serializers import ProductsSerializer, OrderSerializer, CategorySerializer, PaymentSerializer, ReviewSerializer, AdsSerializer, OrderItemSerializer, ChefsDataSerializer, UserSerializer
+import hashlib
+import os
 from django.contrib.auth import get_user_model
 from rest_framework.permissions import IsAuthenticated
 from rest_framework.response import Response
 from rest_framework.views import APIView
 from django.contrib.auth.hashers import make_password
+from django.db import transaction
+from django.db.models import TextField, Value
+from django.db.models.functions import Coalesce, Concat, Lower, Replace
+from django.http import Http404, HttpResponse
+from django.utils import timezone
 from rest_framework import generics, permissions, status
 from rest_framework.response import Response
 from .models import UserFavorites
@@ -14,15 +21,80 @@ from rest_framework.parsers import MultiPartParser, FormParser
 from rest_framework import viewsets, status
 from rest_framework.response import Response
 from rest_framework.decorators import action
+from rest_framework.exceptions import ValidationError
 from rest_framework.permissions import IsAuthenticated
-from .models import Cart, CartItem
-from .serializers import CartSerializer, CartItemSerializer
+from .models import Cart, CartItem, SalesRollup
+from .serializers import CartSerializer, CartItemSerializer, CartLinesSerializer, ExportRangeSerializer, ProductAvailabilitySerializer, ProductFilterSerializer, SalesRollupFilterSerializer, SalesRollupRefreshSerializer, SalesRollupSerializer, TokenRevokeSerializer, requested_expansions
+from .search import search_products
+from .carts import carts_with_items, update_cart_lines
+from .cache import CachedCatalogMixin, get_catalog_cache
+from .favorites import get_favorite_product_ids
+from .orders import order_summary, orders_with_items, place_order, prefetch_order_items
+from .db import retry_on_lock
+from .reservations import available_stock, release_cart
+from .rollups import refresh_sales_rollups
+from .ads import next_ads_schedule_change
+from .authentication import get_full_user, revoke_token, revoke_user_tokens
+from . import catalog_io, exports, metrics, ratings, streaming
 
 User = get_user_model()
 
+# Joins needed by each ``?expand=`` option of the expandable serializers.
+EXPAND_RELATED = {
+    'user': ('user',),
+    'product': ('product__category', 'product__chefs'),
+}
+
+def expand_queryset(queryset, request):
+    related = [
+        path
+        for name in requested_expansions(request) & EXPAND_RELATED.keys()
+        for path in EXPAND_RELATED[name]
+    ]
+    return queryset.select_related(*related) if related else queryset
+
+def allergen_list():
+    """
+    ``allergens`` as ``,gluten,treenuts,``: lower-cased, without spaces and
+    delimited at both ends, so a term matches whole entries only ("egg"
+    does not match "eggplant").
+    """
+    return Concat(
+        Value(','), Lower(Replace(Coalesce('allergens', Value('')), Value(' '), Value(''))), Value(','),
+        output_field=TextField(),
+    )
+
+def filter_products(queryset, query_params):
+    """Apply the product list filters in ``query_params`` (a QueryDict)."""
+    params = ProductFilterSerializer(data=query_params.dict())
+    params.is_valid(raise_exception=True)
+    filters = params.validated_data
+    if 'category' in filters:
+        queryset = queryset.filter(category_id=filters['category'])
+    if 'available' in filters:
+        queryset = queryset.filter(is_available=filters['available'])
+    if 'min_price' in filters:
+        queryset = queryset.filter(price__gte=filters['min_price'])
+    if 'max_price' in filters:
+        queryset = queryset.filter(price__lte=filters['max_price'])
+    if filters.get('exclude_allergens'):
+        queryset = queryset.alias(allergen_list=allergen_list())
+        for allergen in filters['exclude_allergens']:
+            queryset = queryset.exclude(allergen_list__contains=f',{allergen},')
+    if filters.get('search'):
+        queryset = search_products(queryset, filters['search'])
+    return queryset
+
+def product_ordering(query_params):
+    ordering = query_params.get('ordering')
+    if ordering not in ProductFilterSerializer.ORDERING_CHOICES:
+        return ('id',)
+    return (ordering, '-id' if ordering.startswith('-') else 'id')
+
 class UserViewSet(viewsets.ModelViewSet):
     queryset = User.objects.all()
     serializer_class = UserSerializer
+    ordering = 'id'
     
     def get_permissions(self):
         if self.action == 'create':
@@ -40,21 +112,72 @@ class UserViewSet(viewsets.ModelViewSet):
             serializer.validated_data['password'] = make_password(password)
         serializer.save()
 
-class ProductsViewSet(viewsets.ModelViewSet):
+class ProductsViewSet(CachedCatalogMixin, viewsets.ModelViewSet):
     queryset = Products.objects.all()
     serializer_class = ProductsSerializer
     permission_classes = [permissions.IsAuthenticatedOrReadOnly]
     parser_classes = ( MultiPartParser, FormParser )
+    cache_namespaces = ('products', 'categories', 'chefs')
+
+    def get_queryset(self):
+        # Everything ProductsSerializer touches is loaded in the same query,
+        # so the query count does not grow with the number of products.
+        queryset = Products.objects.select_related('category', 'chefs')
+        if self.action == 'list':
+            queryset = filter_products(queryset, self.request.query_params)
+        return queryset
+
+    def get_ordering(self):
+        return product_ordering(self.request.query_params)
     
     def get_serializer_context(self):
         context = super().get_serializer_context()
         context['request'] = self.request
+        if getattr(self, 'building_shared_cache_entry', False):
+            # Cached entries are shared by all users; favorites are overlaid
+            # per request in personalize_cached_data.
+            context['favorite_ids'] = frozenset()
         return context
 
-class CategoryViewSet(viewsets.ModelViewSet):
+    def personalize_cached_data(self, request, data):
+        if not request.user.is_authenticated:
+            return data, ''
+        products = data['results'] if 'results' in data else [data]
+        favorite_ids = get_favorite_product_ids(request.user.id, [product['id'] for product in products])
+
+        def flag(product):
+            return {**product, 'is_favorite': product['id'] in favorite_ids}
+
+        if 'results' in data:
+            data = {**data, 'results': [flag(product) for product in data['results']]}
+            flagged = [product['id'] for product in data['results'] if product['is_favorite']]
+        else:
+            data = flag(data)
+            flagged = [data['id']] if data['is_favorite'] else []
+        digest = hashlib.md5(','.join(map(str, flagged)).encode()).hexdigest()[:12]
+        return data, f'-{digest}'
+
+    @action(detail=False, methods=['get'])
+    def availability(self, request):
+        """Units of ``?ids=1,2,3`` that can still be added to a cart; never cached."""
+        params = ProductAvailabilitySerializer(data=request.query_params.dict())
+        params.is_valid(raise_exception=True)
+        cart_id = None
+        if request.user.is_authenticated:
+            # The shopper's own reservations count as available to them.
+            cart_id = Cart.objects.filter(user_id=request.user.id).values_list('id', flat=True).first()
+        stock = available_stock(params.validated_data['ids'], cart_id)
+        return Response([
+            {'product': product_id, 'available': units if is_available else 0}
+            for product_id, (is_available, units) in sorted(stock.items())
+        ])
+
+class CategoryViewSet(CachedCatalogMixin, viewsets.ModelViewSet):
     queryset = Category.objects.all()
     serializer_class = CategorySerializer
     permission_classes = [permissions.IsAuthenticatedOrReadOnly]
+    ordering = 'id'
+    cache_namespaces = ('categories',)
     
     def get_serializer_context(self):
         context = super().get_serializer_context()
@@ -65,14 +188,39 @@ class OrderViewSet(viewsets.ModelViewSet):
     queryset = Order.objects.all()
     serializer_class = OrderSerializer
     permission_classes = [permissions.IsAuthenticated]
+    ordering = ('-order_date', '-id')
+
+    def get_queryset(self):
+        # Users see their own orders; staff see everyone's, or one user's
+        # with ?user=<id>.
+        queryset = Order.objects.all()
+        if self.action in ('list', 'retrieve'):
+            queryset = orders_with_items()
+        if not self.request.user.is_staff:
+            return queryset.filter(user_id=self.request.user.id)
+        user_id = self.request.query_params.get('user')
+        if user_id is not None:
+            if not user_id.isdigit():
+                raise ValidationError({'user': 'A user id is required.'})
+            queryset = queryset.filter(user_id=user_id)
+        return queryset
 
     def perform_create(self, serializer):
-        serializer.save(user=self.request.user)
+        serializer.save(user_id=self.request.user.id)
+
+    @action(detail=False, methods=['get'])
+    def summary(self, request):
+        return Response(order_summary(self.get_queryset()))
 
 class OrderItemViewSet(viewsets.ModelViewSet):
     queryset = OrderItem.objects.all()
     serializer_class = OrderItemSerializer
     permission_classes = [permissions.IsAuthenticated]
+
+    def get_queryset(self):
+        if self.request.user.is_staff:
+            return OrderItem.objects.all()
+        return OrderItem.objects.filter(order__user_id=self.request.user.id)
     
     
     def perform_create(self, serializer):
@@ -82,31 +230,184 @@ class PaymentViewSet(viewsets.ModelViewSet):
     queryset = Payment.objects.all()
     serializer_class = PaymentSerializer
     permission_classes = [permissions.IsAuthenticated]
+    ordering = ('-payment_date', '-id')
 
 class ReviewViewSet(viewsets.ModelViewSet):
     queryset = Review.objects.all()
     serializer_class = ReviewSerializer
     permission_classes = [permissions.IsAuthenticatedOrReadOnly]
+    ordering = ('-review_date', '-id')
+
+    def get_queryset(self):
+        return expand_queryset(Review.objects.all(), self.request)
 
+    @transaction.atomic
     def perform_create(self, serializer):
-        serializer.save(user=self.request.user)
+        review = serializer.save(user_id=self.request.user.id)
+        ratings.review_created(review)
+
+    @retry_on_lock
+    def perform_update(self, serializer):
+        with transaction.atomic():
+            # Re-read under a row lock: a concurrent edit may have changed the
+            # rating since the instance was loaded, and the delta starts here.
+            old_product_id, old_rating = Review.objects.select_for_update().filter(
+                pk=serializer.instance.pk
+            ).values_list('product_id', 'rating').get()
+            review = serializer.save()
+            ratings.review_updated(old_product_id, old_rating, review)
+
+    @retry_on_lock
+    def perform_destroy(self, instance):
+        with transaction.atomic():
+            # Re-read under a row lock, as perform_update does: the post_delete
+            # receiver takes out the rating as stored, not as loaded.
+            review = Review.objects.select_for_update().filter(pk=instance.pk).first()
+            # None when a concurrent delete got there first.
+            if review is not None:
+                review.delete()
         
-class ChefsDataViewSet(viewsets.ModelViewSet):
+class ChefsDataViewSet(CachedCatalogMixin, viewsets.ModelViewSet):
     queryset = ChefsData.objects.all()
     serializer_class = ChefsDataSerializer
     permission_classes = [permissions.IsAuthenticatedOrReadOnly]
+    ordering = 'id'
+    cache_namespaces = ('chefs',)
     
-class AdsViewSet(viewsets.ModelViewSet):
+class AdsViewSet(CachedCatalogMixin, viewsets.ModelViewSet):
     queryset = Ads.objects.all()
     serializer_class = AdsSerializer
     permission_classes = [permissions.IsAuthenticatedOrReadOnly]
+    cache_namespaces = ('ads',)
+
+    @action(detail=False, methods=['get'])
+    def active(self, request):
+        """
+        Ads running right now. The response is cached until the next start or
+        end date of an active ad, or until an ad is saved, whichever is first.
+        """
+        return self.cached_response(request, self.build_active_response, time_dependent=True)
+
+    def build_active_response(self, request):
+        now = timezone.now()
+        running = Ads.objects.filter(is_active=True, start_date__lte=now, end_date__gt=now)
+        serializer = self.get_serializer(running.order_by('start_date', 'id'), many=True)
+        next_change = next_ads_schedule_change(now)
+        if next_change is not None:
+            self.cache_timeout = (next_change - now).total_seconds()
+        return Response(serializer.data)
+
+class CatalogCacheStatsView(APIView):
+    permission_classes = [permissions.IsAdminUser]
+
+    def get(self, request):
+        return Response(get_catalog_cache().stats())
+
+class SalesRollupView(generics.ListAPIView):
+    """
+    Precomputed sales per hour or day (see api.rollups), filtered by
+    ``period``, ``dimension``, ``key`` and a ``start``/``end`` bucket range.
+    """
+    serializer_class = SalesRollupSerializer
+    permission_classes = [permissions.IsAdminUser]
+    ordering = ('bucket', 'key')
+
+    def get_queryset(self):
+        params = SalesRollupFilterSerializer(data=self.request.query_params.dict())
+        params.is_valid(raise_exception=True)
+        filters = params.validated_data
+        queryset = SalesRollup.objects.filter(period=filters['period'], dimension=filters['dimension'])
+        if 'key' in filters:
+            queryset = queryset.filter(key=filters['key'])
+        if 'start' in filters:
+            queryset = queryset.filter(bucket__gte=filters['start'])
+        if 'end' in filters:
+            queryset = queryset.filter(bucket__lt=filters['end'])
+        return queryset
+
+class SalesRollupRefreshView(APIView):
+    permission_classes = [permissions.IsAdminUser]
+
+    def post(self, request):
+        serializer = SalesRollupRefreshSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        return Response(refresh_sales_rollups(rebuild=serializer.validated_data['rebuild']))
+
+class CatalogExportView(APIView):
+    """Stream every category, chef or product as CSV or JSON Lines (see api.catalog_io)."""
+    permission_classes = [permissions.IsAdminUser]
+
+    def get(self, request, kind, fmt):
+        if kind not in catalog_io.KINDS or fmt not in streaming.CONTENT_TYPES:
+            raise Http404
+        columns, rows = catalog_io.export_rows(kind)
+        return streaming.streaming_response(request, fmt, columns, rows, kind)
+
+class CatalogImportView(APIView):
+    """
+    Upsert categories, chefs or products from an uploaded CSV or JSON Lines
+    ``file``; the format comes from ``format`` or the file name extension.
+    """
+    permission_classes = [permissions.IsAdminUser]
+    parser_classes = (MultiPartParser, FormParser)
+
+    def post(self, request, kind):
+        if kind not in catalog_io.KINDS:
+            raise Http404
+        upload = request.FILES.get('file')
+        if upload is None:
+            return Response({'file': ['No file was submitted.']}, status=status.HTTP_400_BAD_REQUEST)
+        fmt = request.data.get('format') or os.path.splitext(upload.name)[1].lstrip('.').lower()
+        if fmt not in streaming.CONTENT_TYPES:
+            return Response({'format': ['Use csv, jsonl or ndjson.']}, status=status.HTTP_400_BAD_REQUEST)
+        report = catalog_io.import_records(kind, streaming.read_records(upload, fmt))
+        return Response(report)
+
+class ExportView(APIView):
+    """
+    Stream orders (with items and payment) or reviews from ``start`` up to
+    ``end`` as NDJSON or CSV (see api.exports).
+    """
+    permission_classes = [permissions.IsAdminUser]
+
+    def get(self, request, kind, fmt):
+        if kind not in exports.EXPORTS or fmt not in streaming.CONTENT_TYPES:
+            raise Http404
+        params = ExportRangeSerializer(data=request.query_params.dict())
+        params.is_valid(raise_exception=True)
+        columns, rows = exports.EXPORTS[kind](fmt, **params.validated_data)
+        return streaming.streaming_response(request, fmt, columns, rows, kind)
+
+class MetricsView(APIView):
+    """Request metrics of this process in the Prometheus text format."""
+    permission_classes = [permissions.IsAdminUser]
+
+    def get(self, request):
+        return HttpResponse(metrics.registry.render(), content_type='text/plain; version=0.0.4; charset=utf-8')
 
 class CurrentUserView(APIView):
     permission_classes = [IsAuthenticated]
 
     def get(self, request):
-        serializer = UserSerializer(request.user)
+        serializer = UserSerializer(get_full_user(request.user))
         return Response(serializer.data)
+
+class TokenRevokeView(APIView):
+    """
+    Revoke the access token of this request, plus the given ``refresh`` token,
+    or with ``all`` every token issued to the user so far.
+    """
+    permission_classes = [IsAuthenticated]
+
+    def post(self, request):
+        serializer = TokenRevokeSerializer(data=request.data, context={'request': request})
+        serializer.is_valid(raise_exception=True)
+        revoke_token(request.auth)
+        if 'refresh' in serializer.validated_data:
+            revoke_token(serializer.validated_data['refresh'])
+        if serializer.validated_data['all']:
+            revoke_user_tokens(request.user.id)
+        return Response({'status': 'revoked'})
     
 class ToggleFavoriteView(generics.GenericAPIView):
     permission_classes = [permissions.IsAuthenticated]
@@ -119,7 +420,7 @@ class ToggleFavoriteView(generics.GenericAPIView):
             return Response({"error": "Product not found"}, status=status.HTTP_404_NOT_FOUND)
 
         favorite, created = UserFavorites.objects.get_or_create(
-            user=request.user,
+            user_id=request.user.id,
             product=product
         )
 
@@ -135,22 +436,26 @@ class ToggleFavoriteView(generics.GenericAPIView):
 class UserFavoritesViewSet(viewsets.ModelViewSet):
     serializer_class = UserFavoritesSerializer
     permission_classes = [permissions.IsAuthenticated]
+    ordering = ('-added_at', '-id')
 
     def get_queryset(self):
-        return UserFavorites.objects.filter(user=self.request.user)
+        return expand_queryset(UserFavorites.objects.filter(user_id=self.request.user.id), self.request)
 
     @action(detail=False, methods=['get'])
     def my_favorites(self, request):
         favorites = self.get_queryset()
+        page = self.paginate_queryset(favorites)
+        if page is not None:
+            serializer = self.get_serializer(page, many=True)
+            return self.get_paginated_response(serializer.data)
         serializer = self.get_serializer(favorites, many=True)
         return Response(serializer.data)
 
     @action(detail=True, methods=['post', 'delete'])
     def toggle_favorite(self, request, pk=None):
         product_id = pk
-        user = request.user
         favorite, created = UserFavorites.objects.get_or_create(
-            user=user,
+            user_id=request.user.id,
             product_id=product_id
         )
         if not created:
@@ -163,7 +468,13 @@ class CartViewSet(viewsets.ModelViewSet):
     permission_classes = [IsAuthenticated]
 
     def get_queryset(self):
-        return Cart.objects.filter(user=self.request.user)
+        if self.action in ('list', 'retrieve'):
+            return carts_with_items().filter(user_id=self.request.user.id)
+        return Cart.objects.filter(user_id=self.request.user.id)
+
+    def cart_response(self, cart):
+        # Reloaded so the items and their products come from one prefetch.
+        return Response(CartSerializer(carts_with_items().get(pk=cart.pk)).data)
 
     @action(detail=True, methods=['post'])
     def add_item(self, request, pk=None):
@@ -172,21 +483,19 @@ class CartViewSet(viewsets.ModelViewSet):
         if serializer.is_valid():
             product = serializer.validated_data['product']
             quantity = serializer.validated_data.get('quantity', 1)
-            
-            # Update quantity if item exists
-            cart_item, created = CartItem.objects.get_or_create(
-                cart=cart,
-                product=product,
-                defaults={'quantity': quantity}
-            )
-            
-            if not created:
-                cart_item.quantity += quantity
-                cart_item.save()
-            
-            return Response(CartSerializer(cart).data)
+            update_cart_lines(cart, [(product.id, quantity)])
+            return self.cart_response(cart)
         return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
 
+    @action(detail=True, methods=['post'])
+    def set_items(self, request, pk=None):
+        cart = self.get_object()
+        serializer = CartLinesSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        lines = [(line['product'], line['quantity']) for line in serializer.validated_data['items']]
+        update_cart_lines(cart, lines, mode=serializer.validated_data['mode'])
+        return self.cart_response(cart)
+
     @action(detail=True, methods=['post'])
     def remove_item(self, request, pk=None):
         cart = self.get_object()
@@ -194,10 +503,36 @@ class CartViewSet(viewsets.ModelViewSet):
         
         try:
             cart_item = CartItem.objects.get(cart=cart, product_id=product_id)
-            cart_item.delete()
-            return Response(CartSerializer(cart).data)
+            with transaction.atomic():
+                cart_item.delete()
+                release_cart(cart.pk, [cart_item.product_id])
+            return self.cart_response(cart)
         except CartItem.DoesNotExist:
             return Response({'error': 'Item not found'}, status=status.HTTP_404_NOT_FOUND)
+
+    @action(detail=True, methods=['post'])
+    @retry_on_lock
+    def checkout(self, request, pk=None):
+        cart = self.get_object()
+        payment_method = request.data.get('payment_method')
+        with transaction.atomic():
+            # Touch the cart first: it locks the row (the whole database on
+            # SQLite) so the lines cannot change between reading them and
+            # placing the order, and a second checkout of the same cart waits.
+            Cart.objects.filter(pk=cart.pk).update(updated_at=timezone.now())
+            lines = list(cart.items.values_list('product_id', 'quantity'))
+            if not lines:
+                return Response({'error': 'Cart is empty'}, status=status.HTTP_400_BAD_REQUEST)
+            order = place_order(request.user.id, lines, cart_id=cart.pk)
+            if payment_method:
+                Payment.objects.create(
+                    order=order,
+                    payment_method=payment_method,
+                    payment_status='Pending',
+                    amount=order.total,
+                )
+            cart.items.all().delete()
+        return Response(OrderSerializer(prefetch_order_items(order)).data, status=status.HTTP_201_CREATED)
         
         
 class OrderCreateView(generics.CreateAPIView):
@@ -206,6 +541,6 @@ class OrderCreateView(generics.CreateAPIView):
     permission_classes = [permissions.IsAuthenticated]
 
     def perform_create(self, serializer):
-        serializer.save(user=self.request.user)
+        serializer.save(user_id=self.request.user.id)
 
         
\ No newline at end of file
@@ -16,8 +16,10 @@ import os
 
 REST_FRAMEWORK = {
     'DEFAULT_AUTHENTICATION_CLASSES': (
-        'rest_framework_simplejwt.authentication.JWTAuthentication',
+        'api.authentication.StatelessJWTAuthentication',
     ),
+    'DEFAULT_PAGINATION_CLASS': 'api.pagination.KeysetPagination',
+    'PAGE_SIZE': 20,
 }
 
 from datetime import timedelta
@@ -57,10 +59,13 @@ INSTALLED_APPS = [
     'rest_framework',
     'corsheaders',
     'rest_framework_simplejwt',
+    'channels',
     # 'whitenoise'
 ]
 
 MIDDLEWARE = [
+    # First, so its timings cover the rest of the stack.
+    'api.middleware.MetricsMiddleware',
     'corsheaders.middleware.CorsMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.security.SecurityMiddleware',
@@ -92,6 +97,15 @@ TEMPLATES = [
 ]
 
 WSGI_APPLICATION = 'backend.wsgi.application'
+ASGI_APPLICATION = 'backend.asgi.application'
+
+# Order/payment status pushes (api.realtime). The in-memory layer only
+# reaches sockets on the same process; use channels_redis across nodes.
+CHANNEL_LAYERS = {
+    'default': {
+        'BACKEND': 'channels.layers.InMemoryChannelLayer',
+    },
+}
 
 
 # Database
@@ -101,7 +115,98 @@ DATABASES = {
     'default': {
         'ENGINE': 'django.db.backends.sqlite3',
         'NAME': BASE_DIR / 'db.sqlite3',
+        # A file rather than the default in-memory database, so tests can
+        # exercise concurrent writers from several threads.
+        'TEST': {
+            'NAME': BASE_DIR / 'test_db.sqlite3',
+        },
+    }
+}
+
+# DB_PROFILE picks how the database is tuned:
+#   'sqlite'     the defaults above (development);
+#   'sqlite-wal' WAL journal, tuned pragmas, persistent connections and
+#                writers that take the lock at BEGIN and wait for it;
+#   'postgres'   PostgreSQL from the POSTGRES_* variables, with a
+#                connection pool (Django's pool needs psycopg 3 with
+#                psycopg[pool], as pinned in requirements.txt).
+# Compare them with `DB_PROFILE=... python manage.py benchmark_db`.
+DB_PROFILE = os.environ.get('DB_PROFILE', 'sqlite')
+
+if DB_PROFILE == 'sqlite-wal':
+    DATABASES['default'].update({
+        'CONN_MAX_AGE': None,
+        'CONN_HEALTH_CHECKS': True,
+        'OPTIONS': {
+            # Seconds a writer waits for the lock before "database is locked".
+            'timeout': 20,
+            # Take the write lock at BEGIN: a deferred transaction that later
+            # writes cannot wait for the lock and fails straight away. The
+            # cost is that every atomic() block, read-only ones included,
+            # holds the write lock and so runs one at a time; reads outside
+            # atomic() are unaffected under WAL.
+            'transaction_mode': 'IMMEDIATE',
+            'init_command': (
+                'PRAGMA journal_mode=WAL;'
+                'PRAGMA synchronous=NORMAL;'
+                'PRAGMA cache_size=-65536;'
+                'PRAGMA mmap_size=268435456;'
+                'PRAGMA temp_store=MEMORY'
+            ),
+        },
+    })
+elif DB_PROFILE == 'postgres':
+    DATABASES['default'] = {
+        'ENGINE': 'django.db.backends.postgresql',
+        'NAME': os.environ.get('POSTGRES_DB', 'tamang'),
+        'USER': os.environ.get('POSTGRES_USER', 'tamang'),
+        'PASSWORD': os.environ.get('POSTGRES_PASSWORD', ''),
+        'HOST': os.environ.get('POSTGRES_HOST', 'localhost'),
+        'PORT': os.environ.get('POSTGRES_PORT', '5432'),
+        # The pool keeps connections open across requests, so CONN_MAX_AGE
+        # must stay 0. Behind PgBouncer, drop 'pool' and set CONN_MAX_AGE.
+        'CONN_HEALTH_CHECKS': True,
+        'OPTIONS': {
+            'pool': {
+                'min_size': int(os.environ.get('POSTGRES_POOL_MIN', 2)),
+                'max_size': int(os.environ.get('POSTGRES_POOL_MAX', 10)),
+                'timeout': 10,
+            },
+        },
+    }
+
+# The default cache holds the JWT denylist (api.authentication) and the
+# catalog cache versions (api.cache), which every worker process must see.
+# StatelessJWTAuthentication does not read the user table, so the denylist
+# is the only way to end a session early: with a per-process cache
+# (LocMemCache) a token revoked on one worker keeps working on the others.
+# Set REDIS_URL (e.g. redis://localhost:6379/0) in production. Without it the
+# database cache is used: `migrate` creates its table, and the denylist check
+# costs every token-authenticated request one query against it. MAX_ENTRIES
+# is raised so culling does not drop live revocations.
+REDIS_URL = os.environ.get('REDIS_URL')
+
+if REDIS_URL:
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+            'LOCATION': REDIS_URL,
+        },
+    }
+else:
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.db.DatabaseCache',
+            'LOCATION': 'api_cache',
+            'OPTIONS': {'MAX_ENTRIES': 100000},
+        },
     }
+
+# Writes that fail on a lock (SQLite busy, PostgreSQL deadlock) are run again
+# this many times in all; see api.db.retry_on_lock.
+DATABASE_WRITE_RETRY = {
+    'ATTEMPTS': 3,
+    'BACKOFF': 0.05,
 }
 
 
@@ -164,20 +269,64 @@ SIMPLE_JWT = {
     'AUTH_HEADER_NAME': 'HTTP_AUTHORIZATION',
     'USER_ID_FIELD': 'id',
     'USER_ID_CLAIM': 'user_id',
+    # Tokens carry username/is_staff so requests authenticate without a
+    # user query (api.authentication); refreshes honour the denylist.
+    'TOKEN_OBTAIN_SERIALIZER': 'api.serializers.ClaimsTokenObtainPairSerializer',
+    'TOKEN_REFRESH_SERIALIZER': 'api.serializers.DenylistTokenRefreshSerializer',
 }
 
 
+# Serialized catalog responses (products, categories, chefs, ads). Use
+# 'api.cache.DjangoCacheBackend' with OPTIONS {'alias': ..., 'timeout': ...}
+# to keep them in one of CACHES instead of the in-process LRU. Either way the
+# namespace versions live in CACHES['default'], so writes on one worker
+# invalidate every worker's entries; 'timeout' (seconds) bounds how long an
+# entry can outlive a lost version. Each worker reuses the versions it read
+# for VERSIONS_TIMEOUT seconds, so warm reads skip the shared cache and a
+# write on another worker shows up that much later.
+CATALOG_CACHE = {
+    'BACKEND': 'api.cache.LRUBackend',
+    'OPTIONS': {'max_entries': 1024, 'timeout': 60},
+    'VERSIONS_TIMEOUT': 1,
+}
+
+
+# How long adding to a cart holds the units for that shopper; each change to
+# the cart renews it. Run `manage.py release_expired_reservations` from cron
+# to delete lapsed reservations (they stop counting when they expire).
+STOCK_RESERVATION_TTL = timedelta(minutes=15)
+
+
 # settings.py
 MEDIA_URL = '/media/'
 MEDIA_ROOT = os.path.join(BASE_DIR, 'media')
 
+# Hand media transfers to the front server instead of streaming them from
+# Python: 'x-accel-redirect' (nginx, with an internal location mapped from
+# MEDIA_ACCEL_REDIRECT_PREFIX to MEDIA_ROOT) or 'x-sendfile' (Apache, lighttpd).
+MEDIA_SENDFILE = None
+MEDIA_ACCEL_REDIRECT_PREFIX = '/protected-media/'
+
+# Resized JPEG/WebP copies of uploaded images, built off the request path by
+# api.images. Set 'ASYNC': False to build them inline after commit instead.
+IMAGE_DERIVATIVES = {
+    'WIDTHS': (160, 480, 960),
+    'QUALITY': 80,
+    'WORKERS': 2,
+    'ASYNC': True,
+}
+
 # SECURE_SSL_REDIRECT = True
 
 
 STATIC_ROOT = BASE_DIR / "staticfiles"
 
 STORAGES = {
-    # ...
+    # Uploads are named by their sha256, so duplicates are stored once and
+    # media URLs can be cached forever (see api.media).
+    "default": {
+        "BACKEND": "api.storage.ContentAddressedStorage",
+    },
     "staticfiles": {
         "BACKEND": "whitenoise.storage.CompressedManifestStaticFilesStorage",
     },